@@ -3,18 +3,51 @@
 
 # ===== ایمپورت‌ها =====
 import os
+import io
+import re
 import json
+import time
+import zlib
+import asyncio
+import queue
+import atexit
+import hashlib
 import logging
-from datetime import datetime
+import logging.handlers
+import ipaddress
+import ssl
+import heapq
+import bisect
+import random
+import sys
+import socket
+import struct
+import threading
+import tracemalloc
+import multiprocessing
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Optional, Tuple, Any
 import math
+import fnmatch
 
 # Telegram imports
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
+from telegram import (
+    Update,
+    ReplyKeyboardMarkup,
+    KeyboardButton,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InputTextMessageContent
+)
 from telegram.ext import (
     Application,
     CommandHandler,
     MessageHandler,
+    CallbackQueryHandler,
+    InlineQueryHandler,
     ContextTypes,
     filters,
     ConversationHandler
@@ -22,9 +55,22 @@ from telegram.ext import (
 
 # Cloudflare
 import CloudFlare
+import requests
+
+# اختیاری: فقط برای فایل‌های YAML همگام‌سازی
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# اختیاری: محدودیت حافظه process های کاری (فقط یونیکس)
+try:
+    import resource
+except ImportError:
+    resource = None
 
 # تنظیمات
-from config import BOT_TOKEN, CF_API_TOKEN, ADMIN_IDS, LOG_LEVEL
+from config import BOT_TOKEN, CF_API_TOKEN, ADMIN_IDS, LOG_LEVEL, CF_GRAPHQL_URL
 
 # بررسی تنظیمات
 if not BOT_TOKEN:
@@ -35,34 +81,181 @@ if not ADMIN_IDS:
     raise ValueError("لطفا ADMIN_IDS را در config.py تنظیم کنید")
 
 # ===== تنظیم لاگینگ =====
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=getattr(logging, LOG_LEVEL.upper(), logging.INFO),
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+LOG_FILE = 'bot.log'
+LOG_MAX_BYTES = 10 * 1024 * 1024  # حجم هر فایل لاگ قبل از چرخش
+LOG_BACKUP_COUNT = 5  # تعداد فایل‌های قدیمی نگه داشته شده
+LOG_JSON = False  # خروجی ساختاریافته JSON در فایل لاگ
+LOG_DEBUG_SAMPLE_EVERY = 10  # از پیام‌های DEBUG هر logger فقط یکی از هر N ثبت می‌شود
+
+class JsonFormatter(logging.Formatter):
+    """هر رکورد لاگ در یک خط JSON"""
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class DebugSamplingFilter(logging.Filter):
+    """نمونه‌برداری از پیام‌های پرتعداد DEBUG؛ سطوح بالاتر همیشه عبور می‌کنند"""
+    def __init__(self, every=LOG_DEBUG_SAMPLE_EVERY):
+        super().__init__()
+        self.every = max(1, every)
+        self.counters = {}
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        count = self.counters.get(record.name, 0)
+        self.counters[record.name] = count + 1
+        return count % self.every == 0
+
+def setup_logging():
+    """
+    لاگینگ غیرمسدودکننده: هندلرها فقط رکورد را در صف می‌گذارند و نوشتن
+    روی دیسک (با چرخش فایل) در thread جداگانه انجام می‌شود.
+    """
+    text_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
+    file_handler = logging.handlers.RotatingFileHandler(
+        LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+    )
+    file_handler.setFormatter(JsonFormatter() if LOG_JSON else text_formatter)
+    
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(text_formatter)
+    
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(DebugSamplingFilter())
+    
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
+    root.addHandler(queue_handler)
+    
+    listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+# process های کاری (spawn) این ماژول را دوباره import می‌کنند؛ فقط process اصلی فایل لاگ را می‌نویسد.
+# هنگام این import هنوز parent_process() تنظیم نشده، ولی نام process (worker-job-N) تنظیم شده است
+IS_MAIN_PROCESS = multiprocessing.current_process().name == 'MainProcess'
+log_listener = setup_logging() if IS_MAIN_PROCESS else None
 logger = logging.getLogger(__name__)
 
 # ===== متغیرهای سراسری =====
 user_data = {}
 RECORDS_PER_PAGE = 8  # تعداد رکورد در هر صفحه
+INLINE_KEYBOARDS = True  # ناوبری با کیبورد شیشه‌ای و ویرایش پیام به جای ارسال پیام جدید
+RECORD_INDEX_TTL = 300  # ثانیه؛ بعد از این مدت ایندکس رکوردها در پس‌زمینه به‌روز می‌شود
+SEARCH_CACHE_TTL = 30  # ثانیه؛ عمر نتایج کش شده هر عبارت جستجو
+INLINE_RESULTS_PER_PAGE = 20  # تعداد نتایج در هر صفحه از جستجوی inline
+SEARCH_RESULTS_PER_PAGE = 10  # تعداد نتایج در هر صفحه از جستجوی منو
+ZONE_STORE_TTL = 120  # ثانیه؛ عمر رکوردهای کش شده هر دامنه در مخزن مشترک
+ZONE_LIST_TTL = 300  # ثانیه؛ عمر لیست کش شده دامنه‌ها
+ZONE_STORE_STALE_TTL = 900  # ثانیه؛ تا این سن داده قدیمی فوراً نمایش و در پس‌زمینه به‌روز می‌شود
+PREFETCH_ENABLED = True  # دریافت پیش‌دستانه رکوردها و جزئیات قبل از انتخاب کاربر
+PREFETCH_MAX_CONCURRENT = 2  # حداکثر درخواست‌های هم‌زمان پیش‌دستانه
+PREFETCH_MAX_ZONES = 10  # حداکثر دامنه‌هایی که با هر نمایش لیست گرم می‌شوند
+SNAPSHOT_DIR = 'snapshots'  # پوشه تاریخچه رکوردها
+SNAPSHOT_INTERVAL = 6 * 3600  # ثانیه؛ فاصله snapshot های دوره‌ای
+SNAPSHOT_MAX_DELTA_CHAIN = 20  # حداکثر طول زنجیره delta قبل از ذخیره نسخه کامل
+SNAPSHOT_OBJECT_MAGIC = b'CFS1'  # ابتدای فایل هر وضعیت؛ بعد از آن ۳۲ بایت hash پایه (صفر برای نسخه کامل)
+SNAPSHOT_HEADER_SIZE = len(SNAPSHOT_OBJECT_MAGIC) + 32
+SNAPSHOT_PRE_CHANGE_MAX_AGE = 120  # ثانیه؛ snapshot قبل از تغییر از رکوردهای جوان‌تر از این در مخزن ساخته می‌شود
+SYNC_MAX_FILE_SIZE = 512 * 1024  # بایت؛ حداکثر حجم فایل وضعیت مطلوب
+SYNC_CONCURRENCY = 8  # حداکثر درخواست‌های هم‌زمان هنگام اعمال تغییرات
+SYNC_BATCH_SIZE = 20  # تعداد تغییرات هر دسته
+SYNC_BATCH_DELAY = 1  # ثانیه؛ مکث بین دسته‌ها برای ماندن در محدودیت نرخ API
+DNS_RECORDS_PAGE_SIZE = 100  # تعداد رکورد در هر صفحه از API
+SCHEDULED_JOBS_FILE = 'scheduled_jobs.json'  # فایل کارهای زمان‌بندی شده
+SCHEDULER_MAX_RETRIES = 3  # تعداد تلاش مجدد برای کار ناموفق
+SCHEDULER_RETRY_DELAY = 30  # ثانیه؛ تاخیر پایه تلاش مجدد (دو برابر در هر تلاش)
+SCHEDULER_COALESCE_WINDOW = 30  # ثانیه؛ کارهای یک رکورد با این فاصله زمانی در یک کار ادغام می‌شوند
+FAILOVER_FILE = 'failover.json'  # فایل رکوردهای دارای failover
+FAILOVER_INTERVAL = 30  # ثانیه؛ فاصله بررسی سلامت هر مقصد
+FAILOVER_JITTER = 0.2  # درصد تصادفی‌سازی فاصله بررسی‌ها
+FAILOVER_TIMEOUT = 5  # ثانیه؛ مهلت هر بررسی سلامت
+FAILOVER_CONCURRENCY = 50  # حداکثر بررسی هم‌زمان
+FAILOVER_FALL_THRESHOLD = 3  # تعداد خطای پیاپی برای رفتن به backup
+FAILOVER_RISE_THRESHOLD = 5  # تعداد موفقیت پیاپی primary برای بازگشت
+WATCHLIST_FILE = 'watchlist.json'  # فایل اشتراک‌های تغییر رکورد
+WATCH_POLL_INTERVAL = 120  # ثانیه؛ فاصله بررسی تغییرات خارج از ربات
+WATCH_DEBOUNCE = 15  # ثانیه؛ بعد از آخرین تغییر این مدت صبر و بعد خلاصه ارسال می‌شود
+WATCH_MAX_DELAY = 120  # ثانیه؛ حداکثر تاخیر ارسال خلاصه در تغییرات پشت سر هم
+WATCH_DIGEST_LIMIT = 30  # حداکثر تغییرات نمایش داده شده در هر خلاصه
+PURGE_BATCH_SIZE = 30  # حداکثر URL/پیشوند/tag/host در هر درخواست پاکسازی کش
+PURGE_COALESCE_WINDOW = 2  # ثانیه؛ درخواست‌های پاکسازی این بازه با هم ادغام می‌شوند
+PURGE_REQUESTS_PER_SECOND = 5  # محدودیت نرخ درخواست‌های پاکسازی به API
+IP_RULES_MAX_FILE_SIZE = 2 * 1024 * 1024  # بایت؛ حداکثر حجم فایل لیست IP
+IP_RULES_MAX_EXPAND = 256  # حداکثر قانون ساخته شده از یک CIDR با طول پیشوند پشتیبانی نشده
+IP_RULES_PAGE_SIZE = 500  # تعداد قانون در هر صفحه از API
+IP_RULES_CONCURRENCY = 4  # حداکثر درخواست‌های هم‌زمان هنگام اعمال قوانین
+IP_RULES_BATCH_SIZE = 20  # تعداد قوانین هر دسته
+IP_RULES_BATCH_DELAY = 5  # ثانیه؛ مکث بین دسته‌ها (حدود ۴ درخواست در ثانیه، محدودیت سراسری API)
+IP_RULES_WORKER_PARSE_SIZE = 256 * 1024  # بایت؛ لیست‌های بزرگ‌تر در process جدا پردازش می‌شوند
+AUDIT_EXAMPLES = 10  # تعداد نمونه‌های هر دسته در پیام گزارش سلامت (گزارش کامل به صورت فایل)
+ZONE_SETTINGS_TTL = 300  # ثانیه؛ عمر تنظیمات کش شده هر دامنه
+ZONE_SETTINGS_CONCURRENCY = 8  # حداکثر دریافت/اعمال هم‌زمان تنظیمات دامنه‌ها
+ZONE_SETTINGS_BATCH_SIZE = 10  # تعداد دامنه‌های هر دسته هنگام اعمال تنظیم
+ZONE_SETTINGS_BATCH_DELAY = 1  # ثانیه؛ مکث بین دسته‌ها برای ماندن در محدودیت نرخ API
+VERIFY_PROPAGATION = True  # بررسی انتشار تغییر روی resolver ها بعد از ویرایش/ایجاد رکورد
+PROPAGATION_RESOLVERS = [  # (نام، آدرس، پورت) - سرورهای authoritative هم قابل افزودن هستند
+    ('Cloudflare', '1.1.1.1', 53),
+    ('Google', '8.8.8.8', 53),
+    ('Quad9', '9.9.9.9', 53),
+    ('OpenDNS', '208.67.222.222', 53)
+]
+PROPAGATION_TIMEOUT = 120  # ثانیه؛ کل مهلت بررسی انتشار
+PROPAGATION_POLL_INTERVAL = 5  # ثانیه؛ فاصله پرس‌وجوی مجدد از هر resolver
+DNS_QUERY_TIMEOUT = 3  # ثانیه؛ مهلت هر پرس‌وجو
+PROFILE_SAMPLE_INTERVAL = 0.01  # ثانیه؛ فاصله نمونه‌برداری پروفایلر CPU
+PROFILE_DEFAULT_WINDOW = 60  # ثانیه؛ مدت پیش‌فرض پروفایل/ردیابی حافظه
+PROFILE_MAX_WINDOW = 900  # ثانیه؛ حداکثر مدت پروفایل/ردیابی حافظه
+PROFILE_TOP_N = 25  # تعداد سطرهای هر جدول گزارش
+TRACEMALLOC_FRAMES = 10  # عمق traceback ذخیره شده برای هر تخصیص حافظه
+ANALYTICS_WINDOW_HOURS = 24  # ساعت؛ بازه آمار ترافیک
+ANALYTICS_TTL = 300  # ثانیه؛ در این مدت آمار کش شده بدون درخواست جدید نمایش داده می‌شود
+ANALYTICS_DISPLAY_BUCKET_HOURS = 3  # ساعت؛ اندازه هر ستون نمودار (کاهش نمونه از سطل‌های ساعتی)
+ANALYTICS_TIMEOUT = 15  # ثانیه؛ مهلت هر درخواست GraphQL
+WORKER_PROCESSES = max(1, (os.cpu_count() or 2) - 1)  # حداکثر process های هم‌زمان کارهای سنگین
+WORKER_MEMORY_LIMIT = 1024 * 1024 * 1024  # بایت؛ سقف حافظه هر process کاری (0 = بدون محدودیت)
+WORKER_PROGRESS_INTERVAL = 2  # ثانیه؛ حداقل فاصله به‌روزرسانی پیام پیشرفت در تلگرام
+WORKER_JOB_HISTORY = 20  # تعداد کارهای تمام شده که در /tasks نمایش داده می‌شوند
+SYNC_WORKER_PARSE_SIZE = 64 * 1024  # بایت؛ فایل‌های بزرگ‌تر در process جدا پردازش می‌شوند
 
 # ===== State ها برای ConversationHandler =====
 (MAIN_MENU, SELECT_DOMAIN, SELECT_RECORD, RECORD_ACTIONS,
  EDIT_CONTENT, ADD_RECORD_DOMAIN, ADD_RECORD_TYPE, 
  ADD_RECORD_NAME, ADD_RECORD_CONTENT, CONFIRM_DELETE,
  SEARCH_QUERY, CHANGE_TYPE_SELECT, CHANGE_TYPE_CONTENT,
- NAVIGATE_RECORDS) = range(14)
+ NAVIGATE_RECORDS, SCHEDULE_CONTENT, SCHEDULE_TIME, IP_QUERY) = range(17)
+
+# نمونه محتوای هر نوع رکورد
+RECORD_EXAMPLES = {
+    'A': "192.168.1.1",
+    'AAAA': "2001:db8::1",
+    'CNAME': "target.example.com",
+    'MX': "10 mail.example.com",
+    'TXT': '"v=spf1 include:example.com ~all"',
+    'NS': "ns1.example.com",
+    'CAA': '0 issue "letsencrypt.org"',
+    'SRV': "10 60 5060 sipserver.example.com"
+}
 
 # ===== کیبوردها =====
 def get_main_keyboard():
     """کیبورد اصلی"""
     keyboard = [
         ["🌐 لیست دامنه‌ها", "➕ رکورد جدید"],
-        ["🔍 جستجو", "📊 گزارشات"],
-        ["📈 آمار", "❓ راهنما"]
+        ["🔍 جستجو", "🧭 جستجوی IP"],
+        ["📊 گزارشات", "📈 آمار"],
+        ["❓ راهنما"]
     ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
@@ -79,10 +272,8 @@ def get_domains_keyboard(domains):
     keyboard.append(["🔙 بازگشت به منو"])
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
 
-def get_records_keyboard_paginated(records, page=1, records_per_page=RECORDS_PER_PAGE):
-    """کیبورد رکوردها با صفحه‌بندی"""
-    keyboard = []
-    
+def paginate_records(records, page=1, records_per_page=RECORDS_PER_PAGE):
+    """رکوردهای صفحه جاری (گروه‌بندی شده بر اساس نوع) و تعداد صفحات"""
     # محاسبه تعداد صفحات
     total_pages = math.ceil(len(records) / records_per_page)
     
@@ -113,6 +304,13 @@ def get_records_keyboard_paginated(records, page=1, records_per_page=RECORDS_PER
         if displayed >= end_idx:
             break
     
+    return current_records, total_pages
+
+def get_records_keyboard_paginated(records, page=1, records_per_page=RECORDS_PER_PAGE):
+    """کیبورد رکوردها با صفحه‌بندی"""
+    keyboard = []
+    current_records, total_pages = paginate_records(records, page, records_per_page)
+    
     # ایجاد کیبورد
     current_type = None
     for record_type, record in current_records:
@@ -145,19 +343,26 @@ def get_records_keyboard_paginated(records, page=1, records_per_page=RECORDS_PER
     
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
 
-def get_record_actions_keyboard(record_type):
-    """کیبورد عملیات روی رکورد"""
+def get_record_actions_rows(record_type):
+    """ردیف‌های دکمه‌های عملیات روی رکورد"""
     keyboard = [
         ["✏️ ویرایش محتوا"],
+        ["⏰ زمان‌بندی تغییر"],
         ["🔄 تغییر نوع رکورد"],
         ["🗑️ حذف رکورد"]
     ]
     
     if record_type in ['A', 'AAAA', 'CNAME']:
         keyboard.insert(1, ["🔄 تغییر وضعیت Proxy"])
+        keyboard.insert(2, ["🧹 پاکسازی کش"])
     
     keyboard.append(["🔙 بازگشت به رکوردها"])
     
+    return keyboard
+
+def get_record_actions_keyboard(record_type):
+    """کیبورد عملیات روی رکورد"""
+    keyboard = get_record_actions_rows(record_type)
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
 
 def get_record_types_keyboard():
@@ -177,7 +382,303 @@ def get_yes_no_keyboard():
     ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
 
+# ===== کیبوردهای شیشه‌ای =====
+# callback_data فشرده است (حداکثر ۶۴ بایت):
+#   z:<zone_id>   انتخاب دامنه          zl   بازگشت به دامنه‌ها
+#   p:<page>      تغییر صفحه            r:<record_id>   انتخاب رکورد
+#   a:<code>      عملیات روی رکورد      n    دکمه بدون عملیات
+#   qp:<page>     صفحه نتایج جستجو      q:<index>   انتخاب نتیجه جستجو
+#   a:c           پاکسازی کش رکورد (پس از ویرایش رکورد proxied هم نمایش داده می‌شود)
+RECORD_ACTION_CODES = {
+    "✏️ ویرایش محتوا": 'e',
+    "⏰ زمان‌بندی تغییر": 's',
+    "🔄 تغییر وضعیت Proxy": 'x',
+    "🔄 تغییر نوع رکورد": 't',
+    "🗑️ حذف رکورد": 'd',
+    "🧹 پاکسازی کش": 'c',
+    "🔙 بازگشت به رکوردها": 'b'
+}
+
+def get_domains_inline_keyboard(domains):
+    """کیبورد شیشه‌ای دامنه‌ها"""
+    keyboard = [
+        [InlineKeyboardButton(f"🌐 {name}", callback_data=f"z:{zone_id}")]
+        for name, zone_id in domains
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+def get_records_inline_keyboard(records, page=1, records_per_page=RECORDS_PER_PAGE):
+    """کیبورد شیشه‌ای رکوردها با صفحه‌بندی"""
+    keyboard = []
+    current_records, total_pages = paginate_records(records, page, records_per_page)
+
+    current_type = None
+    for record_type, record in current_records:
+        if record_type != current_type:
+            keyboard.append([InlineKeyboardButton(f"━━━ {record_type} Records ━━━", callback_data="n")])
+            current_type = record_type
+
+        proxied = "🟠" if record.get('proxied') else "⚪"
+        keyboard.append([
+            InlineKeyboardButton(f"{proxied} {record['name']}", callback_data=f"r:{record['id']}")
+        ])
+
+    # دکمه‌های ناوبری
+    nav_buttons = []
+    if page > 1:
+        nav_buttons.append(InlineKeyboardButton("⬅️", callback_data=f"p:{page - 1}"))
+
+    nav_buttons.append(InlineKeyboardButton(f"📄 {page}/{total_pages}", callback_data="n"))
+
+    if page < total_pages:
+        nav_buttons.append(InlineKeyboardButton("➡️", callback_data=f"p:{page + 1}"))
+
+    keyboard.append(nav_buttons)
+    keyboard.append([InlineKeyboardButton("🔙 بازگشت به دامنه‌ها", callback_data="zl")])
+
+    return InlineKeyboardMarkup(keyboard)
+
+def get_search_results_inline_keyboard(matches, page=1, per_page=SEARCH_RESULTS_PER_PAGE):
+    """کیبورد شیشه‌ای نتایج جستجو؛ هر دکمه شماره نتیجه در cursor جستجو را دارد"""
+    total_pages = max(1, math.ceil(len(matches) / per_page))
+    start = (page - 1) * per_page
+    
+    keyboard = [
+        [InlineKeyboardButton(
+            f"{index + 1}. {'🟠' if entry.proxied else '⚪'} {entry.name} ({entry.type})",
+            callback_data=f"q:{index}"
+        )]
+        for index, entry in enumerate(matches[start:start + per_page], start)
+    ]
+    
+    nav_buttons = []
+    if page > 1:
+        nav_buttons.append(InlineKeyboardButton("⬅️", callback_data=f"qp:{page - 1}"))
+    nav_buttons.append(InlineKeyboardButton(f"📄 {page}/{total_pages}", callback_data="n"))
+    if page < total_pages:
+        nav_buttons.append(InlineKeyboardButton("➡️", callback_data=f"qp:{page + 1}"))
+    keyboard.append(nav_buttons)
+    
+    return InlineKeyboardMarkup(keyboard)
+
+def get_record_actions_inline_keyboard(record_type):
+    """کیبورد شیشه‌ای عملیات روی رکورد"""
+    keyboard = [
+        [InlineKeyboardButton(label, callback_data=f"a:{RECORD_ACTION_CODES[label]}") for label in row]
+        for row in get_record_actions_rows(record_type)
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+# ===== اعتبارسنجی محتوای رکورد =====
+HOSTNAME_RE = re.compile(
+    r'^(?=.{1,253}$)(?:(?!-)[a-z0-9_-]{1,63}(?<!-)\.)*(?!-)[a-z0-9_-]{1,63}(?<!-)$',
+    re.IGNORECASE
+)
+MX_RE = re.compile(r'^(\d{1,5})\s+(\S+)$')
+SRV_RE = re.compile(r'^(\d{1,5})\s+(\d{1,5})\s+(\d{1,5})\s+(\S+)$')
+CAA_RE = re.compile(r'^(\d{1,3})\s+([a-z0-9]+)\s+"?([^"]*)"?$', re.IGNORECASE)
+CAA_TAGS = ('issue', 'issuewild', 'iodef')
+
+def _normalize_hostname(value, label):
+    """نرمال‌سازی نام میزبان (حروف کوچک، بدون نقطه انتهایی)"""
+    hostname = value.strip().rstrip('.').lower()
+    if not HOSTNAME_RE.match(hostname):
+        raise ValueError(f"{label} نامعتبر است: {value}")
+    return hostname
+
+def _parse_uint(value, label, maximum):
+    number = int(value)
+    if number > maximum:
+        raise ValueError(f"{label} باید بین 0 و {maximum} باشد: {value}")
+    return number
+
+def _validate_a(text):
+    try:
+        return {'content': str(ipaddress.IPv4Address(text))}
+    except ipaddress.AddressValueError:
+        raise ValueError(f"آدرس IPv4 نامعتبر است: {text}")
+
+def _validate_aaaa(text):
+    try:
+        return {'content': ipaddress.IPv6Address(text).compressed}
+    except ipaddress.AddressValueError:
+        raise ValueError(f"آدرس IPv6 نامعتبر است: {text}")
+
+def _validate_cname(text):
+    return {'content': _normalize_hostname(text, "نام مقصد")}
+
+def _validate_ns(text):
+    return {'content': _normalize_hostname(text, "نام سرور")}
+
+def _validate_mx(text):
+    match = MX_RE.match(text)
+    if not match:
+        raise ValueError("قالب MX باید «اولویت سرور» باشد، مثال: 10 mail.example.com")
+    
+    priority = _parse_uint(match.group(1), "اولویت MX", 65535)
+    if match.group(2) == '.':
+        # null MX (RFC 7505): دامنه ایمیل دریافت نمی‌کند
+        if priority != 0:
+            raise ValueError("MX خالی (.) طبق RFC 7505 باید اولویت 0 داشته باشد: 0 .")
+        return {'content': '.', 'priority': 0}
+    hostname = _normalize_hostname(match.group(2), "سرور ایمیل")
+    return {'content': hostname, 'priority': priority}
+
+def _validate_txt(text):
+    if len(text) > 2048:
+        raise ValueError(f"طول محتوای TXT حداکثر 2048 کاراکتر است (فعلی: {len(text)})")
+    # \" داخل رشته جزو محتواست و جفت شمرده نمی‌شود
+    if re.sub(r'\\.', '', text).count('"') % 2:
+        raise ValueError("علامت‌های \" در محتوای TXT جفت نیستند")
+    return {'content': text}
+
+def _validate_caa(text):
+    match = CAA_RE.match(text)
+    if not match:
+        raise ValueError("قالب CAA باید «flags tag \"value\"» باشد، مثال: 0 issue \"letsencrypt.org\"")
+    
+    flags = _parse_uint(match.group(1), "flags در CAA", 255)
+    tag = match.group(2).lower()
+    value = match.group(3).strip()
+    
+    if tag not in CAA_TAGS:
+        raise ValueError(f"tag در CAA باید یکی از {', '.join(CAA_TAGS)} باشد: {match.group(2)}")
+    if tag == 'iodef' and not value.startswith(('mailto:', 'http://', 'https://')):
+        raise ValueError("مقدار iodef باید با mailto: یا http(s):// شروع شود")
+    if tag != 'iodef' and value and value != ';':
+        _normalize_hostname(value.split(';')[0], "صادرکننده CAA")
+    
+    return {
+        'content': f'{flags} {tag} "{value}"',
+        'data': {'flags': flags, 'tag': tag, 'value': value}
+    }
+
+def _validate_srv(text):
+    match = SRV_RE.match(text)
+    if not match:
+        raise ValueError("قالب SRV باید «priority weight port target» باشد، مثال: 10 60 5060 sip.example.com")
+    
+    priority = _parse_uint(match.group(1), "priority در SRV", 65535)
+    weight = _parse_uint(match.group(2), "weight در SRV", 65535)
+    port = _parse_uint(match.group(3), "port در SRV", 65535)
+    target = '.' if match.group(4) == '.' else _normalize_hostname(match.group(4), "target در SRV")
+    
+    return {
+        'content': f"{priority} {weight} {port} {target}",
+        'data': {'priority': priority, 'weight': weight, 'port': port, 'target': target}
+    }
+
+def record_content_text(fields):
+    """نمایش محتوای نرمال‌شده (برای MX همراه با اولویت)"""
+    if 'priority' in fields:
+        return f"{fields['priority']} {fields['content']}"
+    return fields['content']
+
+RECORD_VALIDATORS = {
+    'A': _validate_a,
+    'AAAA': _validate_aaaa,
+    'CNAME': _validate_cname,
+    'MX': _validate_mx,
+    'TXT': _validate_txt,
+    'NS': _validate_ns,
+    'CAA': _validate_caa,
+    'SRV': _validate_srv
+}
+
+def validate_record_content(record_type, text):
+    """
+    اعتبارسنجی و نرمال‌سازی محتوای وارد شده قبل از هر درخواست به API.
+    خروجی: (True, فیلدهای API) یا (False, پیام خطا)
+    """
+    validator = RECORD_VALIDATORS.get(record_type)
+    if not validator:
+        return False, f"نوع رکورد پشتیبانی نمی‌شود: {record_type}"
+    
+    text = text.strip()
+    if not text:
+        return False, "محتوا نمی‌تواند خالی باشد"
+    
+    try:
+        return True, validator(text)
+    except ValueError as e:
+        return False, str(e)
+
 # ===== کلاس‌ها =====
+class DNSRecord:
+    """
+    نمایش فشرده رکورد DNS: فقط فیلدهایی که هندلرها استفاده می‌کنند.
+    برای سازگاری با کد موجود مانند dict قابل دسترسی است (record['name']).
+    """
+    __slots__ = ('id', 'zone_id', 'name', 'type', 'content', 'ttl', 'proxied', 'priority', 'data', '_details')
+
+    def __init__(self, id, zone_id, name, type, content, ttl=1, proxied=False, priority=None, data=None):
+        self.id = id
+        self.zone_id = zone_id
+        self.name = name
+        self.type = type
+        self.content = content
+        self.ttl = ttl
+        self.proxied = proxied
+        self.priority = priority
+        self.data = data
+        self._details = None
+
+    @classmethod
+    def from_api(cls, payload, zone_id=None):
+        """تبدیل پاسخ API؛ رشته‌های تکراری (شناسه دامنه و نوع) به اشتراک گذاشته می‌شوند"""
+        zone_id = zone_id or payload.get('zone_id')
+        return cls(
+            payload['id'],
+            sys.intern(zone_id) if zone_id else None,
+            payload['name'],
+            sys.intern(payload['type']),
+            payload['content'],
+            payload.get('ttl', 1),
+            payload.get('proxied', False),
+            payload.get('priority'),
+            payload.get('data')
+        )
+
+    def details(self, manager):
+        """جزئیات کامل رکورد از API (فقط در صورت نیاز و یک بار)"""
+        if self._details is None:
+            self._details = manager.get_record_details(self.zone_id, self.id)
+        return self._details
+
+    def cached_details(self):
+        """جزئیات دریافت شده قبلی یا None (بدون درخواست API)"""
+        return self._details
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__[:-1]}
+
+    def copy(self, **changes):
+        """نسخه مستقل با تغییرات داده شده (رکوردهای ZoneStore مشترک هستند و نباید تغییر کنند)"""
+        fields = self.to_dict()
+        fields.update(changes)
+        return DNSRecord(**fields)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+        # جزئیات کش شده دیگر با رکورد هم‌خوان نیست
+        self._details = None
+
+    def __contains__(self, key):
+        return key in self.__slots__[:-1] and getattr(self, key) is not None
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in self.__slots__[:-1] else None
+        return default if value is None else value
+
+    def __repr__(self):
+        return f"DNSRecord({self.type} {self.name} -> {self.content})"
+
 class ChangeLogger:
     """لاگ تغییرات"""
     def __init__(self, filename='changes.log'):
@@ -226,20 +727,28 @@ class CloudflareManager:
             logger.error(f"Error getting zones: {e}")
             return []
 
+    def fetch_dns_records(self, zone_id, record_type=None):
+        """دریافت همه صفحه‌های رکوردهای DNS (خطا به فراخواننده می‌رسد)"""
+        params = {'per_page': DNS_RECORDS_PAGE_SIZE, 'page': 1}
+        if record_type:
+            params['type'] = record_type
+        
+        records = []
+        while True:
+            page = self.cf.zones.dns_records.get(zone_id, params=params)
+            records.extend(page)
+            if len(page) < DNS_RECORDS_PAGE_SIZE:
+                break
+            params['page'] += 1
+        
+        # فیلتر رکوردهای مهم
+        important_types = ['A', 'AAAA', 'CNAME', 'MX', 'TXT', 'NS', 'CAA', 'SRV']
+        return [DNSRecord.from_api(r, zone_id) for r in records if r['type'] in important_types]
+
     def get_dns_records(self, zone_id, record_type=None):
         """دریافت رکوردهای DNS"""
         try:
-            params = {}
-            if record_type:
-                params['type'] = record_type
-            
-            records = self.cf.zones.dns_records.get(zone_id, params=params)
-            
-            # فیلتر رکوردهای مهم
-            important_types = ['A', 'AAAA', 'CNAME', 'MX', 'TXT', 'NS', 'CAA', 'SRV']
-            filtered_records = [r for r in records if r['type'] in important_types]
-            
-            return filtered_records
+            return self.fetch_dns_records(zone_id, record_type)
         except Exception as e:
             logger.error(f"Error getting DNS records: {e}")
             return []
@@ -252,10 +761,11 @@ class CloudflareManager:
             logger.error(f"Error getting record details: {e}")
             return None
 
-    def update_dns_record(self, zone_id, record_id, data):
-        """به‌روزرسانی رکورد"""
+    def update_dns_record(self, zone_id, record_id, data, current=None):
+        """به‌روزرسانی رکورد (current: جزئیات از پیش دریافت شده، در صورت وجود)"""
         try:
-            current = self.get_record_details(zone_id, record_id)
+            if current is None:
+                current = self.get_record_details(zone_id, record_id)
             if not current:
                 return False, "رکورد یافت نشد"
             
@@ -267,6 +777,16 @@ class CloudflareManager:
                 'proxied': data.get('proxied', current.get('proxied', False))
             }
             
+            # فیلدهای ساختاریافته MX/SRV/CAA
+            for field in ('priority', 'data'):
+                value = data.get(field, current.get(field))
+                if value is not None:
+                    update_data[field] = value
+            
+            # برای SRV/CAA محتوا از روی data ساخته می‌شود
+            if 'data' in update_data:
+                update_data.pop('content')
+            
             self.cf.zones.dns_records.put(zone_id, record_id, data=update_data)
             return True, "رکورد با موفقیت به‌روزرسانی شد!"
         except Exception as e:
@@ -276,6 +796,10 @@ class CloudflareManager:
     def create_dns_record(self, zone_id, data):
         """ایجاد رکورد جدید"""
         try:
+            # برای SRV/CAA محتوا از روی data ساخته می‌شود
+            if 'data' in data:
+                data = {key: value for key, value in data.items() if key != 'content'}
+            
             self.cf.zones.dns_records.post(zone_id, data=data)
             return True, "رکورد با موفقیت ایجاد شد!"
         except Exception as e:
@@ -291,843 +815,5376 @@ class CloudflareManager:
             logger.error(f"Error deleting DNS record: {e}")
             return False, f"خطا: {str(e)}"
 
-    def search_records(self, search_term):
-        """جستجو در تمام رکوردها"""
-        results = []
-        zones = self.get_zones()
+    def fetch_access_rules(self, zone_id):
+        """دریافت همه صفحه‌های قوانین دسترسی IP دامنه (خطا به فراخواننده می‌رسد)"""
+        params = {'per_page': IP_RULES_PAGE_SIZE, 'page': 1}
+        rules = []
+        while True:
+            page = self.cf.zones.firewall.access_rules.rules.get(zone_id, params=params)
+            rules.extend(page)
+            if len(page) < IP_RULES_PAGE_SIZE:
+                break
+            params['page'] += 1
+        return rules
+
+    def create_access_rule(self, zone_id, mode, target, value, notes=''):
+        """ایجاد قانون دسترسی IP"""
+        try:
+            self.cf.zones.firewall.access_rules.rules.post(zone_id, data={
+                'mode': mode,
+                'configuration': {'target': target, 'value': value},
+                'notes': notes
+            })
+            return True, "قانون ایجاد شد!"
+        except Exception as e:
+            logger.error(f"Error creating access rule: {e}")
+            return False, f"خطا: {str(e)}"
+
+    def update_access_rule_mode(self, zone_id, rule_id, mode):
+        """تغییر نوع (mode) قانون دسترسی IP"""
+        try:
+            self.cf.zones.firewall.access_rules.rules.patch(zone_id, rule_id, data={'mode': mode})
+            return True, "قانون به‌روزرسانی شد!"
+        except Exception as e:
+            logger.error(f"Error updating access rule: {e}")
+            return False, f"خطا: {str(e)}"
+
+    def delete_access_rule(self, zone_id, rule_id):
+        """حذف قانون دسترسی IP"""
+        try:
+            self.cf.zones.firewall.access_rules.rules.delete(zone_id, rule_id)
+            return True, "قانون حذف شد!"
+        except Exception as e:
+            logger.error(f"Error deleting access rule: {e}")
+            return False, f"خطا: {str(e)}"
+
+    def fetch_zone_settings(self, zone_id):
+        """همه تنظیمات دامنه با یک درخواست bulk (خطا به فراخواننده می‌رسد)"""
+        return {item['id']: item.get('value') for item in self.cf.zones.settings.get(zone_id)}
+
+    def update_zone_settings(self, zone_id, values):
+        """ویرایش چند تنظیم دامنه با یک درخواست bulk"""
+        try:
+            self.cf.zones.settings.patch(zone_id, data={
+                'items': [{'id': setting, 'value': value} for setting, value in values.items()]
+            })
+            return True, "تنظیمات به‌روزرسانی شد!"
+        except Exception as e:
+            logger.error(f"Error updating zone settings: {e}")
+            return False, f"خطا: {str(e)}"
+
+    def purge_cache(self, zone_id, data):
+        """پاکسازی کش (files، prefixes، tags، hosts یا purge_everything)"""
+        try:
+            self.cf.zones.purge_cache.post(zone_id, data=data)
+            return True, "کش پاکسازی شد!"
+        except Exception as e:
+            logger.error(f"Error purging cache: {e}")
+            return False, f"خطا: {str(e)}"
+
+class ZoneStore:
+    """
+    مخزن مشترک دامنه‌ها و رکوردها برای همه ادمین‌ها.
+    درخواست‌های هم‌زمان برای یک دامنه فقط یک درخواست API می‌سازند (single-flight)
+    و همه از یک نسخه درون حافظه استفاده می‌کنند؛ session هر ادمین فقط شناسه
+    دامنه و شماره صفحه را نگه می‌دارد.
+    """
+    def __init__(self, manager, ttl=ZONE_STORE_TTL, zones_ttl=ZONE_LIST_TTL,
+                 stale_ttl=ZONE_STORE_STALE_TTL, prefetch_concurrency=PREFETCH_MAX_CONCURRENT):
+        self.manager = manager
+        self.ttl = ttl
+        self.zones_ttl = zones_ttl
+        self.stale_ttl = stale_ttl
+        self.prefetch_concurrency = prefetch_concurrency
+        self._zones = (0, [])
+        self._entries = {}
+        self._inflight = {}
+        self._generations = {}
+        self._foreground = 0
+        self._idle = None
+        self._prefetch_slots = None
+        self._prefetching = set()
+
+    def _single_flight(self, key, func, *args):
+        """یک درخواست مشترک برای هر کلید؛ فراخوانی‌های هم‌زمان منتظر همان می‌مانند"""
+        future = self._inflight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            generation = self._generations.get(key, 0)
+            future = asyncio.ensure_future(loop.run_in_executor(None, func, *args))
+            future.add_done_callback(lambda f: self._fetched(key, generation, f))
+            self._inflight[key] = future
+        return asyncio.shield(future)
+
+    def _fetched(self, key, generation, future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
         
-        for zone_name, zone_id in zones:
-            records = self.get_dns_records(zone_id)
-            for record in records:
-                if (search_term.lower() in record['name'].lower() or 
-                    search_term.lower() in record['content'].lower()):
-                    results.append({
-                        'zone_name': zone_name,
-                        'zone_id': zone_id,
-                        'record': record
-                    })
+        # نتیجه درخواستی که قبل از تغییر شروع شده کش نمی‌شود
+        if future.cancelled() or future.exception() or generation != self._generations.get(key, 0):
+            return
         
-        return results
+        result = future.result()
+        if key is None:
+            # get_zones خطا را به لیست خالی تبدیل می‌کند
+            if result:
+                self._zones = (time.monotonic(), result)
+        else:
+            # خطای رکوردها استثنا است (بالا)؛ لیست خالی یعنی دامنه واقعاً رکوردی ندارد
+            self._entries[key] = (time.monotonic(), result, {record['id']: record for record in result})
 
-# ===== ایجاد instance ها =====
-cf_manager = CloudflareManager(CF_API_TOKEN)
-change_logger = ChangeLogger()
+    async def get_zones(self, max_age=None):
+        """لیست (نام، شناسه) دامنه‌ها"""
+        fetched_at, zones = self._zones
+        if zones and time.monotonic() - fetched_at < (self.zones_ttl if max_age is None else max_age):
+            return zones
+        return await self._single_flight(None, self.manager.get_zones)
 
-# ===== دکوریتور چک ادمین =====
-def admin_only(func):
-    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        user_id = update.effective_user.id
-        if user_id not in ADMIN_IDS:
-            await update.message.reply_text("⛔ شما اجازه استفاده از این ربات را ندارید.")
-            return ConversationHandler.END
-        return await func(update, context)
-    return wrapper
+    async def get_zone_name(self, zone_id):
+        return next((name for name, id in await self.get_zones() if id == zone_id), None)
 
-# ===== هندلرهای اصلی =====
-@admin_only
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """شروع ربات"""
-    user = update.effective_user
-    
-    # پاک کردن داده‌های قبلی
-    context.user_data.clear()
-    
-    await update.message.reply_text(
-        f"🌐 **ربات مدیریت Cloudflare**\n\n"
-        f"سلام {user.first_name} عزیز! 👋\n\n"
-        "از منوی زیر گزینه مورد نظر را انتخاب کنید:",
-        reply_markup=get_main_keyboard(),
-        parse_mode='Markdown'
-    )
-    
-    return MAIN_MENU
+    async def get_zone_id(self, zone_name):
+        return next((id for name, id in await self.get_zones() if name == zone_name), None)
 
-async def main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """پردازش منوی اصلی"""
-    text = update.message.text
-    user_id = update.effective_user.id
-    
-    if text == "🌐 لیست دامنه‌ها":
-        zones = cf_manager.get_zones()
-        if not zones:
-            await update.message.reply_text("❌ هیچ دامنه‌ای یافت نشد!")
-            return MAIN_MENU
+    async def fetch_records(self, zone_id, max_age=None):
+        """
+        رکوردهای دامنه (مشترک بین همه session ها؛ نباید تغییر داده شود).
+        بدون max_age، داده منقضی ولی جوان‌تر از stale_ttl فوراً برگردانده و
+        در پس‌زمینه به‌روز می‌شود. خطای API به فراخواننده می‌رسد.
+        """
+        if not zone_id:
+            return []
         
-        context.user_data['zones'] = zones
-        await update.message.reply_text(
-            "🔍 دامنه مورد نظر را انتخاب کنید:",
-            reply_markup=get_domains_keyboard(zones)
-        )
-        return SELECT_DOMAIN
-    
-    elif text == "➕ رکورد جدید":
-        zones = cf_manager.get_zones()
-        if not zones:
-            await update.message.reply_text("❌ هیچ دامنه‌ای یافت نشد!")
-            return MAIN_MENU
+        entry = self._entries.get(zone_id)
+        if entry:
+            age = time.monotonic() - entry[0]
+            if age < (self.ttl if max_age is None else max_age):
+                return entry[1]
+            if max_age is None and age < self.stale_ttl:
+                self.prefetch([zone_id])
+                return entry[1]
         
-        context.user_data['zones'] = zones
-        context.user_data['action'] = 'add_record'
-        await update.message.reply_text(
-            "دامنه‌ای که می‌خواهید رکورد جدید به آن اضافه کنید را انتخاب کنید:",
-            reply_markup=get_domains_keyboard(zones)
+        # درخواست کاربر؛ پیش‌دستانه‌ها تا پایان آن صبر می‌کنند
+        self._init_budget()
+        self._foreground += 1
+        self._idle.clear()
+        try:
+            return await self._single_flight(zone_id, self.manager.fetch_dns_records, zone_id)
+        finally:
+            self._foreground -= 1
+            if not self._foreground:
+                self._idle.set()
+
+    async def get_records(self, zone_id, max_age=None):
+        """مثل fetch_records برای نمایش؛ در صورت خطا آخرین نسخه موجود یا لیست خالی"""
+        try:
+            return await self.fetch_records(zone_id, max_age)
+        except Exception as e:
+            logger.error(f"Error getting DNS records of {zone_id}: {e}")
+            entry = self._entries.get(zone_id)
+            return entry[1] if entry else []
+
+    async def get_record(self, zone_id, record_id):
+        """رکورد با شناسه (جستجوی مستقیم در دیکشنری)"""
+        await self.get_records(zone_id)
+        entry = self._entries.get(zone_id)
+        return entry[2].get(record_id) if entry else None
+
+    def _init_budget(self):
+        if self._idle is None:
+            self._idle = asyncio.Event()
+            self._idle.set()
+            self._prefetch_slots = asyncio.Semaphore(self.prefetch_concurrency)
+
+    def _is_fresh(self, zone_id):
+        entry = self._entries.get(zone_id)
+        return bool(entry) and time.monotonic() - entry[0] < self.ttl
+
+    async def _run_prefetch(self, key, func, *args):
+        """اجرای یک کار پیش‌دستانه در سهمیه؛ هیچ‌وقت با درخواست کاربر رقابت نمی‌کند"""
+        try:
+            async with self._prefetch_slots:
+                await self._idle.wait()
+                if isinstance(key, str) and (self._is_fresh(key) or key in self._inflight):
+                    return
+                await func(*args)
+        except Exception as e:
+            logger.debug(f"Prefetch failed for {key}: {e}")
+        finally:
+            self._prefetching.discard(key)
+
+    def _schedule_prefetch(self, key, func, *args):
+        if not PREFETCH_ENABLED or key in self._prefetching:
+            return
+        self._init_budget()
+        self._prefetching.add(key)
+        asyncio.ensure_future(self._run_prefetch(key, func, *args))
+
+    def prefetch(self, zone_ids):
+        """گرم کردن رکوردهای دامنه‌ها در پس‌زمینه (حداکثر PREFETCH_MAX_ZONES دامنه)"""
+        scheduled = 0
+        for zone_id in zone_ids:
+            if scheduled >= PREFETCH_MAX_ZONES:
+                break
+            if self._is_fresh(zone_id) or zone_id in self._inflight:
+                continue
+            self._schedule_prefetch(
+                zone_id, self._single_flight, zone_id, self.manager.fetch_dns_records, zone_id
+            )
+            scheduled += 1
+
+    def prefetch_details(self, record):
+        """گرم کردن جزئیات کامل رکورد قبل از انتخاب عملیات"""
+        if record.cached_details() is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._schedule_prefetch(
+            ('details', record.id), loop.run_in_executor, None, record.details, self.manager
         )
-        return ADD_RECORD_DOMAIN
+
+    def cached_details(self, zone_id, record):
+        """
+        جزئیات پیش‌دریافت شده رکورد، فقط اگر دامنه از آن زمان تغییر نکرده باشد
+        (بعد از هر تغییر، رکوردهای دامنه اشیای جدید هستند).
+        """
+        entry = self._entries.get(zone_id)
+        if entry and entry[2].get(record.id) is record:
+            return record.cached_details()
+        return None
+
+    def cached_records(self):
+        """همه رکوردهای موجود در حافظه: zone_id -> رکوردها"""
+        return {zone_id: entry[1] for zone_id, entry in self._entries.items()}
+
+    def invalidate(self, zone_id):
+        """بعد از تغییر، درخواست بعدی رکوردها را دوباره دریافت می‌کند"""
+        self._generations[zone_id] = self._generations.get(zone_id, 0) + 1
+        self._entries.pop(zone_id, None)
+        self._inflight.pop(zone_id, None)
+
+class TTLCache:
+    """
+    کش کلید به مقدار با عمر ttl برای داده‌های async.
+    درخواست‌های هم‌زمان یک کلید منتظر یک task مشترک می‌مانند (single-flight).
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._values = {}
+        self._fetched_at = {}
+        self._inflight = {}
+
+    def peek(self, key):
+        """مقدار فعلی کش (حتی منقضی) بدون دریافت دوباره"""
+        return self._values.get(key)
+
+    def fetched_at(self, key):
+        return self._fetched_at.get(key)
+
+    async def _load(self, key, refresh):
+        value = await refresh(key)
+        self._values[key] = value
+        self._fetched_at[key] = time.monotonic()
+        return value
+
+    async def get(self, key, refresh, max_age=None):
+        """مقدار کش یا نتیجه await refresh(key) (max_age=0 یعنی حتما دریافت دوباره)"""
+        max_age = self.ttl if max_age is None else max_age
+        if key in self._values and time.monotonic() - self._fetched_at[key] < max_age:
+            return self._values[key]
+        
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, refresh))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+IndexEntry = namedtuple(
+    'IndexEntry',
+    ['zone_name', 'zone_id', 'record_id', 'name', 'type', 'content', 'proxied', 'haystack']
+)
+
+def parse_ip_query(text):
+    """
+    تبدیل IP، CIDR یا بازه (a-b) به (نسخه، شروع، پایان) به صورت عدد صحیح.
+    برای ورودی نامعتبر ValueError
+    """
+    text = text.strip()
+    if '-' in text:
+        first, last = (ipaddress.ip_address(part.strip()) for part in text.split('-', 1))
+        if first.version != last.version:
+            raise ValueError("دو سر بازه باید از یک نسخه IP باشند")
+        if int(first) > int(last):
+            first, last = last, first
+        return first.version, int(first), int(last)
     
-    elif text == "🔍 جستجو":
-        await update.message.reply_text(
-            "🔍 عبارت مورد نظر برای جستجو را وارد کنید:\n\n"
-            "می‌توانید نام رکورد یا محتوای آن را جستجو کنید.",
-            reply_markup=get_cancel_keyboard()
+    network = ipaddress.ip_network(text, strict=False)
+    return network.version, int(network.network_address), int(network.broadcast_address)
+
+class RecordIndex:
+    """ایندکس درون‌حافظه‌ای رکوردهای همه دامنه‌ها برای جستجوی سریع"""
+    def __init__(self, store, ttl=RECORD_INDEX_TTL, cache_ttl=SEARCH_CACHE_TTL):
+        self.store = store
+        self.ttl = ttl
+        self.cache_ttl = cache_ttl
+        self.entries = []
+        self.built_at = 0
+        self._cache = {}
+        self._refresh_task = None
+        # ایندکس بازه‌ای A/AAAA: نسخه -> (آدرس‌های مرتب به صورت عدد، رکوردها به همان ترتیب)
+        self._ip_keys = {4: [], 6: []}
+        self._ip_entries = {4: [], 6: []}
+
+    def build(self, zone_records):
+        """ساخت ایندکس از لیست ((نام دامنه، شناسه دامنه)، رکوردها)"""
+        entries = []
+        for (zone_name, zone_id), records in zone_records:
+            for record in records:
+                entries.append(IndexEntry(
+                    zone_name,
+                    zone_id,
+                    record['id'],
+                    record['name'],
+                    record['type'],
+                    record['content'],
+                    record.get('proxied', False),
+                    f"{record['name']}\n{record['content']}".lower()
+                ))
+        
+        addresses = {4: [], 6: []}
+        for entry in entries:
+            if entry.type not in ('A', 'AAAA'):
+                continue
+            try:
+                address = ipaddress.ip_address(entry.content)
+            except ValueError:
+                continue
+            addresses[address.version].append((int(address), entry))
+        
+        for version, pairs in addresses.items():
+            pairs.sort(key=lambda pair: pair[0])
+            self._ip_keys[version] = [key for key, _ in pairs]
+            self._ip_entries[version] = [entry for _, entry in pairs]
+        
+        self.entries = entries
+        self.built_at = time.monotonic()
+        self._cache = {}
+        logger.info(f"Record index built: {len(entries)} records")
+
+    async def _rebuild(self):
+        zones = await self.store.get_zones()
+        all_records = await asyncio.gather(
+            *(self.store.get_records(zone_id, max_age=self.ttl) for _, zone_id in zones)
         )
-        return SEARCH_QUERY
-    
-    elif text == "📊 گزارشات":
-        logs = change_logger.get_recent_logs(15)
-        if not logs:
-            await update.message.reply_text(
-                "📊 هیچ گزارشی ثبت نشده است!",
-                reply_markup=get_main_keyboard()
-            )
-            return MAIN_MENU
+        self.build(zip(zones, all_records))
+
+    async def refresh(self):
+        """به‌روزرسانی ایندکس از مخزن دامنه‌ها؛ درخواست‌های هم‌زمان منتظر همان یک ساخت می‌مانند"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._rebuild())
+        await asyncio.shield(self._refresh_task)
+
+    async def ensure_fresh(self):
+        """اولین بار منتظر ساخت می‌ماند؛ بعد از آن داده قبلی سرو و در پس‌زمینه به‌روز می‌شود"""
+        if not self.built_at:
+            await self.refresh()
+        elif time.monotonic() - self.built_at > self.ttl:
+            if self._refresh_task is None or self._refresh_task.done():
+                asyncio.ensure_future(self.refresh())
+
+    def mark_stale(self):
+        """بعد از هر تغییر، ایندکس در درخواست بعدی به‌روز می‌شود"""
+        if self.built_at:
+            self.built_at = time.monotonic() - self.ttl - 1
+
+    def search(self, query):
+        """رکوردهایی که نام یا محتوای آن‌ها شامل عبارت است"""
+        query = query.strip().lower()
+        now = time.monotonic()
         
-        text = "📊 **گزارش تغییرات اخیر:**\n\n"
-        for log in logs:
-            action_emoji = {
-                'CREATE': '➕',
-                'UPDATE': '✏️',
-                'DELETE': '🗑️',
-                'PROXY_TOGGLE': '🔄'
-            }.get(log['action'], '📌')
-            
-            text += f"{action_emoji} {log['timestamp']}\n"
-            text += f"👤 {log['username']}\n"
-            text += f"🌐 {log['domain']} - {log['record_name']}\n"
-            text += f"📝 {log['details']}\n\n"
+        cached = self._cache.get(query)
+        if cached and now - cached[0] < self.cache_ttl:
+            return cached[1]
         
-        await update.message.reply_text(
-            text,
-            reply_markup=get_main_keyboard(),
-            parse_mode='Markdown'
-        )
-        return MAIN_MENU
+        # هنگام تایپ، نتایج پیشوند قبلی شامل همه نتایج عبارت جدید است
+        candidates = self.entries
+        for end in range(len(query) - 1, 0, -1):
+            previous = self._cache.get(query[:end])
+            if previous and now - previous[0] < self.cache_ttl:
+                candidates = previous[1]
+                break
+        
+        matches = [entry for entry in candidates if query in entry.haystack]
+        
+        if len(self._cache) > 512:
+            self._cache = {
+                key: value for key, value in self._cache.items()
+                if now - value[0] < self.cache_ttl
+            }
+        self._cache[query] = (now, matches)
+        
+        return matches
+
+    def search_ip(self, query):
+        """رکوردهای A/AAAA که محتوای آن‌ها در IP، CIDR یا بازه داده شده است (جستجوی دودویی)"""
+        version, start, end = parse_ip_query(query)
+        keys = self._ip_keys[version]
+        low = bisect.bisect_left(keys, start)
+        high = bisect.bisect_right(keys, end)
+        return self._ip_entries[version][low:high]
+
+# ===== تاریخچه رکوردها =====
+RECORD_FIELDS = ('id', 'type', 'name', 'content', 'ttl', 'proxied', 'priority', 'data')
+
+def normalize_record(record):
+    """فقط فیلدهایی از رکورد که برای بازسازی آن لازم است"""
+    return {field: record[field] for field in RECORD_FIELDS if record.get(field) is not None}
+
+def record_payload(record):
+    """داده لازم برای ایجاد رکورد از روی رکورد ذخیره شده"""
+    payload = {field: value for field, value in normalize_record(record).items() if field != 'id'}
+    payload.setdefault('ttl', 1)
+    payload.setdefault('proxied', False)
+    return payload
+
+def record_fingerprint(record):
+    """مقادیر قابل ویرایش رکورد برای مقایسه"""
+    return (
+        record.get('content'),
+        record.get('ttl', 1),
+        bool(record.get('proxied', False)),
+        record.get('priority'),
+        json.dumps(record.get('data'), sort_keys=True)
+    )
+
+def plan_record_changes(current, desired, fingerprint=record_fingerprint):
+    """
+    کمترین تغییرات لازم برای رسیدن از رکوردهای فعلی به رکوردهای مطلوب.
+    رکوردها بر اساس (نوع، نام) گروه‌بندی و با hash join مقایسه می‌شوند.
+    خروجی: (creates, updates, deletes) که updates لیستی از (فعلی، مطلوب) است.
+    """
+    groups = {}
+    for record in current:
+        key = (record['type'], record['name'].lower())
+        groups.setdefault(key, ([], []))[0].append(record)
+    for record in desired:
+        key = (record['type'], record['name'].lower())
+        groups.setdefault(key, ([], []))[1].append(record)
     
-    elif text == "📈 آمار":
-        zones = cf_manager.get_zones()
-        total_records = 0
+    creates, updates, deletes = [], [], []
+    for current_group, desired_group in groups.values():
+        # رکوردهای کاملا یکسان بدون تغییر می‌مانند
+        unmatched = {}
+        for record in current_group:
+            unmatched.setdefault(fingerprint(record), []).append(record)
         
-        text = "📈 **آمار کلی سیستم:**\n\n"
-        text += f"🌐 تعداد دامنه‌ها: {len(zones)}\n\n"
+        remaining_desired = []
+        for record in desired_group:
+            same = unmatched.get(fingerprint(record))
+            if same:
+                same.pop()
+            else:
+                remaining_desired.append(record)
         
-        for zone_name, zone_id in zones:
-            records = cf_manager.get_dns_records(zone_id)
-            total_records += len(records)
+        remaining_current = [record for records in unmatched.values() for record in records]
+        
+        # بقیه به ترتیب ویرایش، و مازاد ایجاد یا حذف می‌شوند
+        for old, new in zip(remaining_current, remaining_desired):
+            updates.append((old, new))
+        creates.extend(remaining_desired[len(remaining_current):])
+        deletes.extend(remaining_current[len(remaining_desired):])
+    
+    return creates, updates, deletes
+
+def _run_batched(pool, tasks, batch_size, delay, on_batch=None):
+    """اجرای هم‌زمان (برچسب، تابع، آرگومان‌ها) در دسته‌های batch_size تایی"""
+    results = []
+    for start in range(0, len(tasks), batch_size):
+        if start:
+            time.sleep(delay)
+        batch = tasks[start:start + batch_size]
+        futures = [pool.submit(func, *args) for _, func, args in batch]
+        for (label, _, _), future in zip(batch, futures):
+            results.append((label,) + tuple(future.result()))
+        if on_batch:
+            on_batch(len(batch))
+    return results
+
+def apply_record_changes(manager, zone_id, creates, updates, deletes,
+                         concurrency=SYNC_CONCURRENCY, batch_size=SYNC_BATCH_SIZE, delay=SYNC_BATCH_DELAY):
+    """
+    اجرای تغییرات برنامه‌ریزی شده از طریق CloudflareManager.
+    ترتیب حذف، ویرایش و ایجاد حفظ می‌شود و هر مرحله هم‌زمان و دسته‌ای اجرا می‌شود.
+    خروجی: (تعداد موفق، لیست خطاها)
+    """
+    phases = [
+        [(f"🗑️ {record['name']}", manager.delete_dns_record, (zone_id, record['id'])) for record in deletes],
+        [
+            # رکورد فعلی نوع و نام را دارد؛ نیازی به دریافت دوباره جزئیات نیست
+            (f"✏️ {old['name']}", manager.update_dns_record, (zone_id, old['id'], record_payload(new), old))
+            for old, new in updates
+        ],
+        [(f"➕ {record['name']}", manager.create_dns_record, (zone_id, record_payload(record))) for record in creates]
+    ]
+    
+    applied, errors = 0, []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for tasks in phases:
+            for label, success, message in _run_batched(pool, tasks, batch_size, delay):
+                if success:
+                    applied += 1
+                else:
+                    errors.append(f"{label}: {message}")
+    
+    return applied, errors
+
+def encode_snapshot_blob(blob):
+    """سرآیند ثابت (magic و hash پایه) و سپس JSON فشرده blob"""
+    base = bytes.fromhex(blob['base']) if blob['base'] else bytes(32)
+    return SNAPSHOT_OBJECT_MAGIC + base + zlib.compress(json.dumps(blob, ensure_ascii=False).encode('utf-8'), 9)
+
+def decode_snapshot_blob(raw):
+    """blob فشرده یک وضعیت: {'base', 'depth', 'set', 'del'}"""
+    if raw.startswith(SNAPSHOT_OBJECT_MAGIC):
+        raw = raw[SNAPSHOT_HEADER_SIZE:]
+    return json.loads(zlib.decompress(raw).decode('utf-8'))
+
+def snapshot_blob_base(raw):
+    """hash پایه یک blob از سرآیند آن، بدون خارج کردن داده از حالت فشرده"""
+    if raw.startswith(SNAPSHOT_OBJECT_MAGIC):
+        base = raw[len(SNAPSHOT_OBJECT_MAGIC):SNAPSHOT_HEADER_SIZE]
+        return base.hex() if any(base) else None
+    # فایل‌های قدیمی بدون سرآیند (فقط zlib)
+    return decode_snapshot_blob(raw).get('base')
+
+def load_snapshot_state(state_hash, blobs, cache):
+    """بازسازی وضعیت (id -> رکورد) از blob های فشرده داده شده، بدون دسترسی به دیسک"""
+    if state_hash in cache:
+        return cache[state_hash]
+    
+    blob = decode_snapshot_blob(blobs[state_hash])
+    if blob.get('base'):
+        state = dict(load_snapshot_state(blob['base'], blobs, cache))
+        for record_id in blob['del']:
+            state.pop(record_id, None)
+        state.update(blob['set'])
+    else:
+        state = blob['set']
+    
+    cache[state_hash] = state
+    return state
+
+def diff_snapshot_zones(zones, blobs, progress=None):
+    """تفاوت وضعیت‌های [(zone_name, old_hash, new_hash)]؛ zone_name -> (creates, updates, deletes)"""
+    result, cache = {}, {}
+    for done, (zone_name, old_hash, new_hash) in enumerate(zones):
+        if progress:
+            progress(done / len(zones), f"{done}/{len(zones)} دامنه")
+        old_records = load_snapshot_state(old_hash, blobs, cache).values() if old_hash else []
+        new_records = load_snapshot_state(new_hash, blobs, cache).values() if new_hash else []
+        result[zone_name] = plan_record_changes(list(old_records), list(new_records))
+    return result
+
+class SnapshotStore:
+    """
+    تاریخچه رکوردهای دامنه‌ها به صورت آدرس‌دهی با محتوا.
+    وضعیت هر دامنه با sha256 شناسایی می‌شود؛ دامنه بدون تغییر هیچ شیء جدیدی
+    نمی‌سازد و وضعیت‌های جدید به صورت delta فشرده نسبت به وضعیت قبلی ذخیره می‌شوند.
+    """
+    def __init__(self, directory=SNAPSHOT_DIR, max_chain=SNAPSHOT_MAX_DELTA_CHAIN):
+        self.directory = directory
+        self.objects_dir = os.path.join(directory, 'objects')
+        self.index_file = os.path.join(directory, 'index.jsonl')
+        self.max_chain = max_chain
+        self._lock = threading.RLock()
+        self._states = OrderedDict()
+        self._depths = {}
+        self._snapshots = None
+        self._heads = {}
+
+    def _load_index(self):
+        if self._snapshots is not None:
+            return
+        
+        self._snapshots = []
+        if os.path.exists(self.index_file):
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self._snapshots.append(json.loads(line.strip()))
+                    except:
+                        continue
+        
+        for snapshot in self._snapshots:
+            for zone_id, (_, state_hash) in snapshot['zones'].items():
+                self._heads[zone_id] = state_hash
+
+    def _object_path(self, state_hash):
+        return os.path.join(self.objects_dir, state_hash[:2], state_hash[2:])
+
+    def _read_raw(self, state_hash):
+        with open(self._object_path(state_hash), 'rb') as f:
+            return f.read()
+
+    def _read_object(self, state_hash):
+        return decode_snapshot_blob(self._read_raw(state_hash))
+
+    def _write_object(self, state_hash, blob):
+        path = self._object_path(state_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(encode_snapshot_blob(blob))
+        os.replace(tmp_path, path)
+
+    def _depth(self, state_hash):
+        if state_hash not in self._depths:
+            self._depths[state_hash] = self._read_object(state_hash).get('depth', 0)
+        return self._depths[state_hash]
+
+    @staticmethod
+    def state_hash(records):
+        canonical = json.dumps(
+            sorted(records.values(), key=lambda r: r['id']),
+            sort_keys=True,
+            ensure_ascii=False,
+            separators=(',', ':')
+        )
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def load_state(self, state_hash):
+        """بازسازی وضعیت یک دامنه (id -> رکورد) از روی زنجیره delta"""
+        with self._lock:
+            if state_hash in self._states:
+                self._states.move_to_end(state_hash)
+                return self._states[state_hash]
             
-            type_counts = {}
-            for record in records:
-                record_type = record['type']
-                type_counts[record_type] = type_counts.get(record_type, 0) + 1
+            blob = self._read_object(state_hash)
+            if blob.get('base'):
+                state = dict(self.load_state(blob['base']))
+                for record_id in blob['del']:
+                    state.pop(record_id, None)
+                state.update(blob['set'])
+            else:
+                state = blob['set']
             
-            text += f"**{zone_name}:**\n"
-            for rtype, count in sorted(type_counts.items()):
-                text += f"  • {rtype}: {count}\n"
-            text += f"  📊 مجموع: {len(records)}\n\n"
+            self._states[state_hash] = state
+            if len(self._states) > 64:
+                self._states.popitem(last=False)
+            return state
+
+    def store_state(self, zone_id, records):
+        """ذخیره وضعیت دامنه؛ خروجی hash وضعیت است"""
+        state = {record['id']: normalize_record(record) for record in records}
+        state_hash = self.state_hash(state)
         
-        text += f"💠 **مجموع کل رکوردها: {total_records}**"
+        with self._lock:
+            self._load_index()
+            if os.path.exists(self._object_path(state_hash)):
+                return state_hash
+            
+            base = self._heads.get(zone_id)
+            if base and os.path.exists(self._object_path(base)) and self._depth(base) < self.max_chain:
+                base_state = self.load_state(base)
+                blob = {
+                    'base': base,
+                    'depth': self._depth(base) + 1,
+                    'set': {
+                        record_id: record for record_id, record in state.items()
+                        if base_state.get(record_id) != record
+                    },
+                    'del': [record_id for record_id in base_state if record_id not in state]
+                }
+            else:
+                blob = {'base': None, 'depth': 0, 'set': state, 'del': []}
+            
+            self._write_object(state_hash, blob)
+            self._depths[state_hash] = blob['depth']
+            return state_hash
+
+    def snapshot(self, zones, reason):
+        """
+        ثبت snapshot جدید.
+        zones: دیکشنری zone_id -> (zone_name, records)
+        """
+        zone_hashes = {
+            zone_id: [zone_name, self.store_state(zone_id, records)]
+            for zone_id, (zone_name, records) in zones.items()
+        }
         
-        await update.message.reply_text(
-            text,
-            reply_markup=get_main_keyboard(),
-            parse_mode='Markdown'
-        )
-        return MAIN_MENU
+        with self._lock:
+            self._load_index()
+            entry = {
+                'id': len(self._snapshots) + 1,
+                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'reason': reason,
+                'zones': zone_hashes
+            }
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.index_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            
+            self._snapshots.append(entry)
+            for zone_id, (_, state_hash) in zone_hashes.items():
+                self._heads[zone_id] = state_hash
+        
+        return entry
+
+    def take_snapshot(self, manager, reason='periodic', zones=None):
+        """snapshot از دامنه‌های داده شده (پیش‌فرض: همه دامنه‌ها)"""
+        if zones is None:
+            zones = manager.get_zones()
+        
+        fetched = {}
+        for zone_name, zone_id in zones:
+            try:
+                fetched[zone_id] = (zone_name, manager.fetch_dns_records(zone_id))
+            except Exception as e:
+                # دامنه با خطای دریافت ثبت نمی‌شود؛ وضعیت خالی در بازگردانی همه رکوردها را حذف می‌کرد
+                logger.error(f"Error getting DNS records of {zone_name} for snapshot: {e}")
+        
+        if not fetched:
+            raise RuntimeError("دریافت رکوردهای هیچ دامنه‌ای ممکن نبود")
+        return self.snapshot(fetched, reason)
+
+    def list_snapshots(self, limit=10):
+        with self._lock:
+            self._load_index()
+            return self._snapshots[-limit:]
+
+    def get_snapshot(self, snapshot_id):
+        with self._lock:
+            self._load_index()
+            if 1 <= snapshot_id <= len(self._snapshots):
+                return self._snapshots[snapshot_id - 1]
+            return None
+
+    def diff_inputs(self, old_id, new_id):
+        """
+        داده لازم برای مقایسه دو snapshot بدون دسترسی به این شیء:
+        ([(zone_name, old_hash, new_hash)], hash -> blob فشرده زنجیره‌ها).
+        دامنه‌هایی که hash یکسان دارند کنار گذاشته می‌شوند.
+        """
+        old, new = self.get_snapshot(old_id), self.get_snapshot(new_id)
+        if not old or not new:
+            return None
+        
+        zones, blobs = [], {}
+        for zone_id in set(old['zones']) | set(new['zones']):
+            old_zone = old['zones'].get(zone_id)
+            new_zone = new['zones'].get(zone_id)
+            if old_zone and new_zone and old_zone[1] == new_zone[1]:
+                continue
+            
+            hashes = [zone[1] if zone else None for zone in (old_zone, new_zone)]
+            zones.append(((new_zone or old_zone)[0], hashes[0], hashes[1]))
+            for state_hash in hashes:
+                while state_hash and state_hash not in blobs:
+                    blobs[state_hash] = self._read_raw(state_hash)
+                    state_hash = snapshot_blob_base(blobs[state_hash])
+        
+        return zones, blobs
+
+    def diff(self, old_id, new_id, progress=None):
+        """تفاوت دو snapshot؛ خروجی دیکشنری zone_name -> (creates, updates, deletes)"""
+        inputs = self.diff_inputs(old_id, new_id)
+        if inputs is None:
+            return None
+        return diff_snapshot_zones(*inputs, progress=progress)
+
+    def plan_restore(self, manager, snapshot_id):
+        """
+        تغییرات لازم برای بازگرداندن دامنه‌ها به snapshot؛ zone_id -> (zone_name, plan).
+        خطای دریافت رکوردهای فعلی به فراخواننده می‌رسد (لیست خالی یعنی ایجاد دوباره همه رکوردها).
+        """
+        snapshot = self.get_snapshot(snapshot_id)
+        if not snapshot:
+            return None
+        
+        plans = {}
+        for zone_id, (zone_name, state_hash) in snapshot['zones'].items():
+            live = manager.fetch_dns_records(zone_id)
+            desired = list(self.load_state(state_hash).values())
+            plan = plan_record_changes(live, desired)
+            if any(plan):
+                plans[zone_id] = (zone_name, plan)
+        
+        return plans
+
+# ===== همگام‌سازی وضعیت مطلوب =====
+def sync_fingerprint(record):
+    """
+    مقادیر قابل مقایسه رکورد فایل وضعیت مطلوب با رکورد API؛ فیلدهای اضافی
+    پاسخ API (مثلاً در data) و تفاوت‌های نوشتاری نادیده گرفته می‌شوند.
+    """
+    record_type = record['type']
+    data = record.get('data') or {}
     
-    elif text == "❓ راهنما":
-        help_text = """
-❓ **راهنمای استفاده از ربات**
+    if record_type == 'SRV':
+        target = str(data.get('target', '')).rstrip('.').lower() or '.'
+        value = (data.get('priority'), data.get('weight'), data.get('port'), target)
+    elif record_type == 'CAA':
+        value = (data.get('flags'), str(data.get('tag', '')).lower(), data.get('value'))
+    elif record_type in ('CNAME', 'NS', 'MX'):
+        value = record['content'].rstrip('.').lower()
+    else:
+        value = record['content']
+    
+    proxied = bool(record.get('proxied', False))
+    return (
+        value,
+        1 if proxied else record.get('ttl', 1),
+        proxied,
+        record.get('priority') if record_type == 'MX' else None
+    )
 
-**دستورات:**
-- /start - شروع ربات
-- /cancel - لغو عملیات جاری
+def load_desired_state(raw, filename):
+    """
+    خواندن فایل YAML/JSON وضعیت مطلوب.
+    قالب: {zone: example.com, records: [...]} یا فقط لیست رکوردها
+    (در این حالت نام دامنه از نام فایل گرفته می‌شود).
+    خروجی: (نام دامنه، لیست ورودی‌ها)
+    """
+    text = raw.decode('utf-8-sig')
+    base, extension = os.path.splitext(filename or '')
+    
+    if extension.lower() in ('.yaml', '.yml'):
+        if yaml is None:
+            raise ValueError("برای فایل YAML باید PyYAML نصب باشد (pip install pyyaml)")
+        try:
+            document = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise ValueError(f"فایل YAML نامعتبر است: {e}")
+    else:
+        try:
+            document = json.loads(text)
+        except ValueError as e:
+            raise ValueError(f"فایل JSON نامعتبر است: {e}")
+    
+    zone_name, entries = base, document
+    if isinstance(document, dict):
+        zone_name = document.get('zone') or base
+        entries = document.get('records')
+    
+    if not isinstance(entries, list):
+        raise ValueError("فایل باید شامل لیست records باشد")
+    return str(zone_name).strip().rstrip('.').lower(), entries
 
-**قابلیت‌ها:**
-🌐 **مدیریت دامنه‌ها:**
-- مشاهده لیست دامنه‌ها و رکوردها
-- صفحه‌بندی برای نمایش همه رکوردها
-- مدیریت کامل رکوردهای DNS
+def desired_record(entry, zone_name):
+    """اعتبارسنجی یک ورودی فایل و تبدیل آن به رکورد قابل مقایسه"""
+    if not isinstance(entry, dict):
+        raise ValueError("هر رکورد باید یک شیء با type، name و content باشد")
+    
+    record_type = str(entry.get('type', '')).upper()
+    if entry.get('content') is None:
+        raise ValueError("content لازم است")
+    
+    text = str(entry['content'])
+    if record_type == 'MX' and entry.get('priority') is not None:
+        text = f"{entry['priority']} {text}"
+    valid, fields = validate_record_content(record_type, text)
+    if not valid:
+        raise ValueError(fields)
+    
+    ttl = entry.get('ttl', 1)
+    if isinstance(ttl, bool) or not isinstance(ttl, int) or not (ttl == 1 or 60 <= ttl <= 86400):
+        raise ValueError(f"ttl باید 1 (خودکار) یا بین 60 و 86400 باشد: {ttl}")
+    
+    proxied = entry.get('proxied', False)
+    if not isinstance(proxied, bool):
+        raise ValueError(f"proxied باید true یا false باشد: {proxied}")
+    if proxied and record_type not in ('A', 'AAAA', 'CNAME'):
+        raise ValueError(f"Proxy برای رکورد {record_type} پشتیبانی نمی‌شود")
+    
+    record = {
+        'type': record_type,
+        'name': record_fqdn(str(entry.get('name', '@')), zone_name),
+        'ttl': 1 if proxied else ttl,
+        'proxied': proxied
+    }
+    record.update(fields)
+    return record
 
-✏️ **ویرایش رکوردها:**
-- تغییر محتوای رکورد
-- تغییر نوع رکورد
-- تغییر وضعیت Proxy
+def build_desired_records(entries, zone_name):
+    """همه ورودی‌ها را بررسی می‌کند؛ خروجی: (رکوردها، خطاها)"""
+    records, errors = [], []
+    for number, entry in enumerate(entries, 1):
+        try:
+            records.append(desired_record(entry, zone_name))
+        except ValueError as e:
+            errors.append(f"#{number}: {e}")
+    return records, errors
 
-➕ **افزودن رکورد جدید**
+def export_desired_state(zone_name, records):
+    """وضعیت فعلی دامنه در قالب فایل وضعیت مطلوب"""
+    entries = []
+    for record in sorted(records, key=lambda r: (r['name'], r['type'], r['content'])):
+        name = record['name']
+        if name == zone_name:
+            name = '@'
+        elif name.endswith('.' + zone_name):
+            name = name[:-len(zone_name) - 1]
+        
+        data = record.get('data') or {}
+        content = record['content']
+        if record['type'] == 'SRV' and data:
+            content = f"{data.get('priority')} {data.get('weight')} {data.get('port')} {data.get('target')}"
+        elif record['type'] == 'CAA' and data:
+            content = f'{data.get("flags")} {data.get("tag")} "{data.get("value")}"'
+        
+        entry = {'name': name, 'type': record['type'], 'content': content}
+        if record['type'] == 'MX':
+            entry['priority'] = record.get('priority')
+        entry['ttl'] = record.get('ttl', 1)
+        if record['type'] in ('A', 'AAAA', 'CNAME'):
+            entry['proxied'] = bool(record.get('proxied', False))
+        entries.append(entry)
+    
+    return {'zone': zone_name, 'records': entries}
 
-🗑️ **حذف رکورد**
+# ===== زمان‌بندی تغییرات =====
+class JobScheduler:
+    """
+    زمان‌بندی پایدار تغییرات رکوردها.
+    کارها در یک heap بر اساس زمان اجرا نگه داشته می‌شوند و فقط تا زمان
+    نزدیک‌ترین کار صبر می‌شود. کارهای یک رکورد که با فاصله کمتر از
+    SCHEDULER_COALESCE_WINDOW ثبت می‌شوند یک کار هستند و کارهایی که هم‌زمان
+    سررسید می‌شوند و یک رکورد را هدف دارند در یک درخواست ادغام می‌شوند.
+    """
+    def __init__(self, manager, filename=SCHEDULED_JOBS_FILE,
+                 max_retries=SCHEDULER_MAX_RETRIES, retry_delay=SCHEDULER_RETRY_DELAY):
+        self.manager = manager
+        self.filename = filename
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.jobs = {}
+        self._heap = []
+        self._next_id = 1
+        self._wakeup = None
+        self._notify = None
+        self._load()
 
-🔍 **جستجو در رکوردها**
+    def _load(self):
+        if not os.path.exists(self.filename):
+            return
+        
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading scheduled jobs: {e}")
+            return
+        
+        self._next_id = state.get('next_id', 1)
+        for job in state.get('jobs', []):
+            self.jobs[job['id']] = job
+            heapq.heappush(self._heap, (job['run_at'], job['id']))
 
-📊 **گزارشات و آمار**
+    def _save(self):
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w', encoding='utf-8') as f:
+            json.dump(
+                {'next_id': self._next_id, 'jobs': list(self.jobs.values())},
+                f,
+                ensure_ascii=False
+            )
+        os.replace(tmp_filename, self.filename)
 
-**نکات:**
-- از دکمه‌های ناوبری برای حرکت بین صفحات استفاده کنید
-- تمام تغییرات در سیستم ثبت می‌شود
+    def add_job(self, run_at, zone_id, zone_name, record, fields, user_id, username, description,
+                coalesce_window=SCHEDULER_COALESCE_WINDOW):
+        """
+        افزودن کار. اگر کار منتظری برای همان رکورد حداکثر coalesce_window ثانیه
+        با این زمان فاصله داشته باشد، فیلدها در همان کار ادغام می‌شوند (مقادیر جدید
+        غالب‌اند) و درخواست API جداگانه‌ای ساخته نمی‌شود.
         """
+        run_at = run_at.timestamp()
+        now = time.time()
         
-        await update.message.reply_text(
-            help_text,
-            reply_markup=get_main_keyboard(),
-            parse_mode='Markdown'
+        for job in self.jobs.values():
+            # کار سررسید شده ممکن است در حال اجرا باشد و فیلدهایش خوانده شده باشد
+            if job['record_id'] != record['id'] or job['run_at'] <= now:
+                continue
+            if abs(job['run_at'] - run_at) <= coalesce_window:
+                job['fields'] = dict(job['fields'], **fields)
+                if description != job['description']:
+                    job['description'] = f"{job['description']}؛ {description}"
+                job.update(user_id=user_id, username=username)
+                self._save()
+                return job
+        
+        job = {
+            'id': self._next_id,
+            'run_at': run_at,
+            'zone_id': zone_id,
+            'zone_name': zone_name,
+            'record_id': record['id'],
+            'record_name': record['name'],
+            'fields': fields,
+            'user_id': user_id,
+            'username': username,
+            'description': description,
+            'attempts': 0
+        }
+        self._next_id += 1
+        self.jobs[job['id']] = job
+        heapq.heappush(self._heap, (run_at, job['id']))
+        self._save()
+        
+        if self._wakeup:
+            self._wakeup.set()
+        return job
+
+    def cancel_job(self, job_id):
+        """لغو کار (از heap به صورت تنبل حذف می‌شود)"""
+        job = self.jobs.pop(job_id, None)
+        if job:
+            self._save()
+        return job
+
+    def pending_jobs(self):
+        return sorted(self.jobs.values(), key=lambda job: job['run_at'])
+
+    def _pop_due(self, now):
+        """کارهای سررسید شده به ترتیب زمان"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            run_at, job_id = heapq.heappop(self._heap)
+            job = self.jobs.get(job_id)
+            # ورودی‌های لغو یا زمان‌بندی مجدد شده نادیده گرفته می‌شوند
+            if job and job['run_at'] == run_at:
+                due.append(job)
+        return due
+
+    async def _execute(self, record_id, jobs):
+        """اجرای کارهای ادغام‌شده یک رکورد با تلاش مجدد"""
+        fields = {}
+        for job in jobs:
+            fields.update(job['fields'])
+        last = jobs[-1]
+        
+        loop = asyncio.get_running_loop()
+        try:
+            await snapshot_before_change(last['zone_id'], last['zone_name'])
+            success, message = await loop.run_in_executor(
+                None, self.manager.update_dns_record, last['zone_id'], record_id, fields
+            )
+        except Exception as e:
+            # کار از heap خارج شده است؛ مثل شکست API دوباره زمان‌بندی یا گزارش می‌شود
+            logger.error(f"Error executing scheduled job {last['id']}: {e}")
+            success, message = False, f"خطا: {str(e)}"
+        
+        if not success and last['attempts'] < self.max_retries:
+            last['attempts'] += 1
+            last['fields'] = fields
+            last['run_at'] = time.time() + self.retry_delay * 2 ** (last['attempts'] - 1)
+            for job in jobs[:-1]:
+                self.jobs.pop(job['id'], None)
+            heapq.heappush(self._heap, (last['run_at'], last['id']))
+            self._save()
+            logger.warning(f"Scheduled job {last['id']} failed, retry {last['attempts']}: {message}")
+            return
+        
+        for job in jobs:
+            self.jobs.pop(job['id'], None)
+        self._save()
+        
+        status = "✅" if success else "❌"
+        change_logger.log_change(
+            last['user_id'],
+            last['username'],
+            "SCHEDULED",
+            last['zone_name'],
+            last['record_name'],
+            f"{status} {last['description']}" + ("" if success else f" ({message})")
         )
-        return MAIN_MENU
+        records_changed(last['zone_id'])
+        
+        if self._notify:
+            text = f"⏰ {status} کار زمان‌بندی شده #{last['id']}\n" \
+                   f"🏷️ {last['record_name']}\n📝 {last['description']}"
+            if not success:
+                text += f"\n❌ {message}"
+            try:
+                await self._notify(last['user_id'], text)
+            except Exception as e:
+                logger.error(f"Error notifying scheduled job result: {e}")
+
+    async def run(self, notify=None):
+        """حلقه اصلی: تا سررسید نزدیک‌ترین کار یا افزوده شدن کار جدید صبر می‌کند"""
+        self._notify = notify
+        self._wakeup = asyncio.Event()
+        
+        while True:
+            due = self._pop_due(time.time())
+            
+            grouped = OrderedDict()
+            for job in due:
+                grouped.setdefault(job['record_id'], []).append(job)
+            
+            if grouped:
+                results = await asyncio.gather(
+                    *(self._execute(record_id, jobs) for record_id, jobs in grouped.items()),
+                    return_exceptions=True
+                )
+                for jobs, result in zip(grouped.values(), results):
+                    if isinstance(result, Exception):
+                        logger.error(f"Error finishing scheduled jobs {[job['id'] for job in jobs]}: {result}")
+                continue
+            
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+# ===== failover خودکار =====
+async def _close_writer(writer, timeout):
+    """بستن کامل اتصال (برای TLS شامل close_notify)؛ خطای بستن اهمیتی ندارد"""
+    writer.close()
+    try:
+        await asyncio.wait_for(writer.wait_closed(), timeout)
+    except (OSError, asyncio.TimeoutError, ssl.SSLError):
+        pass
+
+async def probe_tcp(host, port, timeout=FAILOVER_TIMEOUT):
+    """بررسی سلامت با برقراری اتصال TCP"""
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    
+    await _close_writer(writer, timeout)
+    return True
+
+async def probe_http(host, port, path='/', hostname=None, use_tls=False, timeout=FAILOVER_TIMEOUT):
+    """بررسی سلامت HTTP(S)؛ هر پاسخ با کد کمتر از 500 سالم است"""
+    ssl_context = None
+    if use_tls:
+        # مبدا با IP بررسی می‌شود و گواهی آن معمولا برای نام دامنه است
+        ssl_context = ssl.create_default_context()
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+    
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=ssl_context, server_hostname=hostname if use_tls else None),
+            timeout
+        )
+        request = (
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {hostname or host}\r\n"
+            "User-Agent: cfbot-healthcheck\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        writer.write(request.encode('ascii'))
+        await writer.drain()
+        
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        parts = status_line.decode('latin-1').split()
+        return len(parts) >= 2 and parts[0].startswith('HTTP/') and parts[1].isdigit() and int(parts[1]) < 500
+    except (OSError, asyncio.TimeoutError, ssl.SSLError):
+        return False
+    finally:
+        if writer:
+            await _close_writer(writer, timeout)
+
+class FailoverEngine:
+    """
+    failover خودکار رکوردها بر اساس بررسی سلامت primary و backup.
+    هر رکورد حلقه بررسی مستقل با فاصله تصادفی‌شده دارد و تعداد بررسی‌های
+    هم‌زمان محدود است. برای جلوگیری از نوسان، تغییر مقصد فقط بعد از چند
+    نتیجه پیاپی انجام می‌شود.
+    """
+    def __init__(self, manager, filename=FAILOVER_FILE, interval=FAILOVER_INTERVAL,
+                 jitter=FAILOVER_JITTER, timeout=FAILOVER_TIMEOUT, concurrency=FAILOVER_CONCURRENCY,
+                 fall_threshold=FAILOVER_FALL_THRESHOLD, rise_threshold=FAILOVER_RISE_THRESHOLD):
+        self.manager = manager
+        self.filename = filename
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.fall_threshold = fall_threshold
+        self.rise_threshold = rise_threshold
+        self.entries = {}
+        self._next_id = 1
+        self._tasks = {}
+        self._semaphore = None
+        self._notify = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.filename):
+            return
+        
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading failover config: {e}")
+            return
+        
+        self._next_id = state.get('next_id', 1)
+        for entry in state.get('entries', []):
+            # فایل‌های قدیمی ممکن است چند failover برای یک رکورد داشته باشند؛ اولی نگه داشته می‌شود
+            if self.find(entry['zone_id'], entry['record_id']):
+                logger.warning(f"Ignoring duplicate failover #{entry['id']} for {entry['record_name']}")
+                continue
+            entry.update(failures=0, successes=0)
+            self.entries[entry['id']] = entry
+
+    def _save(self):
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w', encoding='utf-8') as f:
+            json.dump({
+                'next_id': self._next_id,
+                'entries': [
+                    {key: value for key, value in entry.items() if key not in ('failures', 'successes')}
+                    for entry in self.entries.values()
+                ]
+            }, f, ensure_ascii=False)
+        os.replace(tmp_filename, self.filename)
+
+    def find(self, zone_id, record_id):
+        """failover ثبت شده برای یک رکورد"""
+        return next(
+            (entry for entry in self.entries.values()
+             if entry['zone_id'] == zone_id and entry['record_id'] == record_id),
+            None
+        )
+
+    def add(self, zone_id, zone_name, record, primary, backup, check='http', port=None, path='/'):
+        """
+        ثبت رکورد برای failover.
+        هر رکورد فقط یک failover دارد (دو حلقه بررسی رکورد را برخلاف هم تغییر می‌دادند)؛
+        برای رکورد تکراری None برگردانده می‌شود.
+        """
+        if self.find(zone_id, record['id']):
+            return None
+        
+        entry = {
+            'id': self._next_id,
+            'zone_id': zone_id,
+            'zone_name': zone_name,
+            'record_id': record['id'],
+            'record_name': record['name'],
+            'primary': primary,
+            'backup': backup,
+            'check': check,
+            'port': port or {'http': 80, 'https': 443}.get(check, 80),
+            'path': path,
+            'active': 'backup' if record['content'] == backup else 'primary',
+            'failures': 0,
+            'successes': 0
+        }
+        self._next_id += 1
+        self.entries[entry['id']] = entry
+        self._save()
+        
+        if self._semaphore:
+            self._start(entry)
+        return entry
+
+    def remove(self, entry_id):
+        entry = self.entries.pop(entry_id, None)
+        if entry:
+            self._save()
+            task = self._tasks.pop(entry_id, None)
+            if task:
+                task.cancel()
+        return entry
+
+    async def probe(self, entry, target):
+        """بررسی سلامت یک مقصد با محدودیت هم‌زمانی"""
+        async with self._semaphore:
+            if entry['check'] == 'tcp':
+                return await probe_tcp(target, entry['port'], self.timeout)
+            return await probe_http(
+                target,
+                entry['port'],
+                entry['path'],
+                hostname=entry['record_name'],
+                use_tls=entry['check'] == 'https',
+                timeout=self.timeout
+            )
+
+    async def check(self, entry):
+        """یک دور بررسی و در صورت نیاز تغییر مقصد"""
+        primary_ok, backup_ok = await asyncio.gather(
+            self.probe(entry, entry['primary']),
+            self.probe(entry, entry['backup'])
+        )
+        
+        if primary_ok:
+            entry['failures'] = 0
+            entry['successes'] += 1
+        else:
+            entry['successes'] = 0
+            entry['failures'] += 1
+        
+        if entry['active'] == 'primary' and entry['failures'] >= self.fall_threshold and backup_ok:
+            await self._switch(entry, 'backup')
+        elif entry['active'] == 'backup' and entry['successes'] >= self.rise_threshold:
+            await self._switch(entry, 'primary')
+
+    async def _switch(self, entry, target):
+        content = entry[target]
+        loop = asyncio.get_running_loop()
+        success, message = await loop.run_in_executor(
+            None, self.manager.update_dns_record, entry['zone_id'], entry['record_id'], {'content': content}
+        )
+        
+        if not success:
+            logger.error(f"Failover of {entry['record_name']} to {target} failed: {message}")
+            return
+        
+        previous = entry['active']
+        entry['active'] = target
+        entry['failures'] = entry['successes'] = 0
+        self._save()
+        
+        change_logger.log_change(
+            0,
+            'failover',
+            "FAILOVER",
+            entry['zone_name'],
+            entry['record_name'],
+            f"Switched from {previous} ({entry[previous]}) to {target} ({content})"
+        )
+        records_changed(entry['zone_id'])
+        
+        if self._notify:
+            emoji = "🚨" if target == 'backup' else "✅"
+            try:
+                await self._notify(
+                    f"{emoji} failover: {entry['record_name']}\n"
+                    f"{entry[previous]} ({previous}) → {content} ({target})"
+                )
+            except Exception as e:
+                logger.error(f"Error sending failover notification: {e}")
+
+    async def _watch(self, entry):
+        # شروع تصادفی تا بررسی‌ها هم‌زمان شروع نشوند
+        await asyncio.sleep(random.uniform(0, self.interval))
+        while entry['id'] in self.entries:
+            try:
+                await self.check(entry)
+            except Exception as e:
+                logger.error(f"Error checking {entry['record_name']}: {e}")
+            await asyncio.sleep(self.interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def _start(self, entry):
+        self._tasks[entry['id']] = asyncio.ensure_future(self._watch(entry))
+
+    def start(self, notify=None):
+        """شروع بررسی همه رکوردهای ثبت شده"""
+        self._notify = notify
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        for entry in self.entries.values():
+            self._start(entry)
+
+# ===== اشتراک تغییرات =====
+class WatchMatcher:
+    """
+    تطبیق هم‌زمان همه اشتراک‌ها با یک تغییر.
+    دامنه‌ها و نام‌های دقیق با دیکشنری، و الگوها بر اساس پسوند ثابتشان
+    (مثلاً api.example.com در *.api.example.com) ایندکس می‌شوند؛ برای هر تغییر
+    فقط پسوندهای نام آن (به تعداد برچسب‌ها) بررسی می‌شود نه همه الگوها.
+    """
+    def __init__(self, subscriptions=()):
+        self.zones = {}
+        self.names = {}
+        self.patterns = {}  # پسوند ثابت -> [(regex، chat_id)]
+        for subscription in subscriptions:
+            self._add(subscription)
+
+    def _add(self, subscription):
+        kind, value, chat_id = subscription['kind'], subscription['value'], subscription['chat_id']
+        if kind == 'zone':
+            self.zones.setdefault(value, set()).add(chat_id)
+        elif kind == 'name':
+            self.names.setdefault(value, set()).add(chat_id)
+        else:
+            labels = value.split('.')
+            fixed = []
+            for label in reversed(labels):
+                if any(char in label for char in '*?['):
+                    break
+                fixed.insert(0, label)
+            regex = re.compile(fnmatch.translate(value), re.IGNORECASE)
+            self.patterns.setdefault('.'.join(fixed), []).append((regex, chat_id))
+
+    def match(self, zone_name, record_name):
+        """chat_id های مشترک این تغییر"""
+        record_name = record_name.lower()
+        chat_ids = set(self.zones.get(zone_name, ()))
+        chat_ids.update(self.names.get(record_name, ()))
+        
+        labels = record_name.split('.')
+        # '' = الگوهای بدون پسوند ثابت (مثلاً api-*)
+        for suffix in ['.'.join(labels[i:]) for i in range(len(labels))] + ['']:
+            for regex, chat_id in self.patterns.get(suffix, ()):
+                if chat_id not in chat_ids and regex.match(record_name):
+                    chat_ids.add(chat_id)
+        return chat_ids
+
+class WatchList:
+    """
+    اشتراک ادمین‌ها روی دامنه، نام یا الگو و ارسال خلاصه تغییرات.
+    تغییرات (از ربات یا خارج از آن) با مقایسه رکوردهای دامنه با آخرین وضعیت
+    دیده شده پیدا می‌شوند. تغییرات هر ادمین جمع و بعد از آرام شدن (debounce)
+    در یک پیام ارسال می‌شوند.
+    """
+    def __init__(self, store, filename=WATCHLIST_FILE, interval=WATCH_POLL_INTERVAL,
+                 debounce=WATCH_DEBOUNCE, max_delay=WATCH_MAX_DELAY):
+        self.store = store
+        self.filename = filename
+        self.interval = interval
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.subscriptions = {}
+        self.matcher = WatchMatcher()
+        self._next_id = 1
+        self._seen = {}  # zone_id -> {record_id: (type, name, content, ttl, proxied)}
+        self._pending = {}  # chat_id -> [رویدادها]
+        self._last_event = {}
+        self._flush_tasks = {}
+        self._poked = set()
+        self._wakeup = None
+        self._notify = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.filename):
+            return
+        
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading watch list: {e}")
+            return
+        
+        self._next_id = state.get('next_id', 1)
+        for subscription in state.get('subscriptions', []):
+            self.subscriptions[subscription['id']] = subscription
+        self.matcher = WatchMatcher(self.subscriptions.values())
+
+    def _save(self):
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w', encoding='utf-8') as f:
+            json.dump({
+                'next_id': self._next_id,
+                'subscriptions': list(self.subscriptions.values())
+            }, f, ensure_ascii=False)
+        os.replace(tmp_filename, self.filename)
+
+    def add(self, chat_id, kind, value):
+        """ثبت اشتراک (zone، name یا pattern)؛ اشتراک تکراری دوباره ثبت نمی‌شود"""
+        value = value.strip().rstrip('.').lower()
+        for subscription in self.subscriptions.values():
+            if (subscription['chat_id'], subscription['kind'], subscription['value']) == (chat_id, kind, value):
+                return subscription
+        
+        subscription = {'id': self._next_id, 'chat_id': chat_id, 'kind': kind, 'value': value}
+        self._next_id += 1
+        self.subscriptions[subscription['id']] = subscription
+        self.matcher = WatchMatcher(self.subscriptions.values())
+        self._save()
+        return subscription
+
+    def remove(self, chat_id, subscription_id):
+        subscription = self.subscriptions.get(subscription_id)
+        if not subscription or subscription['chat_id'] != chat_id:
+            return None
+        
+        del self.subscriptions[subscription_id]
+        self.matcher = WatchMatcher(self.subscriptions.values())
+        self._save()
+        return subscription
+
+    def for_chat(self, chat_id):
+        return [subscription for subscription in self.subscriptions.values() if subscription['chat_id'] == chat_id]
+
+    def poke(self, zone_id):
+        """بررسی فوری دامنه بعد از تغییر از طریق ربات"""
+        if self._wakeup is not None:
+            self._poked.add(zone_id)
+            self._wakeup.set()
+
+    def diff(self, zone_id, zone_name, records):
+        """رویدادهای تغییر نسبت به آخرین وضعیت دیده شده؛ بار اول فقط وضعیت ثبت می‌شود"""
+        state = {
+            record['id']: (record['type'], record['name'], record['content'], record.get('ttl', 1), bool(record.get('proxied')))
+            for record in records
+        }
+        previous = self._seen.get(zone_id)
+        self._seen[zone_id] = state
+        if previous is None:
+            return []
+        
+        events = []
+        for record_id, new in state.items():
+            old = previous.get(record_id)
+            if old is None:
+                events.append(('CREATE', zone_name, new, None))
+            elif old != new:
+                events.append(('UPDATE', zone_name, new, old))
+        for record_id, old in previous.items():
+            if record_id not in state:
+                events.append(('DELETE', zone_name, old, None))
+        return events
+
+    def dispatch(self, events):
+        """افزودن رویدادها به صف خلاصه ادمین‌های مشترک"""
+        for event in events:
+            for chat_id in self.matcher.match(event[1], event[2][1]):
+                self._pending.setdefault(chat_id, []).append(event)
+                self._last_event[chat_id] = time.monotonic()
+                task = self._flush_tasks.get(chat_id)
+                if task is None or task.done():
+                    self._flush_tasks[chat_id] = asyncio.ensure_future(self._flush_later(chat_id))
+
+    async def _flush_later(self, chat_id):
+        started = time.monotonic()
+        # تا آرام شدن تغییرات (یا رسیدن به حداکثر تاخیر) صبر می‌کند
+        while True:
+            wait = min(self._last_event[chat_id] + self.debounce, started + self.max_delay) - time.monotonic()
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        
+        events = self._pending.pop(chat_id, [])
+        # رویدادهایی که در حین ارسال می‌رسند flush جدیدی شروع می‌کنند
+        if self._flush_tasks.get(chat_id) is asyncio.current_task():
+            del self._flush_tasks[chat_id]
+        if events and self._notify:
+            try:
+                await self._notify(chat_id, format_watch_digest(events))
+            except Exception as e:
+                logger.error(f"Error sending watch digest to {chat_id}: {e}")
+
+    async def _check(self, zone_ids=None):
+        if not self.subscriptions:
+            # بدون اشتراک درخواستی به API نمی‌رود؛ وضعیت قدیمی هم نگه داشته نمی‌شود
+            self._seen.clear()
+            return
+        
+        for zone_name, zone_id in await self.store.get_zones():
+            if zone_ids is not None and zone_id not in zone_ids:
+                continue
+            try:
+                records = await self.store.fetch_records(zone_id, max_age=self.interval)
+            except Exception as e:
+                # خطای API نباید به عنوان حذف همه رکوردها دیده شود
+                logger.error(f"Error getting DNS records of {zone_name} for watch list: {e}")
+                continue
+            self.dispatch(self.diff(zone_id, zone_name, records))
+
+    async def run(self, notify=None):
+        """حلقه بررسی دوره‌ای همه دامنه‌ها و بررسی فوری دامنه‌های تغییر کرده"""
+        self._notify = notify
+        self._wakeup = asyncio.Event()
+        
+        while True:
+            try:
+                poked = None
+                if self._poked:
+                    poked, self._poked = self._poked, set()
+                await self._check(poked)
+            except Exception as e:
+                logger.error(f"Error checking watched records: {e}")
+            
+            self._wakeup.clear()
+            if self._poked:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+def format_watch_digest(events, limit=WATCH_DIGEST_LIMIT):
+    """یک پیام خلاصه برای همه تغییرات جمع شده"""
+    lines = [f"🔔 {len(events)} تغییر در رکوردهای تحت نظر:", ""]
+    for action, zone_name, new, old in events[:limit]:
+        record_type, name, content = new[0], new[1], new[2]
+        if action == 'CREATE':
+            lines.append(f"➕ {record_type} {name} → {content}")
+        elif action == 'DELETE':
+            lines.append(f"🗑️ {record_type} {name} ({content})")
+        elif old[2] != content:
+            lines.append(f"✏️ {record_type} {name}: {old[2]} → {content}")
+        else:
+            lines.append(f"✏️ {record_type} {name}: TTL {old[3]} → {new[3]}, Proxy {old[4]} → {new[4]}")
+    
+    if len(events) > limit:
+        lines.append(f"... و {len(events) - limit} تغییر دیگر")
+    return "\n".join(lines)
+
+# ===== صف پاکسازی کش =====
+PURGE_KINDS = ('files', 'prefixes', 'tags', 'hosts')
+
+def purge_key(value):
+    """کلید مقایسه URL/پیشوند: بدون scheme، host با حروف کوچک (مسیر حساس به حروف است)"""
+    value = re.sub(r'^https?://', '', value.strip(), flags=re.IGNORECASE)
+    host, _, path = value.partition('/')
+    return f"{host.lower()}/{path}".rstrip('/')
+
+def _purge_ancestors(key):
+    """host و پوشه‌های بالاتر یک کلید (host/a/b -> host، host/a)"""
+    parts = key.split('/')
+    return ['/'.join(parts[:i]) for i in range(1, len(parts))]
+
+def plan_purge(pending):
+    """
+    تبدیل درخواست‌های ادغام شده یک دامنه به کمترین تعداد درخواست API.
+    purge_everything همه را پوشش می‌دهد؛ URL و پیشوندی که زیر یک host یا
+    پیشوند دیگر در همین دسته است حذف می‌شود و بقیه در دسته‌های
+    PURGE_BATCH_SIZE تایی (هر نوع جدا) ارسال می‌شوند.
+    """
+    if pending['everything']:
+        return [{'purge_everything': True}]
+    
+    hosts = {host.lower() for host in pending['hosts']}
+    covering = hosts | set(pending['prefixes'])
+    prefixes = [
+        value for key, value in pending['prefixes'].items()
+        if not any(ancestor in covering for ancestor in _purge_ancestors(key))
+    ]
+    files = [
+        url for key, url in pending['files'].items()
+        if key not in covering and not any(ancestor in covering for ancestor in _purge_ancestors(key))
+    ]
+    
+    payloads = []
+    for kind, values in (('files', files), ('prefixes', prefixes), ('tags', sorted(pending['tags'])), ('hosts', sorted(hosts))):
+        values = sorted(values) if kind in ('files', 'prefixes') else values
+        for start in range(0, len(values), PURGE_BATCH_SIZE):
+            payloads.append({kind: values[start:start + PURGE_BATCH_SIZE]})
+    return payloads
+
+class PurgeQueue:
+    """
+    صف ادغام‌کننده پاکسازی کش.
+    درخواست‌های یک دامنه (از همه ادمین‌ها) در بازه PURGE_COALESCE_WINDOW جمع،
+    تکراری‌ها و هم‌پوشانی‌ها حذف و با رعایت محدودیت نرخ ارسال می‌شوند.
+    """
+    def __init__(self, manager, window=PURGE_COALESCE_WINDOW, rate=PURGE_REQUESTS_PER_SECOND):
+        self.manager = manager
+        self.window = window
+        self.rate = rate
+        self._pending = {}
+        self._flush_tasks = {}
+        self._tokens = rate
+        self._last_refill = time.monotonic()
+        self.requested = 0
+        self.api_calls = 0
+
+    def purge(self, zone_id, kind, values=()):
+        """
+        ثبت درخواست (kind: everything، files، prefixes، tags یا hosts).
+        خروجی: future با (تعداد درخواست API، تعداد درخواست‌های ادغام شده، خطاها)
+        """
+        pending = self._pending.get(zone_id)
+        if pending is None:
+            pending = self._pending[zone_id] = {
+                'everything': False, 'files': {}, 'prefixes': {}, 'tags': set(), 'hosts': set(), 'waiters': []
+            }
+            self._flush_tasks[zone_id] = asyncio.ensure_future(self._flush_later(zone_id))
+        
+        if kind == 'everything':
+            pending['everything'] = True
+        elif kind in ('files', 'prefixes'):
+            for value in values:
+                key = purge_key(value)
+                pending[kind].setdefault(key, value.strip() if kind == 'files' else key)
+        else:
+            pending[kind].update(value.strip() for value in values)
+        
+        self.requested += 1
+        future = asyncio.get_running_loop().create_future()
+        pending['waiters'].append(future)
+        return future
+
+    async def _acquire(self):
+        """token bucket برای محدودیت نرخ API"""
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def _flush_later(self, zone_id):
+        pending, result = None, None
+        try:
+            await asyncio.sleep(self.window)
+            pending = self._pending.pop(zone_id)
+            payloads = plan_purge(pending)
+            
+            loop = asyncio.get_running_loop()
+            errors = []
+            for payload in payloads:
+                await self._acquire()
+                success, message = await loop.run_in_executor(None, self.manager.purge_cache, zone_id, payload)
+                self.api_calls += 1
+                if not success:
+                    errors.append(f"{next(iter(payload))}: {message}")
+            
+            result = (len(payloads), len(pending['waiters']), errors)
+        except Exception as e:
+            logger.error(f"Error purging cache for {zone_id}: {e}")
+            result = e
+        finally:
+            # در حین ارسال، purge جدید ممکن است flush بعدی این دامنه را ثبت کرده باشد
+            if self._flush_tasks.get(zone_id) is asyncio.current_task():
+                del self._flush_tasks[zone_id]
+            # اگر قبل از برداشتن دسته از صف متوقف شد، همان دسته (نه دسته جدید بعدی) بسته می‌شود
+            if pending is None:
+                pending = self._pending.pop(zone_id, {'waiters': []})
+            # هیچ فراخواننده‌ای منتظر نمی‌ماند: نتیجه، خطا یا لغو
+            for waiter in pending['waiters']:
+                if waiter.done():
+                    continue
+                if isinstance(result, Exception):
+                    waiter.set_exception(result)
+                elif result is None:
+                    waiter.cancel()
+                else:
+                    waiter.set_result(result)
+
+# ===== قوانین دسترسی IP =====
+IP_RULE_MODES = {'block': 'block', 'allow': 'whitelist', 'challenge': 'managed_challenge'}
+IP_RULE_PREFIXES = {4: (16, 24, 32), 6: (32, 48, 64, 128)}  # طول پیشوندهای قابل قبول API
+
+class PrefixTrie:
+    """
+    trie دودویی پیشوندهای IP (ریشه جدا برای IPv4 و IPv6).
+    covering(network) در O(طول پیشوند) پیدا می‌کند که آیا شبکه‌ای که قبلا
+    اضافه شده آن را پوشش می‌دهد یا نه.
+    """
+    def __init__(self):
+        self._roots = {4: {}, 6: {}}
+
+    @staticmethod
+    def _bits(network):
+        address = int(network.network_address)
+        width = network.max_prefixlen
+        for i in range(network.prefixlen):
+            yield (address >> (width - 1 - i)) & 1
+
+    def insert(self, network, value=True):
+        node = self._roots[network.version]
+        for bit in self._bits(network):
+            node = node.setdefault(bit, {})
+        node[None] = value
+
+    def covering(self, network):
+        """مقدار کوتاه‌ترین شبکه‌ای که network را پوشش می‌دهد (خود آن هم حساب است)"""
+        node = self._roots[network.version]
+        if None in node:
+            return node[None]
+        for bit in self._bits(network):
+            node = node.get(bit)
+            if node is None:
+                return None
+            if None in node:
+                return node[None]
+        return None
+
+def ip_rule_networks(value):
+    """
+    تبدیل IP یا CIDR به شبکه‌هایی با طول پیشوند قابل قبول API.
+    مثلا 10.0.0.0/20 به ۱۶ شبکه /24 شکسته می‌شود.
+    """
+    network = ipaddress.ip_network(value, strict=False)
+    allowed = IP_RULE_PREFIXES[network.version]
+    if network.prefixlen in allowed:
+        return [network]
+    
+    shorter = [length for length in allowed if length < network.prefixlen]
+    longer = [length for length in allowed if length > network.prefixlen]
+    if not longer:
+        raise ValueError(f"طول پیشوند /{network.prefixlen} پشتیبانی نمی‌شود")
+    if 2 ** (longer[0] - network.prefixlen) > IP_RULES_MAX_EXPAND:
+        hint = f" (حداقل /{shorter[-1]})" if shorter else ""
+        raise ValueError(f"پیشوند /{network.prefixlen} بیش از {IP_RULES_MAX_EXPAND} قانون می‌سازد{hint}")
+    return list(network.subnets(new_prefix=longer[0]))
+
+def parse_ip_list(raw):
+    """
+    خواندن لیست IP/CIDR (هر خط یا جدا شده با فاصله/کاما؛ # برای توضیح).
+    خروجی: (شبکه‌ها، خطاها)
+    """
+    text = raw.decode('utf-8-sig', errors='replace')
+    networks, errors = [], []
+    for line_number, line in enumerate(text.splitlines(), 1):
+        for value in re.split(r'[\s,;]+', line.split('#', 1)[0].strip()):
+            if not value:
+                continue
+            try:
+                networks.extend(ip_rule_networks(value))
+            except ValueError as e:
+                errors.append(f"خط {line_number}: {value} - {e}")
+    return networks, errors
+
+def access_rule_target(network):
+    """(target، value) قانون API برای یک شبکه"""
+    if network.prefixlen == network.max_prefixlen:
+        return ('ip' if network.version == 4 else 'ip6'), str(network.network_address)
+    return 'ip_range', str(network)
+
+def access_rule_network(rule):
+    """شبکه یک قانون موجود (قوانین کشور/ASN نادیده گرفته می‌شوند)"""
+    configuration = rule.get('configuration', {})
+    if configuration.get('target') not in ('ip', 'ip6', 'ip_range'):
+        return None
+    try:
+        return ipaddress.ip_network(configuration['value'], strict=False)
+    except ValueError:
+        return None
+
+def plan_ip_rules(existing, networks, mode, replace=False):
+    """
+    کمترین تغییرات لازم برای اعمال لیست IP با mode مشخص.
+    شبکه‌ها از کوتاه‌ترین پیشوند وارد trie می‌شوند؛ هر آدرسی که یک CIDR
+    دیگر لیست (یا در حالت افزودن، یک قانون موجود با همین mode) آن را
+    پوشش دهد حذف می‌شود. قانون موجود با همان مقدار ولی mode دیگر ویرایش
+    می‌شود و در حالت replace قوانین این mode که در لیست نیستند حذف می‌شوند.
+    خروجی: (creates, updates, deletes, تعداد تکراری/پوشش داده شده)
+    """
+    existing_trie = PrefixTrie()
+    by_network = {}
+    for rule in existing:
+        network = access_rule_network(rule)
+        if network is None:
+            continue
+        by_network[network] = rule
+        if rule['mode'] == mode and not replace:
+            existing_trie.insert(network, rule)
+    
+    desired_trie = PrefixTrie()
+    desired, redundant = [], 0
+    for network in sorted(set(networks), key=lambda n: (n.version, n.prefixlen, int(n.network_address))):
+        if desired_trie.covering(network) is not None:
+            redundant += 1
+            continue
+        desired_trie.insert(network)
+        desired.append(network)
+    redundant += len(networks) - len(set(networks))
+    
+    creates, updates = [], []
+    for network in desired:
+        rule = by_network.get(network)
+        if rule is not None and rule['mode'] != mode:
+            updates.append(rule)
+        elif rule is None and existing_trie.covering(network) is None:
+            creates.append(network)
+    
+    deletes = []
+    if replace:
+        wanted = set(desired)
+        deletes = [
+            rule for network, rule in by_network.items()
+            if rule['mode'] == mode and network not in wanted
+        ]
+    
+    return creates, updates, deletes, redundant
+
+def apply_ip_rule_changes(manager, zone_id, mode, creates, updates, deletes, notes='', on_batch=None,
+                          concurrency=IP_RULES_CONCURRENCY, batch_size=IP_RULES_BATCH_SIZE, delay=IP_RULES_BATCH_DELAY):
+    """
+    اجرای برنامه قوانین IP به صورت هم‌زمان و دسته‌ای با رعایت محدودیت نرخ.
+    خروجی: (تعداد موفق، لیست خطاها)
+    """
+    phases = [
+        [
+            (f"🗑️ {rule['configuration']['value']}", manager.delete_access_rule, (zone_id, rule['id']))
+            for rule in deletes
+        ],
+        [
+            (f"✏️ {rule['configuration']['value']}", manager.update_access_rule_mode, (zone_id, rule['id'], mode))
+            for rule in updates
+        ],
+        [
+            (f"➕ {network}", manager.create_access_rule, (zone_id, mode) + access_rule_target(network) + (notes,))
+            for network in creates
+        ]
+    ]
+    
+    applied, errors = 0, []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for tasks in phases:
+            for label, success, message in _run_batched(pool, tasks, batch_size, delay, on_batch):
+                if success:
+                    applied += 1
+                else:
+                    errors.append(f"{label}: {message}")
+    
+    return applied, errors
+
+# ===== بررسی سلامت رکوردها =====
+AUDIT_CATEGORIES = [
+    ('dangling', '🔗', 'CNAME به نامی که در دامنه‌های ما وجود ندارد'),
+    ('duplicate', '👯', 'رکورد تکراری'),
+    ('conflict', '⚔️', 'رکوردهای متناقض'),
+    ('proxied', '🟠', 'Proxy روی نوع غیرقابل proxy'),
+    ('ttl', '⏱️', 'TTL ناهمسان در یک مجموعه رکورد')
+]
+
+def audit_records(zones, zone_records):
+    """
+    بررسی سلامت رکوردهای همه دامنه‌ها در یک گذر با hash join.
+    zones: [(نام دامنه، شناسه)]، zone_records: شناسه دامنه -> رکوردها (فقط داده کش شده).
+    خروجی: دسته -> لیست توضیح مشکلات
+    """
+    issues = {key: [] for key, _, _ in AUDIT_CATEGORIES}
+    zone_names = set()
+    names = set()
+    rrsets = {}
+    types_by_name = {}
+    cnames = []
+    
+    for zone_name, zone_id in zones:
+        records = zone_records.get(zone_id)
+        if records is None:
+            continue
+        zone_names.add(zone_name.lower())
+        for record in records:
+            name = record['name'].lower().rstrip('.')
+            record_type = record['type']
+            names.add(name)
+            rrsets.setdefault((name, record_type), []).append(record)
+            types_by_name.setdefault(name, set()).add(record_type)
+            if record_type == 'CNAME':
+                cnames.append((name, record['content'].lower().rstrip('.')))
+            if record.get('proxied') and record_type not in ('A', 'AAAA', 'CNAME'):
+                issues['proxied'].append(f"{name} {record_type}")
+    
+    for name, target in cnames:
+        labels = target.split('.')
+        suffixes = ['.'.join(labels[i:]) for i in range(len(labels))]
+        # فقط مقصدهای داخل دامنه‌های بررسی شده قابل قضاوت هستند
+        if not any(suffix in zone_names for suffix in suffixes):
+            continue
+        if target in names or any(f"*.{suffix}" in names for suffix in suffixes[1:]):
+            continue
+        issues['dangling'].append(f"{name} → {target}")
+    
+    for name, record_types in types_by_name.items():
+        if 'CNAME' in record_types and len(record_types) > 1:
+            others = ', '.join(sorted(record_types - {'CNAME'}))
+            issues['conflict'].append(f"{name}: CNAME در کنار {others}")
+    
+    for (name, record_type), records in rrsets.items():
+        # بیشتر مجموعه‌ها تک رکوردی هستند و مشکلی بین رکوردها ندارند
+        if len(records) == 1:
+            continue
+        if record_type == 'CNAME':
+            issues['conflict'].append(f"{name}: {len(records)} رکورد CNAME")
+        if record_type in ('A', 'AAAA', 'CNAME') and len({bool(record.get('proxied')) for record in records}) > 1:
+            issues['conflict'].append(f"{name} {record_type}: وضعیت Proxy ناهمسان")
+        
+        seen = {}
+        for record in records:
+            data = record.get('data')
+            key = (record['content'], record.get('priority'), json.dumps(data, sort_keys=True) if data else None)
+            seen[key] = seen.get(key, 0) + 1
+        for (content, _, _), count in seen.items():
+            if count > 1:
+                issues['duplicate'].append(f"{name} {record_type} {content} (×{count})")
+        
+        ttls = {record.get('ttl', 1) for record in records}
+        if len(ttls) > 1:
+            values = ', '.join('auto' if ttl == 1 else str(ttl) for ttl in sorted(ttls))
+            issues['ttl'].append(f"{name} {record_type}: {values}")
+    
+    for found in issues.values():
+        found.sort()
+    return issues
+
+def format_audit_report(issues, limit=None):
+    """متن گزارش سلامت؛ با limit فقط چند نمونه از هر دسته"""
+    lines = []
+    for key, emoji, title in AUDIT_CATEGORIES:
+        found = issues[key]
+        if not found:
+            continue
+        lines.append(f"{emoji} {title}: {len(found)}")
+        shown = found if limit is None else found[:limit]
+        lines.extend(f"  • {item}" for item in shown)
+        if len(shown) < len(found):
+            lines.append(f"  ... و {len(found) - len(shown)} مورد دیگر")
+        lines.append("")
+    return "\n".join(lines).strip()
+
+# ===== بررسی انتشار DNS =====
+DNS_TYPES = {'A': 1, 'NS': 2, 'CNAME': 5, 'MX': 15, 'TXT': 16, 'AAAA': 28, 'SRV': 33, 'CAA': 257}
+
+def build_dns_query(query_id, name, record_type):
+    """ساخت پیام پرس‌وجوی DNS (RD فعال)"""
+    header = struct.pack('!HHHHHH', query_id, 0x0100, 1, 0, 0, 0)
+    qname = b''.join(
+        bytes([len(label)]) + label.encode('idna')
+        for label in name.rstrip('.').split('.') if label
+    ) + b'\x00'
+    return header + qname + struct.pack('!HH', DNS_TYPES[record_type], 1)
+
+def _read_dns_name(data, offset):
+    """خواندن نام (با پشتیبانی از فشرده‌سازی)؛ خروجی (نام، offset بعدی)"""
+    labels = []
+    end = None
+    for _ in range(128):
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            continue
+        offset += 1
+        if length == 0:
+            break
+        labels.append(data[offset:offset + length].decode('ascii', 'replace'))
+        offset += length
+    return '.'.join(labels).lower(), end if end is not None else offset
+
+def _format_rdata(data, offset, length, rtype):
+    """تبدیل RDATA به همان قالب محتوای رکورد در Cloudflare"""
+    rdata = data[offset:offset + length]
+    if rtype == 1:
+        return socket.inet_ntop(socket.AF_INET, rdata)
+    if rtype == 28:
+        return socket.inet_ntop(socket.AF_INET6, rdata)
+    if rtype in (2, 5):
+        return _read_dns_name(data, offset)[0]
+    if rtype == 15:
+        return f"{struct.unpack('!H', rdata[:2])[0]} {_read_dns_name(data, offset + 2)[0]}"
+    if rtype == 16:
+        strings, position = [], 0
+        while position < len(rdata):
+            size = rdata[position]
+            strings.append(rdata[position + 1:position + 1 + size].decode('utf-8', 'replace'))
+            position += size + 1
+        return ''.join(strings)
+    if rtype == 33:
+        priority, weight, port = struct.unpack('!HHH', rdata[:6])
+        return f"{priority} {weight} {port} {_read_dns_name(data, offset + 6)[0]}"
+    if rtype == 257:
+        tag_length = rdata[1]
+        tag = rdata[2:2 + tag_length].decode('ascii', 'replace')
+        value = rdata[2 + tag_length:].decode('utf-8', 'replace')
+        return f'{rdata[0]} {tag} "{value}"'
+    return rdata.hex()
+
+def parse_dns_response(data, record_type):
+    """خروجی: (شناسه، truncated، rcode، مقادیر پاسخ از نوع درخواستی)"""
+    query_id, flags, qdcount, ancount = struct.unpack('!HHHH', data[:8])
+    offset = 12
+    for _ in range(qdcount):
+        offset = _read_dns_name(data, offset)[1] + 4
+    
+    answers = []
+    for _ in range(ancount):
+        offset = _read_dns_name(data, offset)[1]
+        rtype, _, _, length = struct.unpack('!HHIH', data[offset:offset + 10])
+        offset += 10
+        if rtype == DNS_TYPES[record_type]:
+            answers.append(_format_rdata(data, offset, length, rtype))
+        offset += length
+    
+    return query_id, bool(flags & 0x0200), flags & 0x000F, answers
+
+def _dns_peer(host):
+    """
+    کلید تطبیق آدرس resolver با فرستنده پاسخ؛ شکل نوشتاری آدرس IPv6
+    (فشرده یا کامل) و zone id آن (%eth0) در مقایسه اثری ندارند.
+    """
+    host = host.split('%', 1)[0]
+    try:
+        return ipaddress.ip_address(host)
+    except ValueError:
+        return host
+
+class _DNSProtocol(asyncio.DatagramProtocol):
+    def __init__(self, client):
+        self.client = client
+
+    def datagram_received(self, data, addr):
+        self.client._resolve(data, addr)
+
+class DNSClient:
+    """
+    کلاینت DNS خام: همه پرس‌وجوهای هم‌زمان از یک سوکت UDP مشترک (برای هر
+    خانواده آدرس) ارسال و پاسخ‌ها با شناسه پیام به درخواست مربوط برگردانده
+    می‌شوند. سوکت‌ها بین پرس‌وجوها باز می‌مانند تا close فراخوانی شود.
+    پاسخ‌های truncated از طریق TCP تکرار می‌شوند.
+    """
+    def __init__(self, timeout=DNS_QUERY_TIMEOUT):
+        self.timeout = timeout
+        self._transports = {}
+        self._pending = {}
+
+    async def _transport(self, family):
+        if family not in self._transports:
+            loop = asyncio.get_running_loop()
+            local_addr = ('::', 0) if family == socket.AF_INET6 else ('0.0.0.0', 0)
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: _DNSProtocol(self), local_addr=local_addr, family=family
+            )
+            # پرس‌وجوی هم‌زمان دیگری زودتر سوکت را ساخته است
+            if family in self._transports:
+                transport.close()
+            else:
+                self._transports[family] = transport
+        return self._transports[family]
+
+    def _resolve(self, data, addr):
+        if len(data) < 12:
+            return
+        future = self._pending.get((struct.unpack('!H', data[:2])[0], _dns_peer(addr[0]), addr[1]))
+        if future and not future.done():
+            future.set_result(data)
+
+    async def _query_tcp(self, host, port, query):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), self.timeout)
+        try:
+            writer.write(struct.pack('!H', len(query)) + query)
+            await writer.drain()
+            length = struct.unpack('!H', await asyncio.wait_for(reader.readexactly(2), self.timeout))[0]
+            return await asyncio.wait_for(reader.readexactly(length), self.timeout)
+        finally:
+            await _close_writer(writer, self.timeout)
+
+    async def query(self, host, port, name, record_type):
+        """مقادیر رکورد از یک resolver؛ در صورت خطا یا timeout استثنا می‌دهد"""
+        family = socket.AF_INET6 if ':' in host else socket.AF_INET
+        transport = await self._transport(family)
+        peer = _dns_peer(host)
+        
+        query_id = random.randrange(0x10000)
+        while (query_id, peer, port) in self._pending:
+            query_id = random.randrange(0x10000)
+        
+        query = build_dns_query(query_id, name, record_type)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[(query_id, peer, port)] = future
+        try:
+            transport.sendto(query, (host, port))
+            data = await asyncio.wait_for(future, self.timeout)
+        finally:
+            self._pending.pop((query_id, peer, port), None)
+        
+        _, truncated, rcode, answers = parse_dns_response(data, record_type)
+        if truncated:
+            _, _, rcode, answers = parse_dns_response(await self._query_tcp(host, port, query), record_type)
+        if rcode not in (0, 3):
+            raise OSError(f"rcode {rcode}")
+        return answers
+
+    def close(self):
+        for transport in self._transports.values():
+            transport.close()
+        self._transports = {}
+
+def normalize_dns_value(record_type, value):
+    """یکسان‌سازی محتوای رکورد و پاسخ DNS برای مقایسه"""
+    value = value.strip()
+    if record_type == 'TXT':
+        return ''.join(re.findall(r'"((?:[^"\\]|\\.)*)"', value)) if value.startswith('"') else value
+    if record_type in ('A', 'AAAA'):
+        try:
+            return str(ipaddress.ip_address(value))
+        except ValueError:
+            return value
+    return value.rstrip('.').lower()
+
+class PropagationVerifier:
+    """بررسی هم‌زمان resolver ها تا زمانی که مقدار جدید را برگردانند"""
+    def __init__(self, resolvers=None, timeout=PROPAGATION_TIMEOUT, interval=PROPAGATION_POLL_INTERVAL,
+                 client=None):
+        self.resolvers = resolvers or PROPAGATION_RESOLVERS
+        self.timeout = timeout
+        self.interval = interval
+        self.client = client or DNSClient()
+        self._runs = 0
+
+    async def verify(self, name, record_type, expected, on_update=None):
+        """
+        خروجی: دیکشنری نام resolver -> وضعیت
+        (زمان رسیدن به مقدار جدید بر حسب ثانیه، آخرین مقدار دیده شده، پایان یافته)
+        """
+        expected = normalize_dns_value(record_type, expected)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.timeout
+        status = {label: [None, None, False] for label, _, _ in self.resolvers}
+        
+        async def watch(label, host, port):
+            while loop.time() < deadline:
+                try:
+                    answers = await self.client.query(host, port, name, record_type)
+                    values = [normalize_dns_value(record_type, answer) for answer in answers]
+                    status[label][1] = ', '.join(values) or '-'
+                    if expected in values:
+                        status[label][0] = loop.time() - started
+                        break
+                except (OSError, asyncio.TimeoutError, struct.error, IndexError) as e:
+                    status[label][1] = f"خطا: {e.__class__.__name__}"
+                
+                if on_update:
+                    await on_update(status)
+                await asyncio.sleep(min(self.interval, max(0, deadline - loop.time())))
+            
+            status[label][2] = True
+            if on_update:
+                await on_update(status)
+        
+        # سوکت‌های client در طول بررسی(های هم‌زمان) باز می‌مانند و با پایان آخرین بررسی بسته می‌شوند
+        self._runs += 1
+        try:
+            await asyncio.gather(*(watch(*resolver) for resolver in self.resolvers))
+        finally:
+            self._runs -= 1
+            if not self._runs:
+                self.client.close()
+        return status
+
+def format_propagation_status(name, record_type, expected, status, finished=False):
+    """متن وضعیت انتشار"""
+    text = f"🛰 **بررسی انتشار** `{record_type} {name}`\n"
+    text += f"📋 مقدار جدید: `{expected}`\n\n"
+    
+    for label, (elapsed, seen, done) in status.items():
+        if elapsed is not None:
+            text += f"✅ {label}: بعد از {elapsed:.0f} ثانیه\n"
+        elif done:
+            text += f"❌ {label}: منتشر نشد (آخرین پاسخ: `{seen}`)\n"
+        else:
+            text += f"⏳ {label}: `{seen or '...'}`\n"
+    
+    propagated = sum(1 for elapsed, _, _ in status.values() if elapsed is not None)
+    text += f"\n📊 {propagated} از {len(status)}"
+    if finished:
+        text += " - پایان بررسی"
+    return text
+
+def parse_schedule_times(text, now=None):
+    """
+    زمان‌های ورودی کاربر:
+    `03:00`، `2025-01-01 03:00`، `+30m` یا `+2h`؛ زمان دوم (اختیاری) زمان بازگشت است.
+    """
+    now = now or datetime.now()
+    times = []
+    
+    for part in re.findall(r'\d{4}-\d{2}-\d{2}\s+\d{1,2}:\d{2}|\+\d+[mh]|\d{1,2}:\d{2}', text):
+        try:
+            if part.startswith('+'):
+                amount = int(part[1:-1])
+                delta = timedelta(minutes=amount) if part.endswith('m') else timedelta(hours=amount)
+                times.append(now + delta)
+            elif '-' in part:
+                times.append(datetime.strptime(' '.join(part.split()), '%Y-%m-%d %H:%M'))
+            else:
+                hour, minute = (int(x) for x in part.split(':'))
+                if hour > 23 or minute > 59:
+                    return None
+                moment = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+                # ساعت گذشته یعنی فردا؛ زمان بازگشت هم بعد از زمان اول است
+                base = times[-1] if times else now
+                while moment <= base:
+                    moment += timedelta(days=1)
+                times.append(moment)
+        except (ValueError, OverflowError):
+            # تاریخ ناموجود (2025-02-30) یا مدت خارج از محدوده (+99999999999h)
+            return None
+    
+    if not times or len(times) > 2 or times[0] <= now or (len(times) == 2 and times[1] <= times[0]):
+        return None
+    return times
+
+# ===== آمار ترافیک =====
+ANALYTICS_FIELDS = ('requests', 'cachedRequests', 'bytes', 'cachedBytes', 'threats', 'pageViews')
+ANALYTICS_QUERY = """
+query ($zoneTag: string, $since: Time, $until: Time) {
+  viewer {
+    zones(filter: {zoneTag: $zoneTag}) {
+      httpRequests1hGroups(
+        limit: 1000
+        filter: {datetime_geq: $since, datetime_lt: $until}
+        orderBy: [datetime_ASC]
+      ) {
+        dimensions { datetime }
+        sum { %s }
+      }
+    }
+  }
+}
+""" % ' '.join(ANALYTICS_FIELDS)
+SPARK_CHARS = '▁▂▃▄▅▆▇█'
+
+def _to_api_time(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def _from_api_time(text):
+    return int(datetime.strptime(text, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc).timestamp())
+
+class ZoneAnalytics:
+    """
+    آمار ترافیک دامنه‌ها از GraphQL Analytics API.
+    سطل‌های ساعتی هر دامنه کش می‌شوند؛ به‌روزرسانی بعدی فقط از آخرین سطل
+    (که ممکن است ناقص باشد) به بعد را دریافت می‌کند.
+    """
+    def __init__(self, api_token, url=CF_GRAPHQL_URL, window_hours=ANALYTICS_WINDOW_HOURS, ttl=ANALYTICS_TTL):
+        self.url = url
+        self.window_hours = window_hours
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f"Bearer {api_token}"
+        self._cache = TTLCache(ttl)  # zone_id -> {شروع ساعت: تاپل مقادیر به ترتیب ANALYTICS_FIELDS}
+
+    def _query(self, zone_id, since, until):
+        """دریافت سطل‌های ساعتی [since, until) یک دامنه"""
+        response = self.session.post(
+            self.url,
+            json={
+                'query': ANALYTICS_QUERY,
+                'variables': {'zoneTag': zone_id, 'since': _to_api_time(since), 'until': _to_api_time(until)}
+            },
+            timeout=ANALYTICS_TIMEOUT
+        )
+        response.raise_for_status()
+        payload = response.json()
+        if payload.get('errors'):
+            raise RuntimeError(payload['errors'][0].get('message', 'GraphQL error'))
+        
+        zones = (payload.get('data') or {}).get('viewer', {}).get('zones') or []
+        groups = (zones[0].get('httpRequests1hGroups') or []) if zones else []
+        return {
+            _from_api_time(group['dimensions']['datetime']):
+                tuple(int(group['sum'].get(field) or 0) for field in ANALYTICS_FIELDS)
+            for group in groups
+        }
+
+    async def _refresh(self, zone_id):
+        now = time.time()
+        window_start = (int(now) // 3600 - self.window_hours + 1) * 3600
+        buckets = self._cache.peek(zone_id) or {}
+        since = max(max(buckets), window_start) if buckets else window_start
+        
+        loop = asyncio.get_running_loop()
+        fetched = await loop.run_in_executor(None, self._query, zone_id, since, now)
+        
+        merged = {start: values for start, values in buckets.items() if start >= window_start}
+        merged.update(fetched)
+        return merged
+
+    async def get_zone(self, zone_id):
+        """سطل‌های ساعتی بازه اخیر؛ درخواست‌های هم‌زمان یک دامنه یک درخواست مشترک دارند"""
+        return await self._cache.get(zone_id, self._refresh)
+
+    async def get_zones(self, zone_ids):
+        """آمار هم‌زمان چند دامنه؛ خطای هر دامنه به جای نتیجه آن برگردانده می‌شود"""
+        results = await asyncio.gather(*(self.get_zone(zone_id) for zone_id in zone_ids), return_exceptions=True)
+        for zone_id, result in zip(zone_ids, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error getting analytics for {zone_id}: {result}")
+        return dict(zip(zone_ids, results))
+
+def summarize_analytics(buckets, bucket_hours=ANALYTICS_DISPLAY_BUCKET_HOURS, window_hours=ANALYTICS_WINDOW_HOURS):
+    """جمع کل مقادیر و سری درخواست‌ها با سطل‌های bucket_hours ساعته"""
+    totals = dict.fromkeys(ANALYTICS_FIELDS, 0)
+    series = [0] * math.ceil(window_hours / bucket_hours)
+    end = (int(time.time()) // 3600 + 1) * 3600
+    
+    for start, values in buckets.items():
+        for field, value in zip(ANALYTICS_FIELDS, values):
+            totals[field] += value
+        slot = len(series) - 1 - (end - start - 1) // (bucket_hours * 3600)
+        if 0 <= slot < len(series):
+            series[slot] += values[0]
+    return totals, series
+
+def sparkline(values):
+    peak = max(values) if values else 0
+    if not peak:
+        return SPARK_CHARS[0] * len(values)
+    return ''.join(SPARK_CHARS[min(len(SPARK_CHARS) - 1, value * len(SPARK_CHARS) // peak)] for value in values)
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if size < 1024 or unit == 'TB':
+            return f"{size:.1f} {unit}" if unit != 'B' else f"{size} B"
+        size /= 1024
+
+def format_zone_analytics(buckets):
+    """متن آمار ترافیک یک دامنه"""
+    if isinstance(buckets, Exception):
+        return "  ⚠️ آمار ترافیک در دسترس نیست\n"
+    
+    totals, series = summarize_analytics(buckets)
+    cache_ratio = 100 * totals['cachedRequests'] / totals['requests'] if totals['requests'] else 0
+    return (
+        f"  📶 درخواست‌ها ({ANALYTICS_WINDOW_HOURS}h): {totals['requests']:,}\n"
+        f"  `{sparkline(series)}`\n"
+        f"  💾 نسبت کش: {cache_ratio:.1f}% | پهنای باند: {format_bytes(totals['bytes'])}\n"
+        f"  🛡️ تهدیدها: {totals['threats']:,} | بازدید صفحه: {totals['pageViews']:,}\n"
+    )
+
+# ===== تنظیمات دامنه‌ها =====
+ZONE_SETTINGS = {  # شناسه تنظیم -> (عنوان ستون، مقادیر مجاز؛ None برای minify)
+    'ssl': ('SSL', ('off', 'flexible', 'full', 'strict')),
+    'always_use_https': ('HTTPS', ('on', 'off')),
+    'development_mode': ('Dev', ('on', 'off')),
+    'minify': ('Minify', None)
+}
+MINIFY_TYPES = ('css', 'html', 'js')
+
+def parse_setting_value(setting, text):
+    """تبدیل مقدار وارد شده به مقدار API؛ برای مقدار نامعتبر ValueError"""
+    if setting not in ZONE_SETTINGS:
+        raise ValueError(f"تنظیم ناشناخته؛ تنظیمات: {', '.join(ZONE_SETTINGS)}")
+    
+    text = text.strip().lower()
+    allowed = ZONE_SETTINGS[setting][1]
+    if allowed is not None:
+        if text not in allowed:
+            raise ValueError(f"مقدار {setting} باید یکی از {', '.join(allowed)} باشد")
+        return text
+    
+    # minify: off یا ترکیبی از css، html و js (مثل css,js)
+    enabled = set() if text == 'off' else set(filter(None, re.split(r'[,+\s]+', text)))
+    if enabled - set(MINIFY_TYPES):
+        raise ValueError(f"minify باید off یا ترکیبی از {', '.join(MINIFY_TYPES)} باشد")
+    return {kind: 'on' if kind in enabled else 'off' for kind in MINIFY_TYPES}
+
+def format_setting_value(setting, value):
+    """نمایش کوتاه مقدار تنظیم برای جدول مقایسه"""
+    if value is None:
+        return '-'
+    if setting == 'minify' and isinstance(value, dict):
+        enabled = [kind for kind in MINIFY_TYPES if value.get(kind) == 'on']
+        return '+'.join(enabled) if enabled else 'off'
+    return str(value)
+
+class ZoneSettingsStore:
+    """
+    کش تنظیمات دامنه‌ها.
+    تنظیمات هر دامنه با یک درخواست bulk دریافت می‌شود؛ دامنه‌ها هم‌زمان
+    (حداکثر ZONE_SETTINGS_CONCURRENCY) و درخواست‌های هم‌زمان یک دامنه مشترک هستند.
+    """
+    def __init__(self, manager, ttl=ZONE_SETTINGS_TTL, concurrency=ZONE_SETTINGS_CONCURRENCY):
+        self.manager = manager
+        self.concurrency = concurrency
+        self._cache = TTLCache(ttl)
+        self._semaphore = None
+
+    async def _refresh(self, zone_id):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.manager.fetch_zone_settings, zone_id)
+
+    def fetched_at(self, zone_id):
+        return self._cache.fetched_at(zone_id)
+
+    async def get_zone(self, zone_id, max_age=None):
+        """تنظیمات دامنه از کش یا API (max_age=0 یعنی حتما دریافت دوباره)"""
+        return await self._cache.get(zone_id, self._refresh, max_age)
+
+    async def get_zones(self, zone_ids, max_age=None):
+        """تنظیمات هم‌زمان چند دامنه؛ خطای هر دامنه به جای نتیجه آن برگردانده می‌شود"""
+        results = await asyncio.gather(
+            *(self.get_zone(zone_id, max_age) for zone_id in zone_ids), return_exceptions=True
+        )
+        for zone_id, result in zip(zone_ids, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error getting settings for {zone_id}: {result}")
+        return dict(zip(zone_ids, results))
+
+    def _apply_batched(self, zones, setting, value, batch_size, delay):
+        """اجرا در executor؛ خروجی: (شناسه دامنه‌های موفق، لیست خطاها)"""
+        tasks = [
+            ((zone_name, zone_id), self.manager.update_zone_settings, (zone_id, {setting: value}))
+            for zone_name, zone_id in zones
+        ]
+        
+        applied, errors = [], []
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for (zone_name, zone_id), success, message in _run_batched(pool, tasks, batch_size, delay):
+                if success:
+                    applied.append(zone_id)
+                else:
+                    errors.append(f"{zone_name}: {message}")
+        
+        return applied, errors
+
+    async def apply(self, zones, setting, value, batch_size=ZONE_SETTINGS_BATCH_SIZE, delay=ZONE_SETTINGS_BATCH_DELAY):
+        """
+        اعمال یک تنظیم روی چند دامنه [(نام، شناسه)] به صورت هم‌زمان و دسته‌ای.
+        کش دامنه‌های موفق به‌روز می‌شود. خروجی: (تعداد موفق، لیست خطاها)
+        """
+        loop = asyncio.get_running_loop()
+        applied, errors = await loop.run_in_executor(
+            None, self._apply_batched, zones, setting, value, batch_size, delay
+        )
+        
+        # کش فقط در thread حلقه تغییر می‌کند
+        for zone_id in applied:
+            cached = self._cache.peek(zone_id)
+            if cached is not None:
+                cached[setting] = value
+        return len(applied), errors
+
+def format_settings_matrix(zones, settings):
+    """جدول مقایسه تنظیمات اصلی دامنه‌ها (هر سطر یک دامنه)"""
+    headers = ['Zone'] + [label for label, _ in ZONE_SETTINGS.values()]
+    rows = []
+    for zone_name, zone_id in zones:
+        values = settings.get(zone_id)
+        if isinstance(values, Exception) or values is None:
+            rows.append([zone_name] + ['⚠'] * len(ZONE_SETTINGS))
+            continue
+        rows.append([zone_name] + [format_setting_value(setting, values.get(setting)) for setting in ZONE_SETTINGS])
+    
+    widths = [max(len(row[i]) for row in [headers] + rows) for i in range(len(headers))]
+    widths[0] = min(widths[0], 24)
+    lines = [
+        '  '.join(cell[:width].ljust(width) for cell, width in zip(row, widths)).rstrip()
+        for row in [headers] + rows
+    ]
+    return '\n'.join(lines)
+
+# ===== پروفایل عملکرد =====
+def _code_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class SamplingProfiler:
+    """
+    پروفایلر نمونه‌برداری CPU: یک thread جدا پشته همه thread ها را در فواصل
+    ثابت می‌خواند. در حالت خاموش هیچ hook یا thread ای فعال نیست.
+    """
+    # فریم‌هایی از این فایل که هندلر نیستند و فقط آن را صدا می‌زنند
+    PASS_THROUGH = {'main', 'wrapper', '<module>'}
+
+    def __init__(self, interval=PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.started_at = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._reset()
+
+    def _reset(self):
+        self.samples = 0
+        self.self_counts = {}
+        self.total_counts = {}
+        self.handler_counts = {}
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        self._reset()
+        self._stop.clear()
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._sample_loop, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """توقف و برگرداندن گزارش متنی"""
+        self._stop.set()
+        self._thread.join()
+        duration = time.monotonic() - self.started_at
+        self._thread = None
+        return self.report(duration)
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        main_id = threading.main_thread().ident
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self._sample(frame, thread_id == main_id, names.get(thread_id, str(thread_id)))
+            self.samples += 1
+
+    def _sample(self, frame, is_main, thread_name):
+        stack = []
+        while frame is not None:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        
+        # بیرونی‌ترین فریم این فایل = هندلر یا تابع اجرا شده در executor
+        handler = next(
+            (code for code in reversed(stack)
+             if code.co_filename == __file__ and code.co_name not in self.PASS_THROUGH),
+            None
+        )
+        if handler is None and not is_main:
+            # thread بیکار (executor منتظر کار، listener لاگ و ...)
+            return
+        
+        if handler is None:
+            label = "(حلقه رویداد / کتابخانه‌ها)"
+        elif is_main:
+            label = handler.co_name
+        else:
+            label = f"{thread_name}: {handler.co_name}"
+        self.handler_counts[label] = self.handler_counts.get(label, 0) + 1
+        
+        top = stack[0]
+        self.self_counts[top] = self.self_counts.get(top, 0) + 1
+        for code in set(stack):
+            self.total_counts[code] = self.total_counts.get(code, 0) + 1
+
+    def report(self, duration):
+        lines = [
+            "CPU profile",
+            f"window: {duration:.1f}s, samples: {self.samples}, interval: {self.interval * 1000:.0f}ms",
+            ""
+        ]
+        
+        def table(title, counts, label):
+            total = sum(self.handler_counts.values()) or 1
+            lines.append(title)
+            lines.append(f"{'%':>6} {'samples':>8}  name")
+            for key, count in sorted(counts.items(), key=lambda item: -item[1])[:PROFILE_TOP_N]:
+                lines.append(f"{100 * count / total:6.1f} {count:8d}  {label(key)}")
+            lines.append("")
+        
+        table("Per-handler time", self.handler_counts, str)
+        table("Top functions (self)", self.self_counts, _code_label)
+        table("Top functions (cumulative)", self.total_counts, _code_label)
+        return "\n".join(lines)
+
+class MemoryTracer:
+    """ردیابی تخصیص حافظه با tracemalloc در یک بازه زمانی"""
+    def __init__(self, frames=TRACEMALLOC_FRAMES):
+        self.frames = frames
+        self.started_at = None
+        self._baseline = None
+
+    @property
+    def running(self):
+        return self._baseline is not None
+
+    def start(self):
+        tracemalloc.start(self.frames)
+        self.started_at = time.monotonic()
+        self._baseline = tracemalloc.take_snapshot()
+
+    def stop(self):
+        """گرفتن snapshot نهایی، توقف ردیابی و برگرداندن گزارش متنی"""
+        ignore = (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            tracemalloc.Filter(False, "<unknown>")
+        )
+        snapshot = tracemalloc.take_snapshot().filter_traces(ignore)
+        baseline = self._baseline.filter_traces(ignore)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        duration = time.monotonic() - self.started_at
+        self._baseline = None
+        
+        lines = [
+            "Memory trace",
+            f"window: {duration:.1f}s, traced now: {current / 1024:.1f} KiB, peak: {peak / 1024:.1f} KiB",
+            "",
+            "Largest allocation sites"
+        ]
+        for stat in snapshot.statistics('lineno')[:PROFILE_TOP_N]:
+            lines.append(f"{stat.size / 1024:10.1f} KiB {stat.count:8d} blocks  {stat.traceback[0]}")
+        
+        lines += ["", "Growth during window"]
+        for stat in snapshot.compare_to(baseline, 'lineno')[:PROFILE_TOP_N]:
+            lines.append(f"{stat.size_diff / 1024:+10.1f} KiB {stat.count_diff:+8d} blocks  {stat.traceback[0]}")
+        
+        lines += ["", "Top allocation tracebacks"]
+        for stat in snapshot.statistics('traceback')[:3]:
+            lines.append(f"{stat.size / 1024:.1f} KiB in {stat.count} blocks")
+            lines += [f"    {line}" for line in stat.traceback.format()]
+        return "\n".join(lines)
+
+# ===== پردازش سنگین در process جدا =====
+class WorkerJobError(Exception):
+    """شکست، لغو یا عبور از سقف حافظه یک کار سنگین"""
+
+class WorkerJob:
+    """یک کار سنگین و وضعیت آن"""
+    def __init__(self, job_id, description, func, args):
+        self.id = job_id
+        self.description = description
+        self.func = func
+        self.args = args
+        self.state = 'queued'  # queued, running, done, failed, cancelled
+        self.progress = 0.0
+        self.progress_text = ''
+        self.error = None
+        self.created_at = time.monotonic()
+        self.finished_at = None
+        self.process = None
+        self.on_progress = None
+        self.future = None
+
+def _worker_main(conn, func, args, memory_limit):
+    """اجرا در process کاری: نتیجه، خطا و پیشرفت از طریق pipe برگردانده می‌شوند"""
+    if memory_limit and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    
+    last_sent = [0.0]
+    
+    def progress(fraction, text=''):
+        now = time.monotonic()
+        if now - last_sent[0] >= 0.5 or fraction >= 1:
+            last_sent[0] = now
+            conn.send(('progress', fraction, text))
+    
+    try:
+        conn.send(('done', func(*args, progress=progress)))
+    except MemoryError:
+        conn.send(('error', "از سقف حافظه مجاز عبور کرد"))
+    except Exception as e:
+        conn.send(('error', f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+class WorkerPool:
+    """
+    اجرای کارهای CPU-bound در process های جدا تا حلقه asyncio آزاد بماند.
+    حداکثر processes کار هم‌زمان اجرا و بقیه در صف می‌مانند. هر کار process
+    خودش را دارد، پس لغو آن (terminate) روی بقیه اثری ندارد.
+    تابع کار باید آرگومان کلیدی progress(fraction, text) را بپذیرد.
+    """
+    def __init__(self, processes=WORKER_PROCESSES, memory_limit=WORKER_MEMORY_LIMIT, history=WORKER_JOB_HISTORY):
+        self.processes = processes
+        self.memory_limit = memory_limit
+        self.history = history
+        self.jobs = OrderedDict()
+        self._next_id = 1
+        self._slots = None
+        # spawn: process تازه بدون thread ها، قفل‌ها و حافظه process اصلی؛
+        # کارها فقط با آرگومان‌هایشان کار می‌کنند و به instance های ماژول دسترسی ندارند
+        self._context = multiprocessing.get_context('spawn')
+
+    def submit(self, func, *args, description='', on_progress=None):
+        """ثبت کار؛ نتیجه با await job.future دریافت می‌شود"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.processes)
+        
+        job = WorkerJob(self._next_id, description or func.__name__, func, args)
+        job.on_progress = on_progress
+        job.future = asyncio.get_running_loop().create_future()
+        self._next_id += 1
+        self.jobs[job.id] = job
+        asyncio.ensure_future(self._run(job))
+        return job
+
+    def cancel(self, job_id):
+        """لغو کار در صف یا در حال اجرا"""
+        job = self.jobs.get(job_id)
+        if not job or job.state not in ('queued', 'running'):
+            return False
+        
+        if job.process is not None and job.process.is_alive():
+            job.process.terminate()
+        self._finish(job, 'cancelled', error="لغو شد")
+        return True
+
+    def _finish(self, job, state, result=None, error=None):
+        if job.future.done():
+            return
+        job.state = state
+        job.error = error
+        job.finished_at = time.monotonic()
+        if state == 'done':
+            job.future.set_result(result)
+        else:
+            job.future.set_exception(WorkerJobError(error))
+            # جلوگیری از هشدار "exception was never retrieved"
+            job.future.exception()
+        self._trim()
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+    def _handle(self, job, message):
+        kind = message[0]
+        if kind == 'progress':
+            job.progress, job.progress_text = message[1], message[2]
+            if job.on_progress:
+                asyncio.ensure_future(job.on_progress(job))
+        elif kind == 'done':
+            self._finish(job, 'done', result=message[1])
+        else:
+            self._finish(job, 'failed', error=message[1])
+
+    def _pump(self, job, conn, loop):
+        """خواندن پیام‌های process کاری در یک thread (نتیجه بزرگ حلقه را قفل نمی‌کند)"""
+        try:
+            while True:
+                loop.call_soon_threadsafe(self._handle, job, conn.recv())
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    async def _run(self, job):
+        async with self._slots:
+            if job.state != 'queued':
+                return
+            
+            loop = asyncio.get_running_loop()
+            parent_conn, child_conn = self._context.Pipe(duplex=False)
+            job.process = self._context.Process(
+                target=_worker_main,
+                args=(child_conn, job.func, job.args, self.memory_limit),
+                name=f"worker-job-{job.id}",
+                daemon=True
+            )
+            job.state = 'running'
+            try:
+                job.process.start()
+            except Exception as e:
+                logger.error(f"Error starting worker process: {e}")
+                self._finish(job, 'failed', error=f"شروع process کاری ممکن نشد: {e}")
+                parent_conn.close()
+                return
+            finally:
+                child_conn.close()
+            
+            await loop.run_in_executor(None, self._pump, job, parent_conn, loop)
+            await loop.run_in_executor(None, job.process.join)
+            
+            # process بدون ارسال نتیجه تمام شد (مثلاً kill شدن به خاطر حافظه)
+            self._finish(job, 'failed', error=f"process کاری با کد {job.process.exitcode} متوقف شد")
+            job.process = None
+
+def format_worker_job(job):
+    """یک خط وضعیت کار سنگین"""
+    icon = {'queued': '⏳', 'running': '⚙️', 'done': '✅', 'failed': '❌', 'cancelled': '⏹️'}[job.state]
+    text = f"{icon} #{job.id} {job.description}"
+    if job.state == 'running':
+        text += f" - {job.progress * 100:.0f}%"
+        if job.progress_text:
+            text += f" ({job.progress_text})"
+    elif job.error:
+        text += f" - {job.error}"
+    return text
+
+def job_snapshot_diff(zones, blobs, progress):
+    """کار سنگین: تفاوت دو snapshot از روی blob های خوانده شده در process اصلی"""
+    return diff_snapshot_zones(zones, blobs, progress=progress)
+
+def job_parse_desired_state(raw, filename, progress):
+    """کار سنگین: خواندن و اعتبارسنجی فایل وضعیت مطلوب"""
+    zone_name, entries = load_desired_state(raw, filename)
+    progress(0.5, "اعتبارسنجی")
+    return (zone_name,) + build_desired_records(entries, zone_name)
+
+def job_plan_ip_rules(raw, existing, mode, replace, progress):
+    """کار سنگین: خواندن لیست IP و محاسبه برنامه قوانین"""
+    networks, errors = parse_ip_list(raw)
+    progress(0.5, f"حذف تکراری‌ها از {len(networks)} شبکه")
+    return (len(networks), errors) + plan_ip_rules(existing, networks, mode, replace)
+
+# ===== ایجاد instance ها =====
+# process های کاری (spawn) فقط توابع job_* را اجرا می‌کنند؛ ساختن instance ها (و خواندن
+# فایل‌های وضعیت) فقط در process اصلی انجام می‌شود تا کارها سریع شروع شوند
+if IS_MAIN_PROCESS:
+    cf_manager = CloudflareManager(CF_API_TOKEN)
+    change_logger = ChangeLogger()
+    zone_store = ZoneStore(cf_manager)
+    record_index = RecordIndex(zone_store)
+    snapshot_store = SnapshotStore()
+    job_scheduler = JobScheduler(cf_manager)
+    failover_engine = FailoverEngine(cf_manager)
+    propagation_verifier = PropagationVerifier()
+    watch_list = WatchList(zone_store)
+    purge_queue = PurgeQueue(cf_manager)
+    zone_settings = ZoneSettingsStore(cf_manager)
+    zone_analytics = ZoneAnalytics(CF_API_TOKEN)
+    cpu_profiler = SamplingProfiler()
+    memory_tracer = MemoryTracer()
+    profiling_windows = {}  # نوع -> Event توقف زودهنگام
+    worker_pool = WorkerPool()
+
+# ===== دکوریتور چک ادمین =====
+def admin_only(func):
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user_id = update.effective_user.id
+        if user_id not in ADMIN_IDS:
+            if update.inline_query:
+                await update.inline_query.answer([], cache_time=0, is_personal=True)
+                return ConversationHandler.END
+            await update.effective_message.reply_text("⛔ شما اجازه استفاده از این ربات را ندارید.")
+            return ConversationHandler.END
+        return await func(update, context)
+    return wrapper
+
+# ===== snapshot ها =====
+def records_changed(zone_id):
+    """بعد از هر تغییر: حذف کش دامنه و به‌روزرسانی ایندکس در درخواست بعدی"""
+    zone_store.invalidate(zone_id)
+    record_index.mark_stale()
+    watch_list.poke(zone_id)
+
+def _snapshot_written(future):
+    if not future.cancelled() and future.exception():
+        logger.error(f"Error taking pre-change snapshot: {future.exception()}")
+
+async def snapshot_before_change(zone_id, zone_name, records=None):
+    """
+    snapshot از وضعیت فعلی دامنه قبل از هر تغییر.
+    رکوردهای تازه مخزن (یا records داده شده) بدون درخواست دوباره استفاده
+    می‌شوند و فشرده‌سازی و نوشتن در پس‌زمینه انجام می‌شود.
+    خروجی: future نوشتن snapshot (None اگر رکوردها دریافت نشدند)
+    """
+    if records is None:
+        try:
+            records = await zone_store.fetch_records(zone_id, max_age=SNAPSHOT_PRE_CHANGE_MAX_AGE)
+        except Exception as e:
+            logger.error(f"Error taking pre-change snapshot: {e}")
+            return
+    
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(None, snapshot_store.snapshot, {zone_id: (zone_name, records)}, 'pre-change')
+    future.add_done_callback(_snapshot_written)
+    return future
+
+# ===== بررسی انتشار =====
+def record_fqdn(name, zone_name):
+    """نام کامل رکورد (ورودی کاربر ممکن است نسبی یا @ باشد)"""
+    name = name.strip().rstrip('.').lower()
+    if name in ('@', ''):
+        return zone_name
+    if name == zone_name or name.endswith('.' + zone_name):
+        return name
+    return f"{name}.{zone_name}"
+
+async def run_propagation_check(message, name, record_type, expected):
+    """پیام وضعیت انتشار را ارسال و تا پایان بررسی به‌روز می‌کند"""
+    status_message = await message.reply_text(
+        format_propagation_status(name, record_type, expected, {label: [None, None, False] for label, _, _ in PROPAGATION_RESOLVERS}),
+        parse_mode='Markdown'
+    )
+    last = {'text': None, 'time': 0}
+    
+    async def on_update(status, finished=False):
+        text = format_propagation_status(name, record_type, expected, status, finished)
+        # محدودیت ویرایش پیام در تلگرام
+        if text == last['text'] or (not finished and time.monotonic() - last['time'] < 2):
+            return
+        last.update(text=text, time=time.monotonic())
+        try:
+            await status_message.edit_text(text, parse_mode='Markdown')
+        except Exception as e:
+            logger.debug(f"Error editing propagation status: {e}")
+    
+    try:
+        status = await propagation_verifier.verify(name, record_type, expected, on_update)
+        await on_update(status, finished=True)
+    except Exception as e:
+        logger.error(f"Error verifying propagation: {e}")
+
+def start_propagation_check(message, zone_name, record_name, record_type, content, proxied):
+    """شروع بررسی انتشار در پس‌زمینه (برای رکوردهای proxied معنی ندارد)"""
+    if not VERIFY_PROPAGATION or (proxied and record_type in ['A', 'AAAA', 'CNAME']):
+        return
+    
+    asyncio.ensure_future(run_propagation_check(
+        message, record_fqdn(record_name, zone_name), record_type, content
+    ))
+
+# ===== هندلرهای اصلی =====
+@admin_only
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """شروع ربات"""
+    user = update.effective_user
+    
+    # پاک کردن داده‌های قبلی
+    context.user_data.clear()
+    
+    await update.message.reply_text(
+        f"🌐 **ربات مدیریت Cloudflare**\n\n"
+        f"سلام {user.first_name} عزیز! 👋\n\n"
+        "از منوی زیر گزینه مورد نظر را انتخاب کنید:",
+        reply_markup=get_main_keyboard(),
+        parse_mode='Markdown'
+    )
+    
+    return MAIN_MENU
+
+async def main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """پردازش منوی اصلی"""
+    text = update.message.text
+    user_id = update.effective_user.id
+    
+    if text == "🌐 لیست دامنه‌ها":
+        zones = await zone_store.get_zones()
+        if not zones:
+            await update.message.reply_text("❌ هیچ دامنه‌ای یافت نشد!")
+            return MAIN_MENU
+        
+        # قدم بعدی تقریباً همیشه انتخاب دامنه است
+        zone_store.prefetch([zone_id for _, zone_id in zones])
+        
+        if INLINE_KEYBOARDS:
+            # ناوبری بعدی با ویرایش همین پیام انجام می‌شود
+            await update.message.reply_text(
+                "🔍 دامنه مورد نظر را انتخاب کنید:",
+                reply_markup=get_domains_inline_keyboard(zones)
+            )
+            return MAIN_MENU
+        
+        await update.message.reply_text(
+            "🔍 دامنه مورد نظر را انتخاب کنید:",
+            reply_markup=get_domains_keyboard(zones)
+        )
+        return SELECT_DOMAIN
+    
+    elif text == "➕ رکورد جدید":
+        zones = await zone_store.get_zones()
+        if not zones:
+            await update.message.reply_text("❌ هیچ دامنه‌ای یافت نشد!")
+            return MAIN_MENU
+        
+        context.user_data['action'] = 'add_record'
+        await update.message.reply_text(
+            "دامنه‌ای که می‌خواهید رکورد جدید به آن اضافه کنید را انتخاب کنید:",
+            reply_markup=get_domains_keyboard(zones)
+        )
+        return ADD_RECORD_DOMAIN
+    
+    elif text == "🔍 جستجو":
+        await update.message.reply_text(
+            "🔍 عبارت مورد نظر برای جستجو را وارد کنید:\n\n"
+            "می‌توانید نام رکورد یا محتوای آن را جستجو کنید.",
+            reply_markup=get_cancel_keyboard()
+        )
+        return SEARCH_QUERY
+    
+    elif text == "🧭 جستجوی IP":
+        await update.message.reply_text(
+            "🧭 IP، CIDR یا بازه IP را وارد کنید:\n\n"
+            "مثال‌ها: `203.0.113.7`، `203.0.113.0/24`، `203.0.113.10-203.0.113.50`، `2001:db8::/32`\n"
+            "رکوردهای A/AAAA همه دامنه‌ها که به آن اشاره می‌کنند نمایش داده می‌شوند.",
+            reply_markup=get_cancel_keyboard(),
+            parse_mode='Markdown'
+        )
+        return IP_QUERY
+    
+    elif text == "📊 گزارشات":
+        logs = change_logger.get_recent_logs(15)
+        if not logs:
+            await update.message.reply_text(
+                "📊 هیچ گزارشی ثبت نشده است!",
+                reply_markup=get_main_keyboard()
+            )
+            return MAIN_MENU
+        
+        text = "📊 **گزارش تغییرات اخیر:**\n\n"
+        for log in logs:
+            action_emoji = {
+                'CREATE': '➕',
+                'UPDATE': '✏️',
+                'DELETE': '🗑️',
+                'PROXY_TOGGLE': '🔄',
+                'RESTORE': '⏪',
+                'SCHEDULED': '⏰',
+                'FAILOVER': '🚨',
+                'SYNC': '📥',
+                'PURGE': '🧹',
+                'IP_RULES': '🛡️',
+                'SETTINGS': '⚙️'
+            }.get(log['action'], '📌')
+            
+            text += f"{action_emoji} {log['timestamp']}\n"
+            text += f"👤 {log['username']}\n"
+            text += f"🌐 {log['domain']} - {log['record_name']}\n"
+            text += f"📝 {log['details']}\n\n"
+        
+        await update.message.reply_text(
+            text,
+            reply_markup=get_main_keyboard(),
+            parse_mode='Markdown'
+        )
+        return MAIN_MENU
+    
+    elif text == "📈 آمار":
+        zones = await zone_store.get_zones()
+        total_records = 0
+        
+        text = "📈 **آمار کلی سیستم:**\n\n"
+        text += f"🌐 تعداد دامنه‌ها: {len(zones)}\n\n"
+        
+        # آمار ترافیک همه دامنه‌ها هم‌زمان (با کش)
+        analytics = await zone_analytics.get_zones([zone_id for _, zone_id in zones])
+        
+        for zone_name, zone_id in zones:
+            records = await zone_store.get_records(zone_id)
+            total_records += len(records)
+            
+            type_counts = {}
+            for record in records:
+                record_type = record['type']
+                type_counts[record_type] = type_counts.get(record_type, 0) + 1
+            
+            text += f"**{zone_name}:**\n"
+            for rtype, count in sorted(type_counts.items()):
+                text += f"  • {rtype}: {count}\n"
+            text += f"  📊 مجموع: {len(records)}\n"
+            text += format_zone_analytics(analytics[zone_id]) + "\n"
+        
+        text += f"💠 **مجموع کل رکوردها: {total_records}**\n"
+        
+        issues = audit_records(zones, zone_store.cached_records())
+        issue_count = sum(len(found) for found in issues.values())
+        text += f"🩺 بررسی سلامت: {issue_count} مورد" + (" - /audit" if issue_count else " ✅")
+        
+        await update.message.reply_text(
+            text,
+            reply_markup=get_main_keyboard(),
+            parse_mode='Markdown'
+        )
+        return MAIN_MENU
+    
+    elif text == "❓ راهنما":
+        help_text = """
+❓ **راهنمای استفاده از ربات**
+
+**دستورات:**
+- /start - شروع ربات
+- /cancel - لغو عملیات جاری
+- /snapshot - ثبت snapshot از رکوردهای همه دامنه‌ها
+- /snapshots - لیست snapshot ها
+- /snapdiff A B - تفاوت دو snapshot
+- /restore ID - بازگردانی رکوردها به یک snapshot
+- /sync ZONE - دریافت فایل وضعیت دامنه؛ ارسال فایل yaml/json برای همگام‌سازی
+- /jobs - لیست تغییرات زمان‌بندی شده
+- /canceljob ID - لغو تغییر زمان‌بندی شده
+- /failover_add - ثبت failover خودکار برای یک رکورد
+- /failover_list - لیست failover ها
+- /failover_remove ID - حذف failover
+- /watch VALUE - اشتراک تغییرات دامنه، نام یا الگو
+- /watches - لیست اشتراک‌ها
+- /unwatch ID - حذف اشتراک
+- /purge ZONE everything|url|prefix|tag|host VALUES - پاکسازی کش
+- /iprules [ZONE] - قوانین دسترسی IP؛ ارسال فایل txt/csv با caption «ZONE block|allow|challenge [replace]»
+- /settings [refresh] - مقایسه تنظیمات دامنه‌ها (SSL، HTTPS، Dev، Minify)
+- /setsetting SETTING VALUE ZONE...|all - اعمال یک تنظیم روی چند دامنه
+- /audit - بررسی سلامت رکوردها (CNAME بی‌مقصد، تکراری، متناقض، TTL ناهمسان)
+- /profile [ثانیه|stop] - پروفایل CPU و ارسال گزارش
+- /memtrace [ثانیه|stop] - ردیابی حافظه و ارسال گزارش
+- /tasks - وضعیت کارهای سنگین
+- /killtask ID - لغو کار سنگین
+
+**قابلیت‌ها:**
+🌐 **مدیریت دامنه‌ها:**
+- مشاهده لیست دامنه‌ها و رکوردها
+- صفحه‌بندی برای نمایش همه رکوردها
+- مدیریت کامل رکوردهای DNS
+
+✏️ **ویرایش رکوردها:**
+- تغییر محتوای رکورد
+- تغییر نوع رکورد
+- تغییر وضعیت Proxy
+
+➕ **افزودن رکورد جدید**
+
+🗑️ **حذف رکورد**
+
+🔍 **جستجو در رکوردها**
+- در هر چتی `@نام_ربات` و بخشی از نام یا محتوای رکورد را تایپ کنید
+  (Inline Mode باید در @BotFather فعال باشد)
+- «🧭 جستجوی IP»: رکوردهای A/AAAA که در یک IP، CIDR یا بازه IP هستند
+
+📊 **گزارشات و آمار**
+
+**نکات:**
+- از دکمه‌های ناوبری برای حرکت بین صفحات استفاده کنید
+- تمام تغییرات در سیستم ثبت می‌شود
+        """
+        
+        await update.message.reply_text(
+            help_text,
+            reply_markup=get_main_keyboard(),
+            parse_mode='Markdown'
+        )
+        return MAIN_MENU
+    
+    return MAIN_MENU
+
+async def select_domain(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """انتخاب دامنه"""
+    text = update.message.text
+    
+    if text == "🔙 بازگشت به منو":
+        await update.message.reply_text(
+            "منوی اصلی:",
+            reply_markup=get_main_keyboard()
+        )
+        return MAIN_MENU
+    
+    # پیدا کردن دامنه
+    zone_name = text.replace("🌐 ", "")
+    zones = await zone_store.get_zones()
+    zone_id = await zone_store.get_zone_id(zone_name)
+    
+    if not zone_id:
+        await update.message.reply_text("❌ دامنه یافت نشد!")
+        return SELECT_DOMAIN
+    
+    # ذخیره اطلاعات
+    context.user_data['current_zone_id'] = zone_id
+    context.user_data['current_zone_name'] = zone_name
+    context.user_data['current_page'] = 1
+    
+    # دریافت رکوردها (مشترک بین همه ادمین‌ها)
+    records = await zone_store.get_records(zone_id)
+    
+    if not records:
+        await update.message.reply_text(
+            "❌ هیچ رکوردی یافت نشد!",
+            reply_markup=get_domains_keyboard(zones)
+        )
+        return SELECT_DOMAIN
+    
+    await update.message.reply_text(
+        f"📋 رکوردهای دامنه **{zone_name}**\n"
+        f"تعداد: {len(records)} رکورد\n\n"
+        "رکورد مورد نظر را انتخاب کنید:",
+        reply_markup=get_records_keyboard_paginated(records, page=1),
+        parse_mode='Markdown'
+    )
+    
+    return SELECT_RECORD
+
+async def navigate_records(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ناوبری بین صفحات رکوردها"""
+    text = update.message.text
+    
+    records = await zone_store.get_records(context.user_data.get('current_zone_id'))
+    current_page = context.user_data.get('current_page', 1)
+    zone_name = context.user_data.get('current_zone_name', '')
+    
+    # تغییر صفحه
+    if "⬅️ صفحه قبل" in text:
+        current_page = max(1, current_page - 1)
+    elif "صفحه بعد ➡️" in text:
+        total_pages = math.ceil(len(records) / RECORDS_PER_PAGE)
+        current_page = min(total_pages, current_page + 1)
+    
+    context.user_data['current_page'] = current_page
+    
+    await update.message.reply_text(
+        f"📋 رکوردهای دامنه **{zone_name}**\n"
+        f"تعداد: {len(records)} رکورد\n\n"
+        "رکورد مورد نظر را انتخاب کنید:",
+        reply_markup=get_records_keyboard_paginated(records, page=current_page),
+        parse_mode='Markdown'
+    )
+    
+    return SELECT_RECORD
+
+def format_record_details(record):
+    """متن جزئیات رکورد"""
+    text = f"🔍 **جزئیات رکورد**\n\n"
+    text += f"🏷️ نام: `{record['name']}`\n"
+    text += f"📌 نوع: `{record['type']}`\n"
+    text += f"📋 محتوا: `{record['content']}`\n"
+    text += f"⏱️ TTL: {record.get('ttl', 'Auto')}\n"
+    
+    if record['type'] in ['A', 'AAAA', 'CNAME']:
+        proxied_status = "فعال 🟠" if record.get('proxied') else "غیرفعال ⚪"
+        text += f"🛡️ Proxy: {proxied_status}\n"
+    
+    text += "\nعملیات مورد نظر را انتخاب کنید:"
+    return text
+
+async def select_record(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """انتخاب رکورد"""
+    text = update.message.text
+    
+    # بررسی دکمه‌های ناوبری
+    if "⬅️ صفحه قبل" in text or "صفحه بعد ➡️" in text:
+        return await navigate_records(update, context)
+    
+    if text == "🔙 بازگشت به دامنه‌ها":
+        zones = await zone_store.get_zones()
+        zone_store.prefetch([zone_id for _, zone_id in zones])
+        await update.message.reply_text(
+            "🔍 دامنه مورد نظر را انتخاب کنید:",
+            reply_markup=get_domains_keyboard(zones)
+        )
+        return SELECT_DOMAIN
+    
+    if text.startswith("━━━") or text.startswith("📄 صفحه") or text.startswith("📊 مجموع"):
+        return SELECT_RECORD
+    
+    # پیدا کردن رکورد
+    record_name = text.replace("🟠 ", "").replace("⚪ ", "")
+    records = await zone_store.get_records(context.user_data.get('current_zone_id'))
+    
+    selected_record = None
+    for record in records:
+        if record['name'] == record_name:
+            selected_record = record
+            break
+    
+    if not selected_record:
+        await update.message.reply_text("❌ رکورد یافت نشد!")
+        return SELECT_RECORD
+    
+    context.user_data['selected_record'] = selected_record
+    zone_store.prefetch_details(selected_record)
+    
+    await update.message.reply_text(
+        format_record_details(selected_record),
+        reply_markup=get_record_actions_keyboard(selected_record['type']),
+        parse_mode='Markdown'
+    )
+    
+    return RECORD_ACTIONS
+
+async def record_actions(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """عملیات روی رکورد"""
+    text = update.message.text
+    action = RECORD_ACTION_CODES.get(text)
+    
+    if not action:
+        return RECORD_ACTIONS
+    
+    return await run_record_action(update, context, action)
+
+async def run_record_action(update: Update, context: ContextTypes.DEFAULT_TYPE, action):
+    """اجرای عملیات روی رکورد انتخاب شده (مشترک بین کیبورد معمولی و شیشه‌ای)"""
+    message = update.effective_message
+    user_id = update.effective_user.id
+    
+    if action == 'b':
+        records = await zone_store.get_records(context.user_data.get('current_zone_id'))
+        zone_name = context.user_data.get('current_zone_name', '')
+        current_page = context.user_data.get('current_page', 1)
+        
+        await message.reply_text(
+            f"📋 رکوردهای دامنه **{zone_name}**",
+            reply_markup=get_records_keyboard_paginated(records, page=current_page),
+            parse_mode='Markdown'
+        )
+        return SELECT_RECORD
+    
+    selected_record = context.user_data.get('selected_record')
+    if not selected_record:
+        await message.reply_text("❌ خطا در پردازش!")
+        return MAIN_MENU
+    
+    zone_id = context.user_data.get('current_zone_id')
+    zone_name = context.user_data.get('current_zone_name')
+    
+    if action == 'e':
+        record_type = selected_record['type']
+        example = RECORD_EXAMPLES.get(record_type, "example.com")
+        
+        await message.reply_text(
+            f"📝 محتوای جدید را وارد کنید:\n\n"
+            f"نوع رکورد: **{record_type}**\n"
+            f"مثال: `{example}`",
+            reply_markup=get_cancel_keyboard(),
+            parse_mode='Markdown'
+        )
+        return EDIT_CONTENT
+    
+    elif action == 's':
+        record_type = selected_record['type']
+        example = RECORD_EXAMPLES.get(record_type, "example.com")
+        
+        await message.reply_text(
+            f"⏰ **زمان‌بندی تغییر محتوا**\n\n"
+            f"محتوای فعلی: `{selected_record['content']}`\n"
+            f"محتوای جدید را وارد کنید:\n"
+            f"مثال: `{example}`",
+            reply_markup=get_cancel_keyboard(),
+            parse_mode='Markdown'
+        )
+        return SCHEDULE_CONTENT
+    
+    elif action == 'x':
+        new_proxied = not selected_record.get('proxied', False)
+        
+        await snapshot_before_change(zone_id, zone_name)
+        success, result = cf_manager.update_dns_record(
+            zone_id,
+            selected_record['id'],
+            {'proxied': new_proxied},
+            current=zone_store.cached_details(zone_id, selected_record)
+        )
+        
+        if success:
+            status = "Proxied" if new_proxied else "DNS Only"
+            change_logger.log_change(
+                user_id,
+                update.effective_user.username,
+                "PROXY_TOGGLE",
+                zone_name,
+                selected_record['name'],
+                f"Changed to {status}"
+            )
+            records_changed(zone_id)
+            
+            if update.callback_query:
+                # در حالت شیشه‌ای همان پیام جزئیات ویرایش می‌شود؛ رکورد مخزن دست نمی‌خورد
+                selected_record = selected_record.copy(proxied=new_proxied)
+                context.user_data['selected_record'] = selected_record
+                await update.callback_query.answer(f"✅ وضعیت Proxy به {status} تغییر کرد!")
+                await update.callback_query.edit_message_text(
+                    format_record_details(selected_record),
+                    reply_markup=get_record_actions_inline_keyboard(selected_record['type']),
+                    parse_mode='Markdown'
+                )
+                return MAIN_MENU
+            
+            await message.reply_text(
+                f"✅ وضعیت Proxy به {status} تغییر کرد!",
+                reply_markup=get_main_keyboard()
+            )
+            return MAIN_MENU
+        else:
+            if update.callback_query:
+                await update.callback_query.answer(f"❌ {result}", show_alert=True)
+                return MAIN_MENU
+            await message.reply_text(f"❌ {result}")
+            return RECORD_ACTIONS
+    
+    elif action == 't':
+        await message.reply_text(
+            f"🔄 **تغییر نوع رکورد**\n\n"
+            f"نوع فعلی: `{selected_record['type']}`\n\n"
+            "نوع جدید را انتخاب کنید:",
+            reply_markup=get_record_types_keyboard(),
+            parse_mode='Markdown'
+        )
+        return CHANGE_TYPE_SELECT
+    
+    elif action == 'd':
+        await message.reply_text(
+            f"⚠️ **آیا از حذف این رکورد مطمئن هستید؟**\n\n"
+            f"🏷️ نام: `{selected_record['name']}`\n"
+            f"📌 نوع: `{selected_record['type']}`\n"
+            f"📋 محتوا: `{selected_record['content']}`\n\n"
+            "این عملیات قابل بازگشت نیست!",
+            reply_markup=get_yes_no_keyboard(),
+            parse_mode='Markdown'
+        )
+        return CONFIRM_DELETE
+    
+    elif action == 'c':
+        host = record_fqdn(selected_record['name'], zone_name)
+        start_purge_report(
+            message, update.effective_user, zone_id, zone_name, 'hosts', [host], f"host {host}"
+        )
+        await message.reply_text(
+            f"🧹 پاکسازی کش `{host}` در صف قرار گرفت.",
+            reply_markup=None if update.callback_query else get_main_keyboard(),
+            parse_mode='Markdown'
+        )
+        return MAIN_MENU
+    
+    return RECORD_ACTIONS
+
+async def edit_content(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ویرایش محتوا"""
+    text = update.message.text
+    user_id = update.effective_user.id
+    
+    if text == "❌ لغو عملیات":
+        await update.message.reply_text(
+            "عملیات لغو شد.",
+            reply_markup=get_main_keyboard()
+        )
+        return MAIN_MENU
+    
+    selected_record = context.user_data.get('selected_record')
+    zone_id = context.user_data.get('current_zone_id')
+    zone_name = context.user_data.get('current_zone_name')
+    
+    # اعتبارسنجی محلی قبل از هر درخواست به API
+    valid, fields = validate_record_content(selected_record['type'], text)
+    if not valid:
+        await update.message.reply_text(
+            f"❌ {fields}\n\nدوباره امتحان کنید:",
+            reply_markup=get_cancel_keyboard()
+        )
+        return EDIT_CONTENT
+    text = record_content_text(fields)
+    
+    await snapshot_before_change(zone_id, zone_name)
+    success, message = cf_manager.update_dns_record(
+        zone_id,
+        selected_record['id'],
+        fields,
+        current=zone_store.cached_details(zone_id, selected_record)
+    )
+    
+    if success:
+        change_logger.log_change(
+            user_id,
+            update.effective_user.username,
+            "UPDATE",
+            zone_name,
+            selected_record['name'],
+            f"Content changed from '{selected_record['content']}' to '{text}'"
+        )
+        records_changed(zone_id)
+        
+        await update.message.reply_text(
+            "✅ رکورد با موفقیت به‌روزرسانی شد!",
+            reply_markup=get_main_keyboard()
+        )
+        if selected_record.get('proxied') and selected_record['type'] in ['A', 'AAAA', 'CNAME']:
+            await update.message.reply_text(
+                "🧹 برای دیدن تغییر origin ممکن است پاکسازی کش لازم باشد.",
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🧹 پاکسازی کش", callback_data="a:c")]])
+            )
+        start_propagation_check(
+            update.message, zone_name, selected_record['name'], selected_record['type'],
+            text, selected_record.get('proxied')
+        )
+        return MAIN_MENU
+    else:
+        await update.message.reply_text(
+            f"❌ {message}\n\nدوباره امتحان کنید:",
+            reply_markup=get_cancel_keyboard()
+        )
+        return EDIT_CONTENT
+
+async def schedule_content(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """دریافت محتوای جدید برای تغییر زمان‌بندی شده"""
+    text = update.message.text
+    
+    if text == "❌ لغو عملیات":
+        await update.message.reply_text(
+            "عملیات لغو شد.",
+            reply_markup=get_main_keyboard()
+        )
+        return MAIN_MENU
+    
+    selected_record = context.user_data.get('selected_record')
+    
+    valid, fields = validate_record_content(selected_record['type'], text)
+    if not valid:
+        await update.message.reply_text(
+            f"❌ {fields}\n\nدوباره امتحان کنید:",
+            reply_markup=get_cancel_keyboard()
+        )
+        return SCHEDULE_CONTENT
+    
+    context.user_data['schedule_fields'] = fields
+    
+    await update.message.reply_text(
+        "🕒 زمان اجرا را وارد کنید:\n\n"
+        "• `03:00` - ساعت ۳ بامداد (امروز یا فردا)\n"
+        "• `2025-01-01 03:00` - تاریخ و ساعت مشخص\n"
+        "• `+30m` یا `+2h` - بعد از مدت مشخص\n\n"
+        "برای بازگشت خودکار به محتوای فعلی، زمان دوم را هم بنویسید:\n"
+        "مثال: `03:00 04:00`",
+        reply_markup=get_cancel_keyboard(),
+        parse_mode='Markdown'
+    )
+    return SCHEDULE_TIME
+
+async def schedule_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """دریافت زمان اجرا و ثبت کار"""
+    text = update.message.text
+    user = update.effective_user
+    
+    if text == "❌ لغو عملیات":
+        await update.message.reply_text(
+            "عملیات لغو شد.",
+            reply_markup=get_main_keyboard()
+        )
+        return MAIN_MENU
+    
+    times = parse_schedule_times(text)
+    if not times:
+        await update.message.reply_text(
+            "❌ زمان نامعتبر است! زمان باید در آینده باشد و زمان بازگشت بعد از زمان اجرا.\n\n"
+            "دوباره امتحان کنید:",
+            reply_markup=get_cancel_keyboard()
+        )
+        return SCHEDULE_TIME
+    
+    selected_record = context.user_data.get('selected_record')
+    zone_id = context.user_data.get('current_zone_id')
+    zone_name = context.user_data.get('current_zone_name')
+    fields = context.user_data.pop('schedule_fields')
+    new_content = record_content_text(fields)
+    
+    jobs = [job_scheduler.add_job(
+        times[0], zone_id, zone_name, selected_record, fields, user.id, user.username,
+        f"Content '{selected_record['content']}' -> '{new_content}'"
+    )]
+    
+    if len(times) == 2:
+        original = {
+            field: selected_record[field]
+            for field in ('content', 'priority', 'data')
+            if selected_record.get(field) is not None
+        }
+        jobs.append(job_scheduler.add_job(
+            times[1], zone_id, zone_name, selected_record, original, user.id, user.username,
+            f"Revert content '{new_content}' -> '{selected_record['content']}'",
+            # بازگشت نباید با همان تغییری که باید بعد از آن اجرا شود ادغام شود
+            coalesce_window=0
+        ))
+    
+    text = f"⏰ **تغییر زمان‌بندی شد!**\n\n🏷️ نام: `{selected_record['name']}`\n"
+    text += f"📋 محتوای جدید: `{new_content}`\n"
+    text += f"🕒 اجرا: {times[0].strftime('%Y-%m-%d %H:%M')} (#{jobs[0]['id']})\n"
+    if len(times) == 2:
+        text += f"↩️ بازگشت: {times[1].strftime('%Y-%m-%d %H:%M')} (#{jobs[1]['id']})\n"
+    
+    await update.message.reply_text(
+        text,
+        reply_markup=get_main_keyboard(),
+        parse_mode='Markdown'
+    )
+    return MAIN_MENU
+
+async def add_record_domain(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """انتخاب دامنه برای افزودن رکورد"""
+    text = update.message.text
+    
+    if text == "🔙 بازگشت به منو":
+        await update.message.reply_text(
+            "منوی اصلی:",
+            reply_markup=get_main_keyboard()
+        )
+        return MAIN_MENU
+    
+    zone_name = text.replace("🌐 ", "")
+    zone_id = await zone_store.get_zone_id(zone_name)
+    
+    if not zone_id:
+        await update.message.reply_text("❌ دامنه یافت نشد!")
+        return ADD_RECORD_DOMAIN
+    
+    context.user_data['add_zone_id'] = zone_id
+    context.user_data['add_zone_name'] = zone_name
+    
+    await update.message.reply_text(
+        "📝 نوع رکورد جدید را انتخاب کنید:",
+        reply_markup=get_record_types_keyboard()
+    )
+    
+    return ADD_RECORD_TYPE
+
+async def add_record_type(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """انتخاب نوع رکورد جدید"""
+    text = update.message.text
+    
+    if text == "❌ لغو":
+        await update.message.reply_text(
+            "عملیات لغو شد.",
+            reply_markup=get_main_keyboard()
+        )
+        return MAIN_MENU
+    
+    if text not in ['A', 'AAAA', 'CNAME', 'MX', 'TXT', 'NS', 'CAA', 'SRV']:
+        await update.message.reply_text("❌ نوع رکورد نامعتبر!")
+        return ADD_RECORD_TYPE
+    
+    context.user_data['add_record_type'] = text
+    zone_name = context.user_data.get('add_zone_name', '')
+    
+    await update.message.reply_text(
+        f"📝 **ایجاد رکورد {text}**\n\n"
+        "نام رکورد را وارد کنید:\n"
+        f"مثال: `subdomain` یا `subdomain.{zone_name}`\n\n"
+        "برای رکورد اصلی دامنه از @ استفاده کنید",
+        reply_markup=get_cancel_keyboard(),
+        parse_mode='Markdown'
+    )
+    
+    return ADD_RECORD_NAME
+
+async def add_record_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """دریافت نام رکورد جدید"""
+    text = update.message.text
+    
+    if text == "❌ لغو عملیات":
+        await update.message.reply_text(
+            "عملیات لغو شد.",
+            reply_markup=get_main_keyboard()
+        )
+        return MAIN_MENU
+    
+    context.user_data['add_record_name'] = text
+    record_type = context.user_data.get('add_record_type')
+    
+    example = RECORD_EXAMPLES.get(record_type, "example.com")
+    
+    await update.message.reply_text(
+        f"📝 محتوای رکورد {record_type} را وارد کنید:\n\n"
+        f"مثال: `{example}`",
+        reply_markup=get_cancel_keyboard(),
+        parse_mode='Markdown'
+    )
+    
+    return ADD_RECORD_CONTENT
+
+async def add_record_content(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """دریافت محتوای رکورد جدید"""
+    text = update.message.text
+    user_id = update.effective_user.id
+    
+    if text == "❌ لغو عملیات":
+        await update.message.reply_text(
+            "عملیات لغو شد.",
+            reply_markup=get_main_keyboard()
+        )
+        return MAIN_MENU
+    
+    zone_id = context.user_data.get('add_zone_id')
+    zone_name = context.user_data.get('add_zone_name')
+    record_type = context.user_data.get('add_record_type')
+    record_name = context.user_data.get('add_record_name')
+    
+    # اعتبارسنجی محلی قبل از هر درخواست به API
+    valid, fields = validate_record_content(record_type, text)
+    if not valid:
+        await update.message.reply_text(
+            f"❌ {fields}\n\nدوباره امتحان کنید:",
+            reply_markup=get_cancel_keyboard()
+        )
+        return ADD_RECORD_CONTENT
+    text = record_content_text(fields)
+    
+    record_data = {
+        'type': record_type,
+        'name': record_name,
+        **fields,
+        'proxied': False,
+        'ttl': 1
+    }
+    
+    if record_type in ['A', 'AAAA', 'CNAME']:
+        record_data['proxied'] = True
+    
+    await snapshot_before_change(zone_id, zone_name)
+    success, message = cf_manager.create_dns_record(zone_id, record_data)
+    
+    if success:
+        change_logger.log_change(
+            user_id,
+            update.effective_user.username,
+            "CREATE",
+            zone_name,
+            record_name,
+            f"Type: {record_type}, Content: {text}"
+        )
+        records_changed(zone_id)
+        
+        await update.message.reply_text(
+            f"✅ رکورد جدید با موفقیت ایجاد شد!\n\n"
+            f"🌐 دامنه: {zone_name}\n"
+            f"🏷️ نام: `{record_name}`\n"
+            f"📌 نوع: `{record_type}`\n"
+            f"📋 محتوا: `{text}`",
+            reply_markup=get_main_keyboard(),
+            parse_mode='Markdown'
+        )
+        start_propagation_check(
+            update.message, zone_name, record_name, record_type, text, record_data['proxied']
+        )
+        return MAIN_MENU
+    else:
+        await update.message.reply_text(
+            f"❌ {message}\n\nدوباره امتحان کنید:",
+            reply_markup=get_cancel_keyboard()
+        )
+        return ADD_RECORD_CONTENT
+
+async def change_type_select(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """انتخاب نوع جدید رکورد"""
+    text = update.message.text
+    
+    if text == "❌ لغو":
+        await update.message.reply_text(
+            "عملیات لغو شد.",
+            reply_markup=get_main_keyboard()
+        )
+        return MAIN_MENU
+    
+    if text not in ['A', 'AAAA', 'CNAME', 'MX', 'TXT', 'NS', 'CAA', 'SRV']:
+        await update.message.reply_text("❌ نوع رکورد نامعتبر!")
+        return CHANGE_TYPE_SELECT
+    
+    selected_record = context.user_data.get('selected_record')
+    old_type = selected_record['type']
+    
+    if text == old_type:
+        await update.message.reply_text(
+            "❌ نوع جدید با نوع فعلی یکسان است!",
+            reply_markup=get_main_keyboard()
+        )
+        return MAIN_MENU
+    
+    context.user_data['new_record_type'] = text
+    
+    example = RECORD_EXAMPLES.get(text, "example.com")
+    
+    await update.message.reply_text(
+        f"🔄 **تغییر نوع رکورد از {old_type} به {text}**\n\n"
+        f"محتوای جدید را برای رکورد نوع {text} وارد کنید:\n"
+        f"مثال: `{example}`\n\n"
+        "⚠️ توجه: با تغییر نوع رکورد، محتوای قبلی از بین می‌رود.",
+        reply_markup=get_cancel_keyboard(),
+        parse_mode='Markdown'
+    )
     
-    return MAIN_MENU
+    return CHANGE_TYPE_CONTENT
 
-async def select_domain(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """انتخاب دامنه"""
+async def change_type_content(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """دریافت محتوای جدید برای تغییر نوع"""
     text = update.message.text
+    user_id = update.effective_user.id
     
-    if text == "🔙 بازگشت به منو":
+    if text == "❌ لغو عملیات":
         await update.message.reply_text(
-            "منوی اصلی:",
+            "عملیات لغو شد.",
             reply_markup=get_main_keyboard()
         )
         return MAIN_MENU
     
-    # پیدا کردن دامنه
-    zone_name = text.replace("🌐 ", "")
-    zones = context.user_data.get('zones', [])
+    selected_record = context.user_data.get('selected_record')
+    zone_id = context.user_data.get('current_zone_id')
+    zone_name = context.user_data.get('current_zone_name')
+    new_type = context.user_data.get('new_record_type')
     
-    zone_id = None
-    for name, id in zones:
-        if name == zone_name:
-            zone_id = id
-            break
+    # اعتبارسنجی پیش از حذف رکورد قدیمی
+    valid, fields = validate_record_content(new_type, text)
+    if not valid:
+        await update.message.reply_text(
+            f"❌ {fields}\n\nدوباره امتحان کنید:",
+            reply_markup=get_cancel_keyboard()
+        )
+        return CHANGE_TYPE_CONTENT
+    text = record_content_text(fields)
     
-    if not zone_id:
-        await update.message.reply_text("❌ دامنه یافت نشد!")
-        return SELECT_DOMAIN
+    # حذف رکورد قدیمی
+    await snapshot_before_change(zone_id, zone_name)
+    success, message = cf_manager.delete_dns_record(zone_id, selected_record['id'])
     
-    # ذخیره اطلاعات
-    context.user_data['current_zone_id'] = zone_id
-    context.user_data['current_zone_name'] = zone_name
-    context.user_data['current_page'] = 1
+    if not success:
+        await update.message.reply_text(f"❌ خطا در حذف رکورد قدیمی: {message}")
+        return MAIN_MENU
     
-    # دریافت رکوردها
-    records = cf_manager.get_dns_records(zone_id)
+    # ایجاد رکورد جدید
+    record_data = {
+        'type': new_type,
+        'name': selected_record['name'],
+        **fields,
+        'proxied': False,
+        'ttl': 1
+    }
     
-    if not records:
+    if new_type in ['A', 'AAAA', 'CNAME']:
+        record_data['proxied'] = selected_record.get('proxied', False)
+    
+    success, message = cf_manager.create_dns_record(zone_id, record_data)
+    
+    if success:
+        change_logger.log_change(
+            user_id,
+            update.effective_user.username,
+            "UPDATE",
+            zone_name,
+            selected_record['name'],
+            f"Type changed from {selected_record['type']} to {new_type}, New content: {text}"
+        )
+        records_changed(zone_id)
+        
         await update.message.reply_text(
-            "❌ هیچ رکوردی یافت نشد!",
-            reply_markup=get_domains_keyboard(zones)
+            f"✅ نوع رکورد با موفقیت تغییر کرد!\n\n"
+            f"🏷️ نام: `{selected_record['name']}`\n"
+            f"📌 نوع جدید: `{new_type}`\n"
+            f"📋 محتوای جدید: `{text}`",
+            reply_markup=get_main_keyboard(),
+            parse_mode='Markdown'
         )
-        return SELECT_DOMAIN
+        return MAIN_MENU
+    else:
+        # بازگرداندن رکورد قدیمی در صورت خطا
+        cf_manager.create_dns_record(zone_id, record_payload(selected_record))
+        
+        await update.message.reply_text(f"❌ خطا در ایجاد رکورد جدید: {message}")
+        return MAIN_MENU
+
+async def confirm_delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """تایید حذف رکورد"""
+    text = update.message.text
+    user_id = update.effective_user.id
     
-    context.user_data['records'] = records
+    if text == "❌ خیر":
+        await update.message.reply_text(
+            "عملیات لغو شد.",
+            reply_markup=get_main_keyboard()
+        )
+        return MAIN_MENU
     
-    await update.message.reply_text(
-        f"📋 رکوردهای دامنه **{zone_name}**\n"
-        f"تعداد: {len(records)} رکورد\n\n"
-        "رکورد مورد نظر را انتخاب کنید:",
-        reply_markup=get_records_keyboard_paginated(records, page=1),
-        parse_mode='Markdown'
-    )
+    if text == "✅ بله":
+        selected_record = context.user_data.get('selected_record')
+        zone_id = context.user_data.get('current_zone_id')
+        zone_name = context.user_data.get('current_zone_name')
+        
+        await snapshot_before_change(zone_id, zone_name)
+        success, message = cf_manager.delete_dns_record(zone_id, selected_record['id'])
+        
+        if success:
+            change_logger.log_change(
+                user_id,
+                update.effective_user.username,
+                "DELETE",
+                zone_name,
+                selected_record['name'],
+                f"Type: {selected_record['type']}, Content: {selected_record['content']}"
+            )
+            records_changed(zone_id)
+            
+            await update.message.reply_text(
+                f"✅ رکورد با موفقیت حذف شد!\n\n"
+                f"🏷️ نام: `{selected_record['name']}`\n"
+                f"📌 نوع: `{selected_record['type']}`",
+                reply_markup=get_main_keyboard(),
+                parse_mode='Markdown'
+            )
+            return MAIN_MENU
+        else:
+            await update.message.reply_text(f"❌ {message}")
+            return MAIN_MENU
     
-    return SELECT_RECORD
+    return CONFIRM_DELETE
 
-async def navigate_records(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """ناوبری بین صفحات رکوردها"""
+async def search_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """پردازش جستجو"""
     text = update.message.text
     
-    records = context.user_data.get('records', [])
-    current_page = context.user_data.get('current_page', 1)
-    zone_name = context.user_data.get('current_zone_name', '')
+    if text == "❌ لغو عملیات":
+        await update.message.reply_text(
+            "عملیات لغو شد.",
+            reply_markup=get_main_keyboard()
+        )
+        return MAIN_MENU
     
-    # تغییر صفحه
-    if "⬅️ صفحه قبل" in text:
-        current_page = max(1, current_page - 1)
-    elif "صفحه بعد ➡️" in text:
-        total_pages = math.ceil(len(records) / RECORDS_PER_PAGE)
-        current_page = min(total_pages, current_page + 1)
+    # جستجو در ایندکس درون‌حافظه‌ای؛ نتایج به عنوان cursor در session می‌مانند
+    await record_index.ensure_fresh()
+    matches = record_index.search(text)
     
-    context.user_data['current_page'] = current_page
+    if not matches:
+        await update.message.reply_text(
+            "❌ هیچ نتیجه‌ای یافت نشد!",
+            reply_markup=get_main_keyboard()
+        )
+        return MAIN_MENU
     
+    context.user_data['search'] = {'query': text, 'matches': matches}
+    
+    await update.message.reply_text("🔍 جستجو انجام شد.", reply_markup=get_main_keyboard())
     await update.message.reply_text(
-        f"📋 رکوردهای دامنه **{zone_name}**\n"
-        f"تعداد: {len(records)} رکورد\n\n"
-        "رکورد مورد نظر را انتخاب کنید:",
-        reply_markup=get_records_keyboard_paginated(records, page=current_page),
+        format_search_page(text, matches, 1),
+        reply_markup=get_search_results_inline_keyboard(matches, 1),
         parse_mode='Markdown'
     )
     
-    return SELECT_RECORD
+    return MAIN_MENU
 
-async def select_record(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """انتخاب رکورد"""
+async def ip_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """جستجوی رکوردهای A/AAAA بر اساس IP، CIDR یا بازه"""
     text = update.message.text
     
-    # بررسی دکمه‌های ناوبری
-    if "⬅️ صفحه قبل" in text or "صفحه بعد ➡️" in text:
-        return await navigate_records(update, context)
+    if text == "❌ لغو عملیات":
+        await update.message.reply_text(
+            "عملیات لغو شد.",
+            reply_markup=get_main_keyboard()
+        )
+        return MAIN_MENU
     
-    if text == "🔙 بازگشت به دامنه‌ها":
-        zones = context.user_data.get('zones', [])
+    await record_index.ensure_fresh()
+    try:
+        matches = record_index.search_ip(text)
+    except ValueError:
         await update.message.reply_text(
-            "🔍 دامنه مورد نظر را انتخاب کنید:",
-            reply_markup=get_domains_keyboard(zones)
+            "❌ IP، CIDR یا بازه نامعتبر است!\n\nدوباره امتحان کنید:",
+            reply_markup=get_cancel_keyboard()
         )
-        return SELECT_DOMAIN
+        return IP_QUERY
     
-    if text.startswith("━━━") or text.startswith("📄 صفحه") or text.startswith("📊 مجموع"):
-        return SELECT_RECORD
+    if not matches:
+        await update.message.reply_text(
+            "❌ هیچ رکوردی در این بازه یافت نشد!",
+            reply_markup=get_main_keyboard()
+        )
+        return MAIN_MENU
     
-    # پیدا کردن رکورد
-    record_name = text.replace("🟠 ", "").replace("⚪ ", "")
-    records = context.user_data.get('records', [])
+    # همان cursor جستجوی معمولی؛ صفحه‌بندی و انتخاب نتیجه مشترک است
+    query = text.strip()
+    context.user_data['search'] = {'query': query, 'matches': matches}
     
-    selected_record = None
-    for record in records:
-        if record['name'] == record_name:
-            selected_record = record
-            break
+    await update.message.reply_text("🧭 جستجو انجام شد.", reply_markup=get_main_keyboard())
+    await update.message.reply_text(
+        format_search_page(query, matches, 1),
+        reply_markup=get_search_results_inline_keyboard(matches, 1),
+        parse_mode='Markdown'
+    )
     
-    if not selected_record:
-        await update.message.reply_text("❌ رکورد یافت نشد!")
-        return SELECT_RECORD
+    return MAIN_MENU
+
+def format_search_page(query, matches, page, per_page=SEARCH_RESULTS_PER_PAGE):
+    """متن یک صفحه از نتایج جستجو"""
+    start = (page - 1) * per_page
+    response = f"🔍 **نتایج جستجو برای: `{query}`** ({len(matches)} نتیجه)\n\n"
     
-    context.user_data['selected_record'] = selected_record
+    for index, entry in enumerate(matches[start:start + per_page], start + 1):
+        proxied = "🟠" if entry.proxied else "⚪"
+        response += f"{index}. {proxied} **{entry.name}**\n"
+        response += f"   🌐 دامنه: {entry.zone_name}\n"
+        response += f"   📌 نوع: {entry.type}\n"
+        response += f"   📋 محتوا: `{entry.content}`\n\n"
     
-    # نمایش جزئیات
-    text = f"🔍 **جزئیات رکورد**\n\n"
-    text += f"🏷️ نام: `{selected_record['name']}`\n"
-    text += f"📌 نوع: `{selected_record['type']}`\n"
-    text += f"📋 محتوا: `{selected_record['content']}`\n"
-    text += f"⏱️ TTL: {selected_record.get('ttl', 'Auto')}\n"
+    response += "برای مدیریت، نتیجه را انتخاب کنید:"
+    return response
+
+# ===== جستجوی inline =====
+def format_index_entry(entry):
+    """متن ارسالی برای یک نتیجه جستجوی inline"""
+    text = f"🔍 **{entry.name}**\n\n"
+    text += f"🌐 دامنه: {entry.zone_name}\n"
+    text += f"📌 نوع: `{entry.type}`\n"
+    text += f"📋 محتوا: `{entry.content}`\n"
     
-    if selected_record['type'] in ['A', 'AAAA', 'CNAME']:
-        proxied_status = "فعال 🟠" if selected_record.get('proxied') else "غیرفعال ⚪"
+    if entry.type in ['A', 'AAAA', 'CNAME']:
+        proxied_status = "فعال 🟠" if entry.proxied else "غیرفعال ⚪"
         text += f"🛡️ Proxy: {proxied_status}\n"
     
-    text += "\nعملیات مورد نظر را انتخاب کنید:"
-    
-    await update.message.reply_text(
-        text,
-        reply_markup=get_record_actions_keyboard(selected_record['type']),
-        parse_mode='Markdown'
-    )
-    
-    return RECORD_ACTIONS
+    return text
 
-async def record_actions(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """عملیات روی رکورد"""
-    text = update.message.text
-    user_id = update.effective_user.id
-    
-    if text == "🔙 بازگشت به رکوردها":
-        records = context.user_data.get('records', [])
-        zone_name = context.user_data.get('current_zone_name', '')
-        current_page = context.user_data.get('current_page', 1)
-        
-        await update.message.reply_text(
-            f"📋 رکوردهای دامنه **{zone_name}**",
-            reply_markup=get_records_keyboard_paginated(records, page=current_page),
-            parse_mode='Markdown'
-        )
-        return SELECT_RECORD
+@admin_only
+async def inline_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """جستجوی رکوردها با @bot در هر چتی"""
+    query = update.inline_query
+    text = query.query.strip()
     
-    selected_record = context.user_data.get('selected_record')
-    if not selected_record:
-        await update.message.reply_text("❌ خطا در پردازش!")
-        return MAIN_MENU
+    if not text:
+        await query.answer([], cache_time=0, is_personal=True)
+        return
     
-    zone_id = context.user_data.get('current_zone_id')
-    zone_name = context.user_data.get('current_zone_name')
+    await record_index.ensure_fresh()
+    matches = record_index.search(text)
     
-    if text == "✏️ ویرایش محتوا":
-        record_type = selected_record['type']
-        examples = {
-            'A': "192.168.1.1",
-            'AAAA': "2001:db8::1",
-            'CNAME': "target.example.com",
-            'MX': "10 mail.example.com",
-            'TXT': '"v=spf1 include:example.com ~all"',
-            'NS': "ns1.example.com",
-            'CAA': '0 issue "letsencrypt.org"',
-            'SRV': "10 60 5060 sipserver.example.com"
-        }
-        
-        example = examples.get(record_type, "example.com")
-        
-        await update.message.reply_text(
-            f"📝 محتوای جدید را وارد کنید:\n\n"
-            f"نوع رکورد: **{record_type}**\n"
-            f"مثال: `{example}`",
-            reply_markup=get_cancel_keyboard(),
-            parse_mode='Markdown'
-        )
-        return EDIT_CONTENT
+    offset = int(query.offset) if query.offset.isdigit() else 0
+    page = matches[offset:offset + INLINE_RESULTS_PER_PAGE]
+    next_offset = offset + len(page)
     
-    elif text == "🔄 تغییر وضعیت Proxy":
-        new_proxied = not selected_record.get('proxied', False)
-        
-        success, message = cf_manager.update_dns_record(
-            zone_id,
-            selected_record['id'],
-            {'proxied': new_proxied}
-        )
-        
-        if success:
-            status = "Proxied" if new_proxied else "DNS Only"
-            change_logger.log_change(
-                user_id,
-                update.effective_user.username,
-                "PROXY_TOGGLE",
-                zone_name,
-                selected_record['name'],
-                f"Changed to {status}"
-            )
-            
-            await update.message.reply_text(
-                f"✅ وضعیت Proxy به {status} تغییر کرد!",
-                reply_markup=get_main_keyboard()
+    results = []
+    for entry in page:
+        proxied = "🟠" if entry.proxied else "⚪"
+        results.append(InlineQueryResultArticle(
+            id=entry.record_id,
+            title=f"{proxied} {entry.name}",
+            description=f"{entry.type} → {entry.content}\n🌐 {entry.zone_name}",
+            input_message_content=InputTextMessageContent(
+                format_index_entry(entry),
+                parse_mode='Markdown'
             )
-            return MAIN_MENU
+        ))
+    
+    await query.answer(
+        results,
+        cache_time=5,
+        is_personal=True,
+        next_offset=str(next_offset) if next_offset < len(matches) else ''
+    )
+
+# ===== هندلرهای snapshot =====
+def format_record_plan(creates, updates, deletes, limit=30):
+    """خطوط متنی یک برنامه تغییرات"""
+    lines = []
+    for record in creates:
+        lines.append(f"➕ {record['type']} `{record['name']}` → `{record['content']}`")
+    for old, new in updates:
+        if old['content'] != new['content']:
+            change = f"`{old['content']}` → `{new['content']}`"
         else:
-            await update.message.reply_text(f"❌ {message}")
-            return RECORD_ACTIONS
+            change = f"TTL {old.get('ttl', 1)} → {new.get('ttl', 1)}, Proxy {bool(old.get('proxied'))} → {bool(new.get('proxied'))}"
+        lines.append(f"✏️ {old['type']} `{old['name']}`: {change}")
+    for record in deletes:
+        lines.append(f"🗑️ {record['type']} `{record['name']}` (`{record['content']}`)")
     
-    elif text == "🔄 تغییر نوع رکورد":
-        await update.message.reply_text(
-            f"🔄 **تغییر نوع رکورد**\n\n"
-            f"نوع فعلی: `{selected_record['type']}`\n\n"
-            "نوع جدید را انتخاب کنید:",
-            reply_markup=get_record_types_keyboard(),
-            parse_mode='Markdown'
+    if len(lines) > limit:
+        lines = lines[:limit] + [f"... و {len(lines) - limit} تغییر دیگر"]
+    return lines
+
+@admin_only
+async def snapshot_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/snapshot - ثبت snapshot از همه دامنه‌ها"""
+    loop = asyncio.get_running_loop()
+    try:
+        entry = await loop.run_in_executor(
+            None, snapshot_store.take_snapshot, cf_manager, 'manual'
         )
-        return CHANGE_TYPE_SELECT
+    except Exception as e:
+        logger.error(f"Error taking manual snapshot: {e}")
+        await update.message.reply_text(f"❌ خطا در ثبت snapshot: {e}")
+        return
     
-    elif text == "🗑️ حذف رکورد":
-        await update.message.reply_text(
-            f"⚠️ **آیا از حذف این رکورد مطمئن هستید؟**\n\n"
-            f"🏷️ نام: `{selected_record['name']}`\n"
-            f"📌 نوع: `{selected_record['type']}`\n"
-            f"📋 محتوا: `{selected_record['content']}`\n\n"
-            "این عملیات قابل بازگشت نیست!",
-            reply_markup=get_yes_no_keyboard(),
-            parse_mode='Markdown'
-        )
-        return CONFIRM_DELETE
+    await update.message.reply_text(
+        f"📸 snapshot شماره {entry['id']} ثبت شد.\n"
+        f"🌐 تعداد دامنه‌ها: {len(entry['zones'])}"
+    )
+
+@admin_only
+async def snapshots_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/snapshots - لیست snapshot های اخیر"""
+    snapshots = snapshot_store.list_snapshots(15)
+    if not snapshots:
+        await update.message.reply_text("📸 هیچ snapshot ثبت نشده است!")
+        return
     
-    return RECORD_ACTIONS
+    text = "📸 **snapshot های اخیر:**\n\n"
+    for entry in snapshots:
+        zone_names = ", ".join(name for name, _ in entry['zones'].values())
+        text += f"#{entry['id']} - {entry['timestamp']} ({entry['reason']})\n"
+        text += f"🌐 {zone_names}\n\n"
+    
+    text += "مقایسه: `/snapdiff A B`\nبازگردانی: `/restore ID`"
+    await update.message.reply_text(text, parse_mode='Markdown')
 
-async def edit_content(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """ویرایش محتوا"""
-    text = update.message.text
-    user_id = update.effective_user.id
+@admin_only
+async def snapdiff_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/snapdiff A B - تفاوت دو snapshot"""
+    try:
+        old_id, new_id = (int(arg) for arg in context.args)
+    except ValueError:
+        await update.message.reply_text("❌ استفاده: /snapdiff A B")
+        return
     
-    if text == "❌ لغو عملیات":
-        await update.message.reply_text(
-            "عملیات لغو شد.",
-            reply_markup=get_main_keyboard()
-        )
-        return MAIN_MENU
+    loop = asyncio.get_running_loop()
+    inputs = await loop.run_in_executor(None, snapshot_store.diff_inputs, old_id, new_id)
+    if inputs is None:
+        await update.message.reply_text("❌ snapshot یافت نشد!")
+        return
     
-    selected_record = context.user_data.get('selected_record')
-    zone_id = context.user_data.get('current_zone_id')
-    zone_name = context.user_data.get('current_zone_name')
+    try:
+        result = await run_worker_job(
+            update.message, f"مقایسه snapshot #{old_id} و #{new_id}", job_snapshot_diff, *inputs
+        ) if inputs[0] else {}
+    except WorkerJobError:
+        return
     
-    success, message = cf_manager.update_dns_record(
-        zone_id,
-        selected_record['id'],
-        {'content': text}
-    )
+    if not result:
+        await update.message.reply_text(f"✅ snapshot های #{old_id} و #{new_id} یکسان هستند.")
+        return
     
-    if success:
+    text = f"🔀 **تفاوت #{old_id} و #{new_id}:**\n\n"
+    for zone_name, plan in sorted(result.items()):
+        text += f"**{zone_name}:**\n" + "\n".join(format_record_plan(*plan)) + "\n\n"
+    
+    await update.message.reply_text(text, parse_mode='Markdown')
+
+@admin_only
+async def restore_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/restore ID - نمایش تغییرات لازم برای بازگردانی و درخواست تایید"""
+    try:
+        snapshot_id = int(context.args[0])
+    except (IndexError, ValueError):
+        await update.message.reply_text("❌ استفاده: /restore ID")
+        return
+    
+    loop = asyncio.get_running_loop()
+    try:
+        plans = await loop.run_in_executor(None, snapshot_store.plan_restore, cf_manager, snapshot_id)
+    except Exception as e:
+        logger.error(f"Error planning restore: {e}")
+        await update.message.reply_text(f"❌ خطا در دریافت رکوردهای فعلی: {e}")
+        return
+    
+    if plans is None:
+        await update.message.reply_text("❌ snapshot یافت نشد!")
+        return
+    if not plans:
+        await update.message.reply_text(f"✅ رکوردها هم‌اکنون با snapshot #{snapshot_id} یکسان هستند.")
+        return
+    
+    text = f"⏪ **بازگردانی به snapshot #{snapshot_id}:**\n\n"
+    for zone_name, plan in plans.values():
+        text += f"**{zone_name}:**\n" + "\n".join(format_record_plan(*plan)) + "\n\n"
+    text += "آیا اجرا شود؟"
+    
+    keyboard = InlineKeyboardMarkup([[
+        InlineKeyboardButton("✅ اجرا", callback_data=f"sr:{snapshot_id}"),
+        InlineKeyboardButton("❌ لغو", callback_data="sr:0")
+    ]])
+    await update.message.reply_text(text, reply_markup=keyboard, parse_mode='Markdown')
+
+@admin_only
+async def restore_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """اجرای بازگردانی بعد از تایید"""
+    query = update.callback_query
+    snapshot_id = int(query.data[3:])
+    
+    if not snapshot_id:
+        await query.answer()
+        await query.edit_message_text("عملیات لغو شد.")
+        return
+    
+    await query.answer("⏳ در حال بازگردانی...")
+    loop = asyncio.get_running_loop()
+    
+    # برنامه دوباره محاسبه می‌شود تا تغییرات بعد از نمایش هم لحاظ شوند
+    try:
+        plans = await loop.run_in_executor(None, snapshot_store.plan_restore, cf_manager, snapshot_id)
+    except Exception as e:
+        logger.error(f"Error planning restore: {e}")
+        await query.edit_message_text(f"❌ خطا در دریافت رکوردهای فعلی: {e}")
+        return
+    if not plans:
+        await query.edit_message_text("✅ تغییری لازم نیست.")
+        return
+    
+    try:
+        await loop.run_in_executor(
+            None,
+            snapshot_store.take_snapshot,
+            cf_manager,
+            'pre-restore',
+            [(zone_name, zone_id) for zone_id, (zone_name, _) in plans.items()]
+        )
+    except Exception as e:
+        logger.error(f"Error taking pre-restore snapshot: {e}")
+    
+    total_applied, all_errors = 0, []
+    for zone_id, (zone_name, plan) in plans.items():
+        applied, errors = await loop.run_in_executor(
+            None, apply_record_changes, cf_manager, zone_id, *plan
+        )
+        total_applied += applied
+        all_errors.extend(errors)
+        
         change_logger.log_change(
-            user_id,
+            update.effective_user.id,
             update.effective_user.username,
-            "UPDATE",
+            "RESTORE",
             zone_name,
-            selected_record['name'],
-            f"Content changed from '{selected_record['content']}' to '{text}'"
+            "-",
+            f"Restored snapshot #{snapshot_id}: {applied} changes, {len(errors)} errors"
         )
-        
+        records_changed(zone_id)
+    
+    text = f"⏪ بازگردانی به snapshot #{snapshot_id} انجام شد.\n✅ تغییرات موفق: {total_applied}"
+    if all_errors:
+        text += f"\n❌ خطاها ({len(all_errors)}):\n" + "\n".join(all_errors[:20])
+    await query.edit_message_text(text)
+
+async def periodic_snapshots():
+    """snapshot دوره‌ای از همه دامنه‌ها"""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, snapshot_store.take_snapshot, cf_manager, 'periodic')
+        except Exception as e:
+            logger.error(f"Error taking periodic snapshot: {e}")
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+
+# ===== هندلرهای همگام‌سازی =====
+@admin_only
+async def sync_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/sync ZONE - دریافت فایل وضعیت فعلی دامنه برای ویرایش و ارسال دوباره"""
+    if not context.args:
         await update.message.reply_text(
-            "✅ رکورد با موفقیت به‌روزرسانی شد!",
-            reply_markup=get_main_keyboard()
+            "📥 **همگام‌سازی با فایل وضعیت مطلوب**\n\n"
+            "یک فایل `.yaml` یا `.json` با کلید `zone` و لیست `records` ارسال کنید؛ "
+            "تغییرات لازم نمایش داده و بعد از تایید اعمال می‌شوند. "
+            "رکوردهایی که در فایل نیستند حذف می‌شوند.\n\n"
+            "دریافت وضعیت فعلی یک دامنه: `/sync example.com`",
+            parse_mode='Markdown'
         )
-        return MAIN_MENU
+        return
+    
+    zone_name = context.args[0].strip().rstrip('.').lower()
+    zone_id = await zone_store.get_zone_id(zone_name)
+    if not zone_id:
+        await update.message.reply_text("❌ دامنه یافت نشد!")
+        return
+    
+    records = await zone_store.get_records(zone_id, max_age=0)
+    state = export_desired_state(zone_name, records)
+    if yaml is not None:
+        content = yaml.safe_dump(state, sort_keys=False, allow_unicode=True)
+        filename = f"{zone_name}.yaml"
     else:
-        await update.message.reply_text(
-            f"❌ {message}\n\nدوباره امتحان کنید:",
-            reply_markup=get_cancel_keyboard()
-        )
-        return EDIT_CONTENT
+        content = json.dumps(state, ensure_ascii=False, indent=2)
+        filename = f"{zone_name}.json"
+    
+    await update.message.reply_document(
+        document=io.BytesIO(content.encode('utf-8')),
+        filename=filename,
+        caption=f"📄 {len(records)} رکورد - بعد از ویرایش همین فایل را ارسال کنید."
+    )
 
-async def add_record_domain(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """انتخاب دامنه برای افزودن رکورد"""
-    text = update.message.text
+@admin_only
+async def sync_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """دریافت فایل وضعیت مطلوب، محاسبه برنامه تغییرات و درخواست تایید"""
+    document = update.message.document
+    if document.file_size and document.file_size > SYNC_MAX_FILE_SIZE:
+        await update.message.reply_text(f"❌ حجم فایل حداکثر {SYNC_MAX_FILE_SIZE // 1024} KB است!")
+        return
     
-    if text == "🔙 بازگشت به منو":
+    file = await document.get_file()
+    raw = bytes(await file.download_as_bytearray())
+    
+    try:
+        if len(raw) > SYNC_WORKER_PARSE_SIZE:
+            zone_name, desired, errors = await run_worker_job(
+                update.message, f"پردازش {document.file_name}", job_parse_desired_state, raw, document.file_name
+            )
+        else:
+            zone_name, desired, errors = job_parse_desired_state(raw, document.file_name, progress=lambda *_: None)
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+    except WorkerJobError:
+        return
+    
+    zone_id = await zone_store.get_zone_id(zone_name)
+    if not zone_id:
+        await update.message.reply_text(f"❌ دامنه {zone_name} یافت نشد!")
+        return
+    
+    # با ورودی نامعتبر هیچ تغییری اعمال نمی‌شود (وگرنه رکورد آن حذف می‌شد)
+    if errors:
         await update.message.reply_text(
-            "منوی اصلی:",
-            reply_markup=get_main_keyboard()
+            f"❌ فایل {len(errors)} ورودی نامعتبر دارد:\n\n" + "\n".join(errors[:20])
         )
-        return MAIN_MENU
+        return
     
-    zone_name = text.replace("🌐 ", "")
-    zones = context.user_data.get('zones', [])
+    loop = asyncio.get_running_loop()
+    try:
+        current = await loop.run_in_executor(None, cf_manager.fetch_dns_records, zone_id)
+    except Exception as e:
+        logger.error(f"Error getting DNS records for sync: {e}")
+        await update.message.reply_text(f"❌ خطا در دریافت رکوردهای فعلی: {e}")
+        return
     
-    zone_id = None
-    for name, id in zones:
-        if name == zone_name:
-            zone_id = id
-            break
+    plan = plan_record_changes(current, desired, fingerprint=sync_fingerprint)
+    if not any(plan):
+        await update.message.reply_text(f"✅ رکوردهای {zone_name} با فایل یکسان هستند؛ تغییری لازم نیست.")
+        return
     
-    if not zone_id:
-        await update.message.reply_text("❌ دامنه یافت نشد!")
-        return ADD_RECORD_DOMAIN
+    token = hashlib.sha256(raw).hexdigest()[:16]
+    context.user_data.setdefault('pending_syncs', {})[token] = {
+        'zone_id': zone_id,
+        'zone_name': zone_name,
+        'desired': desired
+    }
     
-    context.user_data['add_zone_id'] = zone_id
-    context.user_data['add_zone_name'] = zone_name
+    creates, updates, deletes = plan
+    text = (
+        f"📥 **همگام‌سازی {zone_name}:**\n"
+        f"➕ {len(creates)}  ✏️ {len(updates)}  🗑️ {len(deletes)}\n\n"
+        + "\n".join(format_record_plan(*plan))
+        + "\n\nآیا اجرا شود؟"
+    )
+    keyboard = InlineKeyboardMarkup([[
+        InlineKeyboardButton("✅ اجرا", callback_data=f"sy:{token}"),
+        InlineKeyboardButton("❌ لغو", callback_data=f"sn:{token}")
+    ]])
+    await update.message.reply_text(text, reply_markup=keyboard, parse_mode='Markdown')
+
+@admin_only
+async def sync_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """اعمال همگام‌سازی بعد از تایید"""
+    query = update.callback_query
+    action, token = query.data.split(':', 1)
+    pending = context.user_data.get('pending_syncs', {}).pop(token, None)
     
-    await update.message.reply_text(
-        "📝 نوع رکورد جدید را انتخاب کنید:",
-        reply_markup=get_record_types_keyboard()
+    if action == 'sn':
+        await query.answer()
+        await query.edit_message_text("عملیات لغو شد.")
+        return
+    if not pending:
+        await query.answer("❌ این برنامه منقضی شده است؛ فایل را دوباره ارسال کنید.", show_alert=True)
+        return
+    
+    await query.answer("⏳ در حال اعمال تغییرات...")
+    zone_id, zone_name = pending['zone_id'], pending['zone_name']
+    loop = asyncio.get_running_loop()
+    
+    # برنامه دوباره محاسبه می‌شود تا تغییرات بعد از نمایش هم لحاظ شوند
+    try:
+        current = await loop.run_in_executor(None, cf_manager.fetch_dns_records, zone_id)
+    except Exception as e:
+        logger.error(f"Error getting DNS records for sync: {e}")
+        await query.edit_message_text(f"❌ خطا در دریافت رکوردهای فعلی: {e}")
+        return
+    
+    plan = plan_record_changes(current, pending['desired'], fingerprint=sync_fingerprint)
+    if not any(plan):
+        await query.edit_message_text("✅ تغییری لازم نیست.")
+        return
+    
+    await snapshot_before_change(zone_id, zone_name, current)
+    applied, errors = await loop.run_in_executor(
+        None, apply_record_changes, cf_manager, zone_id, *plan
     )
     
-    return ADD_RECORD_TYPE
+    change_logger.log_change(
+        update.effective_user.id,
+        update.effective_user.username,
+        "SYNC",
+        zone_name,
+        "-",
+        f"Desired-state sync: {applied} changes, {len(errors)} errors"
+    )
+    records_changed(zone_id)
+    
+    total = sum(len(changes) for changes in plan)
+    text = f"📥 همگام‌سازی {zone_name} انجام شد.\n✅ تغییرات موفق: {applied} از {total}"
+    if errors:
+        text += f"\n❌ خطاها ({len(errors)}):\n" + "\n".join(errors[:20])
+    await query.edit_message_text(text)
 
-async def add_record_type(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """انتخاب نوع رکورد جدید"""
-    text = update.message.text
+# ===== هندلرهای قوانین دسترسی IP =====
+IP_RULE_MODE_LABELS = {'block': '⛔ block', 'whitelist': '✅ allow', 'managed_challenge': '🧩 challenge'}
+
+@admin_only
+async def iprules_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/iprules [ZONE] - خلاصه قوانین دسترسی IP و راهنمای ارسال لیست"""
+    usage = (
+        "🛡️ **قوانین دسترسی IP**\n\n"
+        "یک فایل `.txt` یا `.csv` از IP/CIDR ها (هر خط یا جدا شده با کاما) با این caption ارسال کنید:\n"
+        "`example.com block|allow|challenge [replace]`\n\n"
+        "تکراری‌ها و آدرس‌هایی که یک CIDR دیگر پوشش می‌دهد حذف می‌شوند. "
+        "با `replace` قوانین همان نوع که در لیست نیستند حذف می‌شوند.\n\n"
+        "خلاصه قوانین یک دامنه: `/iprules example.com`"
+    )
+    if not context.args:
+        await update.message.reply_text(usage, parse_mode='Markdown')
+        return
     
-    if text == "❌ لغو":
+    zone_name = context.args[0].strip().rstrip('.').lower()
+    zone_id = await zone_store.get_zone_id(zone_name)
+    if not zone_id:
+        await update.message.reply_text("❌ دامنه یافت نشد!")
+        return
+    
+    loop = asyncio.get_running_loop()
+    try:
+        rules = await loop.run_in_executor(None, cf_manager.fetch_access_rules, zone_id)
+    except Exception as e:
+        logger.error(f"Error getting access rules: {e}")
+        await update.message.reply_text(f"❌ خطا در دریافت قوانین: {e}")
+        return
+    
+    counts = {}
+    for rule in rules:
+        counts[rule['mode']] = counts.get(rule['mode'], 0) + 1
+    
+    text = f"🛡️ قوانین دسترسی {zone_name}: {len(rules)}\n\n"
+    text += "\n".join(f"{IP_RULE_MODE_LABELS.get(mode, mode)}: {count}" for mode, count in sorted(counts.items()))
+    await update.message.reply_text(text)
+
+@admin_only
+async def iprules_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """دریافت لیست IP، حذف تکراری‌ها، مقایسه با قوانین موجود و درخواست تایید"""
+    document = update.message.document
+    caption = (update.message.caption or '').split()
+    mode = IP_RULE_MODES.get(caption[1].lower()) if len(caption) >= 2 else None
+    if not mode:
         await update.message.reply_text(
-            "عملیات لغو شد.",
-            reply_markup=get_main_keyboard()
+            "❌ caption فایل باید `ZONE block|allow|challenge [replace]` باشد.",
+            parse_mode='Markdown'
         )
-        return MAIN_MENU
+        return
+    replace = len(caption) >= 3 and caption[2].lower() == 'replace'
     
-    if text not in ['A', 'AAAA', 'CNAME', 'MX', 'TXT', 'NS', 'CAA', 'SRV']:
-        await update.message.reply_text("❌ نوع رکورد نامعتبر!")
-        return ADD_RECORD_TYPE
+    if document.file_size and document.file_size > IP_RULES_MAX_FILE_SIZE:
+        await update.message.reply_text(f"❌ حجم فایل حداکثر {IP_RULES_MAX_FILE_SIZE // 1024} KB است!")
+        return
     
-    context.user_data['add_record_type'] = text
-    zone_name = context.user_data.get('add_zone_name', '')
+    zone_name = caption[0].strip().rstrip('.').lower()
+    zone_id = await zone_store.get_zone_id(zone_name)
+    if not zone_id:
+        await update.message.reply_text(f"❌ دامنه {zone_name} یافت نشد!")
+        return
     
-    await update.message.reply_text(
-        f"📝 **ایجاد رکورد {text}**\n\n"
-        "نام رکورد را وارد کنید:\n"
-        f"مثال: `subdomain` یا `subdomain.{zone_name}`\n\n"
-        "برای رکورد اصلی دامنه از @ استفاده کنید",
-        reply_markup=get_cancel_keyboard(),
-        parse_mode='Markdown'
-    )
+    file = await document.get_file()
+    raw = bytes(await file.download_as_bytearray())
     
-    return ADD_RECORD_NAME
-
-async def add_record_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """دریافت نام رکورد جدید"""
-    text = update.message.text
+    loop = asyncio.get_running_loop()
+    try:
+        existing = await loop.run_in_executor(None, cf_manager.fetch_access_rules, zone_id)
+    except Exception as e:
+        logger.error(f"Error getting access rules: {e}")
+        await update.message.reply_text(f"❌ خطا در دریافت قوانین فعلی: {e}")
+        return
     
-    if text == "❌ لغو عملیات":
+    try:
+        if len(raw) > IP_RULES_WORKER_PARSE_SIZE:
+            result = await run_worker_job(
+                update.message, f"پردازش {document.file_name}", job_plan_ip_rules, raw, existing, mode, replace
+            )
+        else:
+            result = job_plan_ip_rules(raw, existing, mode, replace, progress=lambda *_: None)
+    except WorkerJobError:
+        return
+    total, errors, creates, updates, deletes, redundant = result
+    
+    # با ورودی نامعتبر هیچ تغییری اعمال نمی‌شود (در حالت replace قانون آن حذف می‌شد)
+    if errors:
         await update.message.reply_text(
-            "عملیات لغو شد.",
-            reply_markup=get_main_keyboard()
+            f"❌ فایل {len(errors)} ورودی نامعتبر دارد:\n\n" + "\n".join(errors[:20])
         )
-        return MAIN_MENU
+        return
     
-    context.user_data['add_record_name'] = text
-    record_type = context.user_data.get('add_record_type')
+    summary = (
+        f"🛡️ {IP_RULE_MODE_LABELS[mode]} - {zone_name}\n"
+        f"📄 {total} شبکه؛ {redundant} تکراری یا پوشش داده شده با CIDR دیگر\n"
+        f"➕ {len(creates)}  ✏️ {len(updates)}  🗑️ {len(deletes)}"
+    )
+    if not (creates or updates or deletes):
+        await update.message.reply_text(f"{summary}\n\n✅ همه آدرس‌ها از قبل اعمال شده‌اند.")
+        return
     
-    examples = {
-        'A': "192.168.1.1",
-        'AAAA': "2001:db8::1",
-        'CNAME': "target.example.com",
-        'MX': "10 mail.example.com",
-        'TXT': '"v=spf1 include:example.com ~all"',
-        'NS': "ns1.example.com",
-        'CAA': '0 issue "letsencrypt.org"',
-        'SRV': "10 60 5060 sipserver.example.com"
+    token = hashlib.sha256(raw + update.message.caption.encode('utf-8')).hexdigest()[:16]
+    context.user_data.setdefault('pending_ip_rules', {})[token] = {
+        'zone_id': zone_id,
+        'zone_name': zone_name,
+        'mode': mode,
+        'plan': (creates, updates, deletes),
+        'notes': f"bot: {document.file_name}"
     }
     
-    example = examples.get(record_type, "example.com")
+    lines = [f"🗑️ {rule['configuration']['value']}" for rule in deletes[:10]]
+    lines += [f"✏️ {rule['configuration']['value']} ({IP_RULE_MODE_LABELS.get(rule['mode'], rule['mode'])})" for rule in updates[:10]]
+    lines += [f"➕ {network}" for network in creates[:10]]
+    seconds = (len(creates) + len(updates) + len(deletes)) // IP_RULES_BATCH_SIZE * IP_RULES_BATCH_DELAY
+    text = f"{summary}\n\n" + "\n".join(lines)
+    if seconds:
+        text += f"\n\n⏱️ حدود {seconds} ثانیه (محدودیت نرخ API)"
+    keyboard = InlineKeyboardMarkup([[
+        InlineKeyboardButton("✅ اجرا", callback_data=f"iy:{token}"),
+        InlineKeyboardButton("❌ لغو", callback_data=f"in:{token}")
+    ]])
+    await update.message.reply_text(text + "\n\nآیا اجرا شود؟", reply_markup=keyboard)
+
+async def run_ip_rules_apply(message, user, pending):
+    """اعمال قوانین در پس‌زمینه با به‌روزرسانی پیام پیشرفت"""
+    zone_id, zone_name, mode = pending['zone_id'], pending['zone_name'], pending['mode']
+    total = sum(len(changes) for changes in pending['plan'])
+    done = [0]
     
-    await update.message.reply_text(
-        f"📝 محتوای رکورد {record_type} را وارد کنید:\n\n"
-        f"مثال: `{example}`",
-        reply_markup=get_cancel_keyboard(),
-        parse_mode='Markdown'
+    def on_batch(count):
+        done[0] += count
+    
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(
+        None, lambda: apply_ip_rule_changes(
+            cf_manager, zone_id, mode, *pending['plan'], notes=pending['notes'], on_batch=on_batch
+        )
     )
     
-    return ADD_RECORD_CONTENT
+    last = None
+    while not future.done():
+        await asyncio.wait([future], timeout=WORKER_PROGRESS_INTERVAL * 5)
+        if done[0] != last and not future.done():
+            last = done[0]
+            try:
+                await message.edit_text(f"⏳ اعمال قوانین {zone_name}: {done[0]} از {total}")
+            except Exception as e:
+                logger.debug(f"Error updating access rules progress: {e}")
+    
+    try:
+        applied, errors = future.result()
+    except Exception as e:
+        logger.error(f"Error applying access rules: {e}")
+        await message.edit_text(f"❌ خطا در اعمال قوانین: {e}")
+        return
+    
+    change_logger.log_change(
+        user.id, user.username, "IP_RULES", zone_name, "-",
+        f"{IP_RULE_MODE_LABELS[mode]}: {applied} changes, {len(errors)} errors"
+    )
+    text = f"🛡️ قوانین {zone_name} اعمال شد.\n✅ تغییرات موفق: {applied} از {total}"
+    if errors:
+        text += f"\n❌ خطاها ({len(errors)}):\n" + "\n".join(errors[:20])
+    await message.edit_text(text)
 
-async def add_record_content(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """دریافت محتوای رکورد جدید"""
-    text = update.message.text
-    user_id = update.effective_user.id
+@admin_only
+async def iprules_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """اعمال قوانین IP بعد از تایید (در پس‌زمینه، چون ممکن است چند دقیقه طول بکشد)"""
+    query = update.callback_query
+    action, token = query.data.split(':', 1)
+    pending = context.user_data.get('pending_ip_rules', {}).pop(token, None)
     
-    if text == "❌ لغو عملیات":
-        await update.message.reply_text(
-            "عملیات لغو شد.",
-            reply_markup=get_main_keyboard()
-        )
-        return MAIN_MENU
+    if action == 'in':
+        await query.answer()
+        await query.edit_message_text("عملیات لغو شد.")
+        return
+    if not pending:
+        await query.answer("❌ این برنامه منقضی شده است؛ فایل را دوباره ارسال کنید.", show_alert=True)
+        return
     
-    zone_id = context.user_data.get('add_zone_id')
-    zone_name = context.user_data.get('add_zone_name')
-    record_type = context.user_data.get('add_record_type')
-    record_name = context.user_data.get('add_record_name')
+    await query.answer("⏳ در حال اعمال قوانین...")
+    await query.edit_message_text(f"⏳ اعمال قوانین {pending['zone_name']}...")
+    asyncio.ensure_future(run_ip_rules_apply(query.message, update.effective_user, pending))
+
+# ===== هندلرهای زمان‌بندی =====
+@admin_only
+async def jobs_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/jobs - لیست کارهای زمان‌بندی شده"""
+    jobs = job_scheduler.pending_jobs()
+    if not jobs:
+        await update.message.reply_text("⏰ هیچ کار زمان‌بندی شده‌ای وجود ندارد!")
+        return
     
-    record_data = {
-        'type': record_type,
-        'name': record_name,
-        'content': text,
-        'proxied': False,
-        'ttl': 1
-    }
+    text = f"⏰ **کارهای زمان‌بندی شده ({len(jobs)}):**\n\n"
+    for job in jobs[:30]:
+        run_at = datetime.fromtimestamp(job['run_at']).strftime('%Y-%m-%d %H:%M')
+        text += f"#{job['id']} - {run_at}\n"
+        text += f"🌐 {job['zone_name']} - `{job['record_name']}`\n"
+        text += f"📋 `{record_content_text(job['fields'])}`\n\n"
     
-    if record_type in ['A', 'AAAA', 'CNAME']:
-        record_data['proxied'] = True
+    if len(jobs) > 30:
+        text += f"... و {len(jobs) - 30} کار دیگر\n\n"
     
-    success, message = cf_manager.create_dns_record(zone_id, record_data)
+    text += "لغو: `/canceljob ID`"
+    await update.message.reply_text(text, parse_mode='Markdown')
+
+@admin_only
+async def canceljob_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/canceljob ID - لغو کار زمان‌بندی شده"""
+    try:
+        job_id = int(context.args[0])
+    except (IndexError, ValueError):
+        await update.message.reply_text("❌ استفاده: /canceljob ID")
+        return
     
-    if success:
-        change_logger.log_change(
-            user_id,
-            update.effective_user.username,
-            "CREATE",
-            zone_name,
-            record_name,
-            f"Type: {record_type}, Content: {text}"
-        )
-        
+    job = job_scheduler.cancel_job(job_id)
+    if not job:
+        await update.message.reply_text("❌ کار یافت نشد!")
+        return
+    
+    await update.message.reply_text(f"✅ کار #{job_id} ({job['record_name']}) لغو شد.")
+
+# ===== هندلرهای failover =====
+@admin_only
+async def failover_add_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/failover_add NAME PRIMARY BACKUP [http|https|tcp] [PORT] [PATH]"""
+    args = context.args
+    if len(args) < 3:
         await update.message.reply_text(
-            f"✅ رکورد جدید با موفقیت ایجاد شد!\n\n"
-            f"🌐 دامنه: {zone_name}\n"
-            f"🏷️ نام: `{record_name}`\n"
-            f"📌 نوع: `{record_type}`\n"
-            f"📋 محتوا: `{text}`",
-            reply_markup=get_main_keyboard(),
-            parse_mode='Markdown'
+            "❌ استفاده:\n/failover_add NAME PRIMARY BACKUP [http|https|tcp] [PORT] [PATH]\n\n"
+            "مثال: /failover_add app.example.com 203.0.113.10 198.51.100.20 https 443 /health"
         )
-        return MAIN_MENU
-    else:
+        return
+    
+    record_name, primary, backup = args[0].lower(), args[1], args[2]
+    check = args[3].lower() if len(args) > 3 else 'http'
+    if check not in ('http', 'https', 'tcp'):
+        await update.message.reply_text("❌ نوع بررسی باید http، https یا tcp باشد!")
+        return
+    
+    try:
+        port = int(args[4]) if len(args) > 4 else None
+    except ValueError:
+        await update.message.reply_text("❌ پورت نامعتبر است!")
+        return
+    path = args[5] if len(args) > 5 else '/'
+    
+    await record_index.ensure_fresh()
+    entry = next(
+        (e for e in record_index.entries if e.name == record_name and e.type in ('A', 'AAAA', 'CNAME')),
+        None
+    )
+    if not entry:
+        await update.message.reply_text("❌ رکورد A/AAAA/CNAME با این نام یافت نشد!")
+        return
+    
+    targets = []
+    for target in (primary, backup):
+        valid, fields = validate_record_content(entry.type, target)
+        if not valid:
+            await update.message.reply_text(f"❌ {fields}")
+            return
+        targets.append(fields['content'])
+    primary, backup = targets
+    
+    failover = failover_engine.add(
+        entry.zone_id,
+        entry.zone_name,
+        {'id': entry.record_id, 'name': entry.name, 'content': entry.content},
+        primary,
+        backup,
+        check,
+        port,
+        path
+    )
+    if failover is None:
+        existing = failover_engine.find(entry.zone_id, entry.record_id)
         await update.message.reply_text(
-            f"❌ {message}\n\nدوباره امتحان کنید:",
-            reply_markup=get_cancel_keyboard()
+            f"❌ برای {entry.name} قبلاً failover #{existing['id']} ثبت شده است.\n"
+            f"برای تغییر، ابتدا آن را حذف کنید: /failover_remove {existing['id']}"
         )
-        return ADD_RECORD_CONTENT
+        return
+    
+    await update.message.reply_text(
+        f"✅ failover #{failover['id']} ثبت شد.\n\n"
+        f"🏷️ {failover['record_name']}\n"
+        f"🟢 primary: {primary}\n"
+        f"🟡 backup: {backup}\n"
+        f"🩺 بررسی: {check} روی پورت {failover['port']}"
+    )
+
+@admin_only
+async def failover_list_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/failover_list - لیست رکوردهای دارای failover"""
+    entries = list(failover_engine.entries.values())
+    if not entries:
+        await update.message.reply_text("🩺 هیچ failover ثبت نشده است!")
+        return
+    
+    text = "🩺 **failover ها:**\n\n"
+    for entry in entries:
+        active = "🟢 primary" if entry['active'] == 'primary' else "🟡 backup"
+        text += f"#{entry['id']} `{entry['record_name']}` - {active}\n"
+        text += f"   {entry['primary']} / {entry['backup']} ({entry['check']}:{entry['port']})\n"
+        text += f"   خطای پیاپی: {entry['failures']}\n\n"
+    
+    text += "حذف: `/failover_remove ID`"
+    await update.message.reply_text(text, parse_mode='Markdown')
 
-async def change_type_select(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """انتخاب نوع جدید رکورد"""
-    text = update.message.text
+@admin_only
+async def failover_remove_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/failover_remove ID - حذف failover"""
+    try:
+        entry_id = int(context.args[0])
+    except (IndexError, ValueError):
+        await update.message.reply_text("❌ استفاده: /failover_remove ID")
+        return
     
-    if text == "❌ لغو":
+    entry = failover_engine.remove(entry_id)
+    if not entry:
+        await update.message.reply_text("❌ failover یافت نشد!")
+        return
+    
+    await update.message.reply_text(f"✅ failover #{entry_id} ({entry['record_name']}) حذف شد.")
+
+# ===== هندلرهای اشتراک تغییرات =====
+WATCH_KIND_LABELS = {'zone': 'دامنه', 'name': 'نام', 'pattern': 'الگو'}
+
+@admin_only
+async def watch_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/watch VALUE - اشتراک تغییرات یک دامنه، نام رکورد یا الگو (مثل *.api.example.com)"""
+    if not context.args:
         await update.message.reply_text(
-            "عملیات لغو شد.",
-            reply_markup=get_main_keyboard()
+            "❌ استفاده: /watch VALUE\n\n"
+            "مثال‌ها:\n"
+            "/watch example.com - همه رکوردهای دامنه\n"
+            "/watch www.example.com - یک نام\n"
+            "/watch *.api.example.com - الگو"
         )
-        return MAIN_MENU
+        return
     
-    if text not in ['A', 'AAAA', 'CNAME', 'MX', 'TXT', 'NS', 'CAA', 'SRV']:
-        await update.message.reply_text("❌ نوع رکورد نامعتبر!")
-        return CHANGE_TYPE_SELECT
+    value = context.args[0].strip().rstrip('.').lower()
+    if any(char in value for char in '*?['):
+        kind = 'pattern'
+    elif await zone_store.get_zone_id(value):
+        kind = 'zone'
+    else:
+        kind = 'name'
     
-    selected_record = context.user_data.get('selected_record')
-    old_type = selected_record['type']
+    subscription = watch_list.add(update.effective_chat.id, kind, value)
+    await update.message.reply_text(
+        f"🔔 اشتراک #{subscription['id']} ثبت شد ({WATCH_KIND_LABELS[kind]}: {value}).\n"
+        "تغییرات، چه از ربات و چه خارج از آن، به صورت خلاصه ارسال می‌شوند."
+    )
+
+@admin_only
+async def watches_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/watches - لیست اشتراک‌های تغییرات"""
+    subscriptions = watch_list.for_chat(update.effective_chat.id)
+    if not subscriptions:
+        await update.message.reply_text("🔔 هیچ اشتراکی ثبت نشده است!")
+        return
     
-    if text == old_type:
+    text = "🔔 اشتراک‌ها:\n\n"
+    for subscription in subscriptions:
+        text += f"#{subscription['id']} {WATCH_KIND_LABELS[subscription['kind']]}: {subscription['value']}\n"
+    text += "\nحذف: /unwatch ID"
+    await update.message.reply_text(text)
+
+@admin_only
+async def unwatch_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/unwatch ID - حذف اشتراک"""
+    try:
+        subscription_id = int(context.args[0])
+    except (IndexError, ValueError):
+        await update.message.reply_text("❌ استفاده: /unwatch ID")
+        return
+    
+    subscription = watch_list.remove(update.effective_chat.id, subscription_id)
+    if not subscription:
+        await update.message.reply_text("❌ اشتراک یافت نشد!")
+        return
+    
+    await update.message.reply_text(f"✅ اشتراک #{subscription_id} ({subscription['value']}) حذف شد.")
+
+# ===== هندلرهای پاکسازی کش =====
+PURGE_COMMAND_KINDS = {
+    'everything': 'everything',
+    'url': 'files',
+    'prefix': 'prefixes',
+    'tag': 'tags',
+    'host': 'hosts'
+}
+
+async def report_purge(message, user, zone_id, zone_name, kind, values, description):
+    """انتظار برای اجرای صف و گزارش نتیجه (در پس‌زمینه)"""
+    try:
+        calls, merged, errors = await purge_queue.purge(zone_id, kind, values)
+    except Exception as e:
+        logger.error(f"Error purging cache: {e}")
+        await message.reply_text(f"❌ خطا در پاکسازی کش {zone_name}: {e}")
+        return
+    
+    if errors:
+        await message.reply_text(f"❌ پاکسازی کش {zone_name} ناموفق بود:\n" + "\n".join(errors[:5]))
+        return
+    
+    change_logger.log_change(user.id, user.username, "PURGE", zone_name, "-", description)
+    text = f"🧹 کش {zone_name} پاکسازی شد ({description})."
+    if merged > 1:
+        text += f"\n{merged} درخواست با {calls} فراخوانی API انجام شد."
+    await message.reply_text(text)
+
+def start_purge_report(message, user, zone_id, zone_name, kind, values, description):
+    """ثبت در صف؛ هندلر منتظر پنجره ادغام نمی‌ماند"""
+    asyncio.ensure_future(report_purge(message, user, zone_id, zone_name, kind, values, description))
+
+@admin_only
+async def purge_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/purge ZONE everything|url|prefix|tag|host [VALUES...] - پاکسازی کش"""
+    args = context.args or []
+    kind = PURGE_COMMAND_KINDS.get(args[1].lower()) if len(args) >= 2 else None
+    values = args[2:]
+    if not kind or (kind != 'everything' and not values):
         await update.message.reply_text(
-            "❌ نوع جدید با نوع فعلی یکسان است!",
-            reply_markup=get_main_keyboard()
+            "❌ استفاده: /purge ZONE everything|url|prefix|tag|host VALUES...\n\n"
+            "مثال‌ها:\n"
+            "/purge example.com url https://example.com/a.css https://example.com/b.js\n"
+            "/purge example.com prefix example.com/static\n"
+            "/purge example.com tag product-12\n"
+            "/purge example.com everything"
         )
-        return MAIN_MENU
+        return
     
-    context.user_data['new_record_type'] = text
+    zone_name = args[0].strip().rstrip('.').lower()
+    zone_id = await zone_store.get_zone_id(zone_name)
+    if not zone_id:
+        await update.message.reply_text("❌ دامنه یافت نشد!")
+        return
     
-    examples = {
-        'A': "192.168.1.1",
-        'AAAA': "2001:db8::1",
-        'CNAME': "target.example.com",
-        'MX': "10 mail.example.com",
-        'TXT': '"v=spf1 include:example.com ~all"',
-        'NS': "ns1.example.com",
-        'CAA': '0 issue "letsencrypt.org"',
-        'SRV': "10 60 5060 sipserver.example.com"
-    }
+    if kind == 'files':
+        invalid = [value for value in values if not re.match(r'^https?://[^/\s]+', value, re.IGNORECASE)]
+        if invalid:
+            await update.message.reply_text(f"❌ URL نامعتبر: {invalid[0]}\nURL باید با http:// یا https:// شروع شود.")
+            return
     
-    example = examples.get(text, "example.com")
+    description = args[1].lower() if kind == 'everything' else f"{args[1].lower()}: {', '.join(values[:3])}"
+    if len(values) > 3:
+        description += f" (+{len(values) - 3})"
     
+    start_purge_report(update.message, update.effective_user, zone_id, zone_name, kind, values, description)
     await update.message.reply_text(
-        f"🔄 **تغییر نوع رکورد از {old_type} به {text}**\n\n"
-        f"محتوای جدید را برای رکورد نوع {text} وارد کنید:\n"
-        f"مثال: `{example}`\n\n"
-        "⚠️ توجه: با تغییر نوع رکورد، محتوای قبلی از بین می‌رود.",
-        reply_markup=get_cancel_keyboard(),
-        parse_mode='Markdown'
+        f"🧹 درخواست پاکسازی در صف قرار گرفت؛ درخواست‌های {PURGE_COALESCE_WINDOW} ثانیه آینده با آن ادغام می‌شوند."
     )
+
+async def notify_admins(application: Application, text):
+    """ارسال پیام به همه ادمین‌ها"""
+    for admin_id in ADMIN_IDS:
+        try:
+            await application.bot.send_message(admin_id, text)
+        except Exception as e:
+            logger.error(f"Error notifying admin {admin_id}: {e}")
+
+# ===== هندلرهای بررسی سلامت =====
+@admin_only
+async def audit_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/audit - بررسی سلامت رکوردهای همه دامنه‌ها روی داده کش شده (بدون درخواست API رکوردها)"""
+    zones = await zone_store.get_zones()
+    zone_records = zone_store.cached_records()
+    scanned = [zone for zone in zones if zone[1] in zone_records]
+    total = sum(len(zone_records[zone_id]) for _, zone_id in scanned)
     
-    return CHANGE_TYPE_CONTENT
+    loop = asyncio.get_running_loop()
+    issues = await loop.run_in_executor(None, audit_records, scanned, zone_records)
+    issue_count = sum(len(found) for found in issues.values())
+    
+    text = f"🩺 بررسی سلامت: {len(scanned)} دامنه، {total} رکورد\n"
+    if len(scanned) < len(zones):
+        text += f"⚠️ {len(zones) - len(scanned)} دامنه هنوز در کش نیست و بررسی نشد.\n"
+    
+    if not issue_count:
+        await update.message.reply_text(text + "\n✅ مشکلی یافت نشد.")
+        return
+    
+    await update.message.reply_text(text + "\n" + format_audit_report(issues, limit=AUDIT_EXAMPLES))
+    if any(len(found) > AUDIT_EXAMPLES for found in issues.values()):
+        await update.message.reply_document(
+            document=io.BytesIO(format_audit_report(issues).encode('utf-8')),
+            filename=f"audit-{datetime.now():%Y%m%d-%H%M%S}.txt",
+            caption=f"📄 گزارش کامل ({issue_count} مورد)"
+        )
 
-async def change_type_content(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """دریافت محتوای جدید برای تغییر نوع"""
-    text = update.message.text
-    user_id = update.effective_user.id
+# ===== هندلرهای تنظیمات دامنه =====
+@admin_only
+async def settings_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/settings [refresh] - جدول مقایسه تنظیمات همه دامنه‌ها"""
+    max_age = 0 if context.args and context.args[0].lower() == 'refresh' else None
+    zones = await zone_store.get_zones()
+    if not zones:
+        await update.message.reply_text("❌ هیچ دامنه‌ای یافت نشد!")
+        return
     
-    if text == "❌ لغو عملیات":
+    settings = await zone_settings.get_zones([zone_id for _, zone_id in zones], max_age=max_age)
+    fetched = [zone_settings.fetched_at(zone_id) for _, zone_id in zones if zone_settings.fetched_at(zone_id)]
+    age = int(time.monotonic() - min(fetched)) if fetched else 0
+    
+    text = f"⚙️ **تنظیمات دامنه‌ها** (به‌روزرسانی {age} ثانیه پیش)\n\n"
+    text += f"```\n{format_settings_matrix(zones, settings)}\n```\n"
+    text += "تغییر: `/setsetting SETTING VALUE ZONE...|all`\n"
+    text += "\n".join(
+        f"• `{setting}`: {' | '.join(allowed) if allowed else 'off | css,html,js'}"
+        for setting, (_, allowed) in ZONE_SETTINGS.items()
+    )
+    await update.message.reply_text(text, parse_mode='Markdown')
+
+@admin_only
+async def setsetting_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/setsetting SETTING VALUE ZONE...|all - اعمال یک تنظیم روی چند دامنه (با تایید)"""
+    args = context.args or []
+    if len(args) < 3:
         await update.message.reply_text(
-            "عملیات لغو شد.",
-            reply_markup=get_main_keyboard()
+            "❌ استفاده: /setsetting SETTING VALUE ZONE...|all\n\n"
+            "مثال‌ها:\n"
+            "/setsetting ssl strict all\n"
+            "/setsetting always_use_https on example.com example.org\n"
+            "/setsetting minify css,js all"
         )
-        return MAIN_MENU
+        return
     
-    selected_record = context.user_data.get('selected_record')
-    zone_id = context.user_data.get('current_zone_id')
-    zone_name = context.user_data.get('current_zone_name')
-    new_type = context.user_data.get('new_record_type')
+    setting = args[0].lower()
+    try:
+        value = parse_setting_value(setting, args[1])
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
     
-    # حذف رکورد قدیمی
-    success, message = cf_manager.delete_dns_record(zone_id, selected_record['id'])
+    zones = await zone_store.get_zones()
+    if [arg.lower() for arg in args[2:]] == ['all']:
+        targets = zones
+    else:
+        by_name = dict(zones)
+        names = [arg.strip().rstrip('.').lower() for arg in args[2:]]
+        missing = [name for name in names if name not in by_name]
+        if missing:
+            await update.message.reply_text(f"❌ دامنه یافت نشد: {', '.join(missing)}")
+            return
+        targets = [(name, by_name[name]) for name in dict.fromkeys(names)]
     
-    if not success:
-        await update.message.reply_text(f"❌ خطا در حذف رکورد قدیمی: {message}")
-        return MAIN_MENU
+    # فقط دامنه‌هایی که مقدار فعلی آن‌ها متفاوت است (یا نامعلوم است) تغییر می‌کنند
+    current = await zone_settings.get_zones([zone_id for _, zone_id in targets])
+    changes = [
+        (zone_name, zone_id) for zone_name, zone_id in targets
+        if isinstance(current[zone_id], Exception) or current[zone_id].get(setting) != value
+    ]
+    label = format_setting_value(setting, value)
+    if not changes:
+        await update.message.reply_text(f"✅ {setting} در همه دامنه‌های انتخاب شده از قبل {label} است.")
+        return
     
-    # ایجاد رکورد جدید
-    record_data = {
-        'type': new_type,
-        'name': selected_record['name'],
-        'content': text,
-        'proxied': False,
-        'ttl': 1
+    token = hashlib.sha256(f"{setting}:{label}:{changes}".encode('utf-8')).hexdigest()[:16]
+    context.user_data.setdefault('pending_settings', {})[token] = {
+        'setting': setting,
+        'value': value,
+        'zones': changes
     }
     
-    if new_type in ['A', 'AAAA', 'CNAME']:
-        record_data['proxied'] = selected_record.get('proxied', False)
+    text = f"⚙️ {setting} → {label}\n{len(changes)} دامنه تغییر می‌کند:\n\n"
+    text += "\n".join(
+        f"• {zone_name}: {format_setting_value(setting, None if isinstance(current[zone_id], Exception) else current[zone_id].get(setting))}"
+        for zone_name, zone_id in changes[:30]
+    )
+    if len(changes) > 30:
+        text += f"\n... و {len(changes) - 30} دامنه دیگر"
+    keyboard = InlineKeyboardMarkup([[
+        InlineKeyboardButton("✅ اجرا", callback_data=f"gy:{token}"),
+        InlineKeyboardButton("❌ لغو", callback_data=f"gn:{token}")
+    ]])
+    await update.message.reply_text(text + "\n\nآیا اجرا شود؟", reply_markup=keyboard)
+
+@admin_only
+async def setsetting_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """اعمال تنظیم بعد از تایید"""
+    query = update.callback_query
+    action, token = query.data.split(':', 1)
+    pending = context.user_data.get('pending_settings', {}).pop(token, None)
     
-    success, message = cf_manager.create_dns_record(zone_id, record_data)
+    if action == 'gn':
+        await query.answer()
+        await query.edit_message_text("عملیات لغو شد.")
+        return
+    if not pending:
+        await query.answer("❌ این درخواست منقضی شده است؛ دستور را دوباره ارسال کنید.", show_alert=True)
+        return
     
-    if success:
-        change_logger.log_change(
-            user_id,
-            update.effective_user.username,
-            "UPDATE",
-            zone_name,
-            selected_record['name'],
-            f"Type changed from {selected_record['type']} to {new_type}, New content: {text}"
+    await query.answer("⏳ در حال اعمال تنظیم...")
+    setting, value, zones = pending['setting'], pending['value'], pending['zones']
+    applied, errors = await zone_settings.apply(zones, setting, value)
+    
+    label = format_setting_value(setting, value)
+    change_logger.log_change(
+        update.effective_user.id,
+        update.effective_user.username,
+        "SETTINGS",
+        ', '.join(zone_name for zone_name, _ in zones[:5]) + (f" (+{len(zones) - 5})" if len(zones) > 5 else ""),
+        "-",
+        f"{setting} = {label}: {applied} zones, {len(errors)} errors"
+    )
+    
+    text = f"⚙️ {setting} → {label}\n✅ دامنه‌های موفق: {applied} از {len(zones)}"
+    if errors:
+        text += f"\n❌ خطاها ({len(errors)}):\n" + "\n".join(errors[:20])
+    await query.edit_message_text(text)
+
+# ===== هندلرهای پروفایل =====
+async def run_profiling_window(tool, kind, seconds, bot, chat_id):
+    """تا پایان بازه یا درخواست توقف صبر می‌کند و گزارش را به صورت فایل می‌فرستد"""
+    stop_requested = profiling_windows[kind]
+    try:
+        await asyncio.wait_for(stop_requested.wait(), seconds)
+    except asyncio.TimeoutError:
+        pass
+    
+    loop = asyncio.get_running_loop()
+    try:
+        report = await loop.run_in_executor(None, tool.stop)
+    finally:
+        del profiling_windows[kind]
+    
+    filename = f"{kind}-{datetime.now():%Y%m%d-%H%M%S}.txt"
+    try:
+        await bot.send_document(
+            chat_id,
+            document=io.BytesIO(report.encode('utf-8')),
+            filename=filename,
+            caption=f"📄 گزارش {kind}"
         )
-        
+    except Exception as e:
+        logger.error(f"Error sending {kind} report: {e}")
+
+async def toggle_profiling(update: Update, context: ContextTypes.DEFAULT_TYPE, tool, kind):
+    """شروع (با مدت اختیاری به ثانیه) یا توقف زودهنگام یک ابزار پروفایل"""
+    arg = context.args[0].lower() if context.args else ''
+    
+    if arg in ('stop', 'off'):
+        if kind not in profiling_windows:
+            await update.message.reply_text(f"❌ {kind} فعال نیست!")
+            return
+        profiling_windows[kind].set()
+        await update.message.reply_text(f"⏹️ {kind} متوقف شد؛ گزارش ارسال می‌شود...")
+        return
+    
+    if kind in profiling_windows:
+        elapsed = time.monotonic() - tool.started_at
         await update.message.reply_text(
-            f"✅ نوع رکورد با موفقیت تغییر کرد!\n\n"
-            f"🏷️ نام: `{selected_record['name']}`\n"
-            f"📌 نوع جدید: `{new_type}`\n"
-            f"📋 محتوای جدید: `{text}`",
-            reply_markup=get_main_keyboard(),
-            parse_mode='Markdown'
+            f"⚠️ {kind} از {elapsed:.0f} ثانیه پیش فعال است. توقف: /{kind} stop"
         )
-        return MAIN_MENU
+        return
+    
+    try:
+        seconds = int(arg) if arg else PROFILE_DEFAULT_WINDOW
+    except ValueError:
+        await update.message.reply_text(f"❌ استفاده: /{kind} [ثانیه|stop]")
+        return
+    seconds = max(1, min(seconds, PROFILE_MAX_WINDOW))
+    
+    tool.start()
+    profiling_windows[kind] = asyncio.Event()
+    asyncio.ensure_future(run_profiling_window(
+        tool, kind, seconds, context.bot, update.effective_chat.id
+    ))
+    logger.info(f"{kind} started by {update.effective_user.id} for {seconds}s")
+    
+    await update.message.reply_text(
+        f"▶️ {kind} برای {seconds} ثانیه فعال شد.\n"
+        f"توقف زودتر: /{kind} stop"
+    )
+
+@admin_only
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/profile [ثانیه|stop] - پروفایل نمونه‌برداری CPU"""
+    await toggle_profiling(update, context, cpu_profiler, 'profile')
+
+@admin_only
+async def memtrace_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/memtrace [ثانیه|stop] - ردیابی تخصیص حافظه با tracemalloc"""
+    await toggle_profiling(update, context, memory_tracer, 'memtrace')
+
+# ===== هندلرهای کارهای سنگین =====
+async def run_worker_job(message, description, func, *args):
+    """
+    اجرای کار سنگین در WorkerPool با پیام پیشرفت در تلگرام.
+    در صورت شکست یا لغو، پیام وضعیت به‌روز و WorkerJobError ارسال می‌شود.
+    """
+    status = []
+    last_edit = [0.0]
+    
+    async def on_progress(job):
+        now = time.monotonic()
+        if not status or now - last_edit[0] < WORKER_PROGRESS_INTERVAL:
+            return
+        last_edit[0] = now
+        try:
+            await status[0].edit_text(f"{format_worker_job(job)}\nلغو: /killtask {job.id}")
+        except Exception as e:
+            logger.debug(f"Error updating job progress: {e}")
+    
+    job = worker_pool.submit(func, *args, description=description, on_progress=on_progress)
+    status.append(await message.reply_text(f"{format_worker_job(job)}\nلغو: /killtask {job.id}"))
+    
+    try:
+        result = await job.future
+    except WorkerJobError:
+        await status[0].edit_text(format_worker_job(job))
+        raise
+    
+    await status[0].delete()
+    return result
+
+@admin_only
+async def tasks_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/tasks - وضعیت کارهای سنگین"""
+    jobs = list(worker_pool.jobs.values())
+    if not jobs:
+        await update.message.reply_text("⚙️ هیچ کار سنگینی ثبت نشده است!")
+        return
+    
+    text = f"⚙️ کارهای سنگین ({worker_pool.processes} process):\n\n"
+    text += "\n".join(format_worker_job(job) for job in reversed(jobs))
+    text += "\n\nلغو: /killtask ID"
+    await update.message.reply_text(text)
+
+@admin_only
+async def killtask_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/killtask ID - لغو کار سنگین در صف یا در حال اجرا"""
+    try:
+        job_id = int(context.args[0])
+    except (IndexError, ValueError):
+        await update.message.reply_text("❌ استفاده: /killtask ID")
+        return
+    
+    if worker_pool.cancel(job_id):
+        await update.message.reply_text(f"⏹️ کار #{job_id} لغو شد.")
     else:
-        # بازگرداندن رکورد قدیمی در صورت خطا
-        cf_manager.create_dns_record(zone_id, {
-            'type': selected_record['type'],
-            'name': selected_record['name'],
-            'content': selected_record['content'],
-            'proxied': selected_record.get('proxied', False),
-            'ttl': selected_record.get('ttl', 1)
-        })
-        
-        await update.message.reply_text(f"❌ خطا در ایجاد رکورد جدید: {message}")
-        return MAIN_MENU
+        await update.message.reply_text("❌ کار در حال اجرا با این شناسه یافت نشد!")
 
-async def confirm_delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """تایید حذف رکورد"""
-    text = update.message.text
-    user_id = update.effective_user.id
+# ===== هندلرهای کیبورد شیشه‌ای =====
+async def inline_select_domain(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """انتخاب دامنه از کیبورد شیشه‌ای"""
+    query = update.callback_query
+    zone_id = query.data[2:]
     
-    if text == "❌ خیر":
-        await update.message.reply_text(
-            "عملیات لغو شد.",
-            reply_markup=get_main_keyboard()
-        )
+    zone_name = await zone_store.get_zone_name(zone_id)
+    if not zone_name:
+        await query.answer("❌ دامنه یافت نشد!", show_alert=True)
         return MAIN_MENU
     
-    if text == "✅ بله":
-        selected_record = context.user_data.get('selected_record')
-        zone_id = context.user_data.get('current_zone_id')
-        zone_name = context.user_data.get('current_zone_name')
-        
-        success, message = cf_manager.delete_dns_record(zone_id, selected_record['id'])
-        
-        if success:
-            change_logger.log_change(
-                user_id,
-                update.effective_user.username,
-                "DELETE",
-                zone_name,
-                selected_record['name'],
-                f"Type: {selected_record['type']}, Content: {selected_record['content']}"
-            )
-            
-            await update.message.reply_text(
-                f"✅ رکورد با موفقیت حذف شد!\n\n"
-                f"🏷️ نام: `{selected_record['name']}`\n"
-                f"📌 نوع: `{selected_record['type']}`",
-                reply_markup=get_main_keyboard(),
-                parse_mode='Markdown'
-            )
-            return MAIN_MENU
-        else:
-            await update.message.reply_text(f"❌ {message}")
-            return MAIN_MENU
+    records = await zone_store.get_records(zone_id)
+    if not records:
+        await query.answer("❌ هیچ رکوردی یافت نشد!", show_alert=True)
+        return MAIN_MENU
     
-    return CONFIRM_DELETE
+    await query.answer()
+    
+    context.user_data['current_zone_id'] = zone_id
+    context.user_data['current_zone_name'] = zone_name
+    context.user_data['current_page'] = 1
+    
+    await query.edit_message_text(
+        f"📋 رکوردهای دامنه **{zone_name}**\n"
+        f"تعداد: {len(records)} رکورد\n\n"
+        "رکورد مورد نظر را انتخاب کنید:",
+        reply_markup=get_records_inline_keyboard(records, page=1),
+        parse_mode='Markdown'
+    )
+    return MAIN_MENU
 
-async def search_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """پردازش جستجو"""
-    text = update.message.text
+async def inline_domains(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """بازگشت به لیست دامنه‌ها در همان پیام"""
+    query = update.callback_query
+    zones = await zone_store.get_zones()
+    zone_store.prefetch([zone_id for _, zone_id in zones])
     
-    if text == "❌ لغو عملیات":
-        await update.message.reply_text(
-            "عملیات لغو شد.",
-            reply_markup=get_main_keyboard()
-        )
+    await query.answer()
+    await query.edit_message_text(
+        "🔍 دامنه مورد نظر را انتخاب کنید:",
+        reply_markup=get_domains_inline_keyboard(zones)
+    )
+    return MAIN_MENU
+
+async def inline_navigate(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """تغییر صفحه رکوردها فقط با ویرایش کیبورد"""
+    query = update.callback_query
+    records = await zone_store.get_records(context.user_data.get('current_zone_id'))
+    
+    if not records:
+        await query.answer("❌ اطلاعات منقضی شده، دوباره دامنه را انتخاب کنید.", show_alert=True)
         return MAIN_MENU
     
-    results = cf_manager.search_records(text)
+    total_pages = math.ceil(len(records) / RECORDS_PER_PAGE)
+    page = min(max(1, int(query.data[2:])), total_pages)
+    context.user_data['current_page'] = page
     
-    if not results:
-        await update.message.reply_text(
-            "❌ هیچ نتیجه‌ای یافت نشد!",
-            reply_markup=get_main_keyboard()
-        )
+    await query.answer()
+    await query.edit_message_reply_markup(
+        reply_markup=get_records_inline_keyboard(records, page=page)
+    )
+    return MAIN_MENU
+
+async def inline_select_record(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """انتخاب رکورد با شناسه"""
+    query = update.callback_query
+    selected_record = await zone_store.get_record(
+        context.user_data.get('current_zone_id'), query.data[2:]
+    )
+    
+    if not selected_record:
+        await query.answer("❌ رکورد یافت نشد!", show_alert=True)
         return MAIN_MENU
     
-    response = f"🔍 **نتایج جستجو برای: `{text}`**\n\n"
+    context.user_data['selected_record'] = selected_record
+    zone_store.prefetch_details(selected_record)
     
-    for i, result in enumerate(results[:10], 1):
-        record = result['record']
-        zone_name = result['zone_name']
-        
-        proxied = "🟠" if record.get('proxied') else "⚪"
-        
-        response += f"{i}. {proxied} **{record['name']}**\n"
-        response += f"   🌐 دامنه: {zone_name}\n"
-        response += f"   📌 نوع: {record['type']}\n"
-        response += f"   📋 محتوا: `{record['content']}`\n\n"
+    await query.answer()
+    await query.edit_message_text(
+        format_record_details(selected_record),
+        reply_markup=get_record_actions_inline_keyboard(selected_record['type']),
+        parse_mode='Markdown'
+    )
+    return MAIN_MENU
+
+async def inline_search_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """صفحه دیگری از نتایج جستجوی ذخیره شده (بدون جستجوی دوباره)"""
+    query = update.callback_query
+    search = context.user_data.get('search')
     
-    if len(results) > 10:
-        response += f"... و {len(results) - 10} نتیجه دیگر"
+    if not search:
+        await query.answer("❌ نتایج جستجو منقضی شده است؛ دوباره جستجو کنید.", show_alert=True)
+        return MAIN_MENU
     
-    await update.message.reply_text(
-        response,
-        reply_markup=get_main_keyboard(),
+    matches = search['matches']
+    total_pages = max(1, math.ceil(len(matches) / SEARCH_RESULTS_PER_PAGE))
+    page = max(1, min(int(query.data[3:]), total_pages))
+    
+    await query.answer()
+    await query.edit_message_text(
+        format_search_page(search['query'], matches, page),
+        reply_markup=get_search_results_inline_keyboard(matches, page),
         parse_mode='Markdown'
     )
+    return MAIN_MENU
+
+async def inline_search_select(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """انتخاب یک نتیجه جستجو و رفتن به عملیات روی رکورد"""
+    query = update.callback_query
+    search = context.user_data.get('search')
+    index = int(query.data[2:])
+    
+    if not search or index >= len(search['matches']):
+        await query.answer("❌ نتایج جستجو منقضی شده است؛ دوباره جستجو کنید.", show_alert=True)
+        return MAIN_MENU
+    
+    entry = search['matches'][index]
+    selected_record = await zone_store.get_record(entry.zone_id, entry.record_id)
+    if not selected_record:
+        await query.answer("❌ رکورد یافت نشد! ممکن است حذف شده باشد.", show_alert=True)
+        return MAIN_MENU
+    
+    context.user_data['current_zone_id'] = entry.zone_id
+    context.user_data['current_zone_name'] = entry.zone_name
+    context.user_data['current_page'] = 1
+    context.user_data['selected_record'] = selected_record
+    zone_store.prefetch_details(selected_record)
     
+    await query.answer()
+    await query.edit_message_text(
+        format_record_details(selected_record),
+        reply_markup=get_record_actions_inline_keyboard(selected_record['type']),
+        parse_mode='Markdown'
+    )
     return MAIN_MENU
 
+async def inline_record_action(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """عملیات روی رکورد از کیبورد شیشه‌ای"""
+    query = update.callback_query
+    action = query.data[2:]
+    
+    if action == 'b':
+        records = await zone_store.get_records(context.user_data.get('current_zone_id'))
+        zone_name = context.user_data.get('current_zone_name', '')
+        current_page = context.user_data.get('current_page', 1)
+        
+        await query.answer()
+        await query.edit_message_text(
+            f"📋 رکوردهای دامنه **{zone_name}**\n"
+            f"تعداد: {len(records)} رکورد\n\n"
+            "رکورد مورد نظر را انتخاب کنید:",
+            reply_markup=get_records_inline_keyboard(records, page=current_page),
+            parse_mode='Markdown'
+        )
+        return MAIN_MENU
+    
+    if action != 'x':
+        await query.answer()
+    
+    return await run_record_action(update, context, action)
+
+async def inline_noop(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """دکمه‌های نمایشی (عنوان گروه و شماره صفحه)"""
+    await update.callback_query.answer()
+
+def get_inline_handlers():
+    """هندلرهای callback کیبورد شیشه‌ای"""
+    return [
+        CallbackQueryHandler(inline_select_domain, pattern=r'^z:'),
+        CallbackQueryHandler(inline_domains, pattern=r'^zl$'),
+        CallbackQueryHandler(inline_navigate, pattern=r'^p:\d+$'),
+        CallbackQueryHandler(inline_select_record, pattern=r'^r:'),
+        CallbackQueryHandler(inline_record_action, pattern=r'^a:'),
+        CallbackQueryHandler(inline_search_page, pattern=r'^qp:\d+$'),
+        CallbackQueryHandler(inline_search_select, pattern=r'^q:\d+$'),
+        CallbackQueryHandler(inline_noop, pattern=r'^n$')
+    ]
+
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """لغو عملیات"""
     await update.message.reply_text(
@@ -1139,13 +6196,14 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # ===== تنظیم ConversationHandler =====
 def get_conversation_handler():
     """ایجاد ConversationHandler"""
+    inline_handlers = get_inline_handlers()
     return ConversationHandler(
         entry_points=[CommandHandler('start', start)],
         states={
-            MAIN_MENU: [MessageHandler(filters.TEXT & ~filters.COMMAND, main_menu)],
-            SELECT_DOMAIN: [MessageHandler(filters.TEXT & ~filters.COMMAND, select_domain)],
-            SELECT_RECORD: [MessageHandler(filters.TEXT & ~filters.COMMAND, select_record)],
-            RECORD_ACTIONS: [MessageHandler(filters.TEXT & ~filters.COMMAND, record_actions)],
+            MAIN_MENU: [MessageHandler(filters.TEXT & ~filters.COMMAND, main_menu)] + inline_handlers,
+            SELECT_DOMAIN: [MessageHandler(filters.TEXT & ~filters.COMMAND, select_domain)] + inline_handlers,
+            SELECT_RECORD: [MessageHandler(filters.TEXT & ~filters.COMMAND, select_record)] + inline_handlers,
+            RECORD_ACTIONS: [MessageHandler(filters.TEXT & ~filters.COMMAND, record_actions)] + inline_handlers,
             EDIT_CONTENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, edit_content)],
             ADD_RECORD_DOMAIN: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_record_domain)],
             ADD_RECORD_TYPE: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_record_type)],
@@ -1155,18 +6213,70 @@ def get_conversation_handler():
             SEARCH_QUERY: [MessageHandler(filters.TEXT & ~filters.COMMAND, search_query)],
             CHANGE_TYPE_SELECT: [MessageHandler(filters.TEXT & ~filters.COMMAND, change_type_select)],
             CHANGE_TYPE_CONTENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, change_type_content)],
-            NAVIGATE_RECORDS: [MessageHandler(filters.TEXT & ~filters.COMMAND, navigate_records)]
+            NAVIGATE_RECORDS: [MessageHandler(filters.TEXT & ~filters.COMMAND, navigate_records)],
+            SCHEDULE_CONTENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, schedule_content)],
+            SCHEDULE_TIME: [MessageHandler(filters.TEXT & ~filters.COMMAND, schedule_time)],
+            IP_QUERY: [MessageHandler(filters.TEXT & ~filters.COMMAND, ip_query)]
         },
         fallbacks=[CommandHandler('cancel', cancel)]
     )
 
 # ===== شروع ربات =====
+async def post_init(application: Application):
+    """کارهای پس‌زمینه بعد از راه‌اندازی"""
+    # گرم کردن ایندکس جستجو تا اولین جستجوی inline منتظر نماند
+    asyncio.ensure_future(record_index.refresh())
+    asyncio.ensure_future(periodic_snapshots())
+    asyncio.ensure_future(job_scheduler.run(
+        notify=lambda chat_id, text: application.bot.send_message(chat_id, text)
+    ))
+    failover_engine.start(notify=lambda text: notify_admins(application, text))
+    asyncio.ensure_future(watch_list.run(
+        notify=lambda chat_id, text: application.bot.send_message(chat_id, text)
+    ))
+
 def main():
     """تابع اصلی"""
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = Application.builder().token(BOT_TOKEN).post_init(post_init).build()
     
     # اضافه کردن هندلرها
     application.add_handler(get_conversation_handler())
+    application.add_handler(InlineQueryHandler(inline_search))
+    application.add_handler(CommandHandler('snapshot', snapshot_command))
+    application.add_handler(CommandHandler('snapshots', snapshots_command))
+    application.add_handler(CommandHandler('snapdiff', snapdiff_command))
+    application.add_handler(CommandHandler('restore', restore_command))
+    application.add_handler(CallbackQueryHandler(restore_confirm, pattern=r'^sr:\d+$'))
+    application.add_handler(CommandHandler('sync', sync_command))
+    application.add_handler(MessageHandler(
+        filters.Document.FileExtension('yaml') | filters.Document.FileExtension('yml')
+        | filters.Document.FileExtension('json'),
+        sync_document
+    ))
+    application.add_handler(CallbackQueryHandler(sync_confirm, pattern=r'^s[yn]:[0-9a-f]+$'))
+    application.add_handler(CommandHandler('jobs', jobs_command))
+    application.add_handler(CommandHandler('canceljob', canceljob_command))
+    application.add_handler(CommandHandler('failover_add', failover_add_command))
+    application.add_handler(CommandHandler('failover_list', failover_list_command))
+    application.add_handler(CommandHandler('failover_remove', failover_remove_command))
+    application.add_handler(CommandHandler('watch', watch_command))
+    application.add_handler(CommandHandler('watches', watches_command))
+    application.add_handler(CommandHandler('unwatch', unwatch_command))
+    application.add_handler(CommandHandler('purge', purge_command))
+    application.add_handler(CommandHandler('iprules', iprules_command))
+    application.add_handler(MessageHandler(
+        filters.Document.FileExtension('txt') | filters.Document.FileExtension('csv'),
+        iprules_document
+    ))
+    application.add_handler(CallbackQueryHandler(iprules_confirm, pattern=r'^i[yn]:[0-9a-f]+$'))
+    application.add_handler(CommandHandler('audit', audit_command))
+    application.add_handler(CommandHandler('settings', settings_command))
+    application.add_handler(CommandHandler('setsetting', setsetting_command))
+    application.add_handler(CallbackQueryHandler(setsetting_confirm, pattern=r'^g[yn]:[0-9a-f]+$'))
+    application.add_handler(CommandHandler('profile', profile_command))
+    application.add_handler(CommandHandler('memtrace', memtrace_command))
+    application.add_handler(CommandHandler('tasks', tasks_command))
+    application.add_handler(CommandHandler('killtask', killtask_command))
     
     # شروع ربات
     print("✅ ربات شروع به کار کرد...")
@@ -7,3 +7,4 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 CF_API_TOKEN = os.getenv("CF_API_TOKEN")
 ADMIN_IDS = [int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x]
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+CF_GRAPHQL_URL = os.getenv("CF_GRAPHQL_URL", "https://api.cloudflare.com/client/v4/graphql")
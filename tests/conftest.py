@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# تنظیمات لازم برای import شدن bot.py بدون فایل .env واقعی
+os.environ.setdefault('BOT_TOKEN', 'test-token')
+os.environ.setdefault('CF_API_TOKEN', 'test-token')
+os.environ.setdefault('ADMIN_IDS', '1')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# bot.py فایل لاگ و فایل‌های داده را در مسیر جاری می‌سازد؛ تست‌ها مخزن را تغییر نمی‌دهند
+os.chdir(tempfile.mkdtemp(prefix='cfbot-tests-'))
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import bot
+
+
+class FakeGraphQL:
+    """
+    endpoint محلی GraphQL؛ برای هر دامنه سطل‌های ساعتی groups[zone_id] را
+    (فیلتر شده با since/until درخواست) برمی‌گرداند و درخواست‌ها را ثبت می‌کند.
+    """
+    def __init__(self):
+        self.groups = {}
+        self.errors = None
+        self.delay = 0
+        self.requests = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                fake.requests.append((self.headers.get('Authorization'), body))
+                time.sleep(fake.delay)
+                self._reply(fake.response(body['variables']))
+
+            def _reply(self, payload):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/graphql"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def response(self, variables):
+        if self.errors:
+            return {'data': None, 'errors': self.errors}
+        since = bot._from_api_time(variables['since'])
+        until = bot._from_api_time(variables['until'])
+        groups = [
+            {
+                'dimensions': {'datetime': bot._to_api_time(start)},
+                'sum': dict(zip(bot.ANALYTICS_FIELDS, values))
+            }
+            for start, values in sorted(self.groups.get(variables['zoneTag'], {}).items())
+            if since <= start < until
+        ]
+        return {'data': {'viewer': {'zones': [{'httpRequests1hGroups': groups}]}}, 'errors': None}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def graphql():
+    fake = FakeGraphQL()
+    yield fake
+    fake.close()
+
+
+def hour(offset):
+    """شروع ساعت offset ساعت قبل از ساعت جاری"""
+    return (int(time.time()) // 3600 - offset) * 3600
+
+
+def test_get_zone_reads_hourly_buckets(graphql):
+    graphql.groups['z1'] = {
+        hour(2): (10, 4, 1000, 400, 1, 7),
+        hour(1): (20, 5, 2000, 500, 0, 9),
+        hour(48): (99, 0, 0, 0, 0, 0)  # خارج از بازه
+    }
+    analytics = bot.ZoneAnalytics('secret', url=graphql.url)
+
+    buckets = asyncio.run(analytics.get_zone('z1'))
+
+    assert buckets == {hour(2): (10, 4, 1000, 400, 1, 7), hour(1): (20, 5, 2000, 500, 0, 9)}
+    authorization, body = graphql.requests[0]
+    assert authorization == 'Bearer secret'
+    assert body['variables']['zoneTag'] == 'z1'
+    assert body['variables']['since'] == bot._to_api_time(hour(bot.ANALYTICS_WINDOW_HOURS - 1))
+    assert body['variables']['since'].endswith(':00:00Z')
+
+
+def test_concurrent_and_cached_reads_share_one_request(graphql):
+    graphql.groups['z1'] = {hour(1): (1, 0, 0, 0, 0, 0)}
+    graphql.delay = 0.2
+    analytics = bot.ZoneAnalytics('secret', url=graphql.url)
+
+    async def scenario():
+        first, second = await asyncio.gather(analytics.get_zone('z1'), analytics.get_zone('z1'))
+        third = await analytics.get_zone('z1')
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+    assert first is second is third
+    assert len(graphql.requests) == 1
+
+
+def test_refresh_only_requests_from_last_bucket(graphql):
+    graphql.groups['z1'] = {hour(3): (1, 0, 0, 0, 0, 0), hour(1): (2, 0, 0, 0, 0, 0)}
+    analytics = bot.ZoneAnalytics('secret', url=graphql.url, ttl=0)
+
+    async def scenario():
+        await analytics.get_zone('z1')
+        # سطل آخر (ناقص) به‌روز و سطل جدید اضافه شده است
+        graphql.groups['z1'][hour(1)] = (5, 0, 0, 0, 0, 0)
+        graphql.groups['z1'][hour(0)] = (3, 0, 0, 0, 0, 0)
+        return await analytics.get_zone('z1')
+
+    buckets = asyncio.run(scenario())
+    assert graphql.requests[1][1]['variables']['since'] == bot._to_api_time(hour(1))
+    assert {start: values[0] for start, values in buckets.items()} == {hour(3): 1, hour(1): 5, hour(0): 3}
+
+
+def test_graphql_errors_are_returned_per_zone(graphql):
+    graphql.errors = [{'message': 'zone not authorized'}]
+    analytics = bot.ZoneAnalytics('secret', url=graphql.url)
+
+    results = asyncio.run(analytics.get_zones(['z1']))
+
+    assert isinstance(results['z1'], RuntimeError)
+    assert 'zone not authorized' in str(results['z1'])
+    assert "⚠️" in bot.format_zone_analytics(results['z1'])
+
+
+def test_summarize_analytics_totals_and_series():
+    buckets = {hour(0): (10, 5, 100, 50, 1, 2), hour(1): (20, 0, 200, 0, 0, 3), hour(7): (4, 4, 0, 0, 0, 0)}
+
+    totals, series = bot.summarize_analytics(buckets, bucket_hours=6, window_hours=24)
+
+    assert totals == {
+        'requests': 34, 'cachedRequests': 9, 'bytes': 300, 'cachedBytes': 50, 'threats': 1, 'pageViews': 5
+    }
+    assert series == [0, 0, 4, 30]
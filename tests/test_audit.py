@@ -0,0 +1,63 @@
+import bot
+
+
+def record(record_type, name, content, **fields):
+    return dict({'type': record_type, 'name': name, 'content': content, 'ttl': 1, 'proxied': False}, **fields)
+
+
+ZONES = [('example.com', 'z1'), ('example.org', 'z2'), ('cold.net', 'z3')]
+ZONE_RECORDS = {
+    'z1': [
+        record('CNAME', 'www.example.com', 'app.example.com'),
+        record('CNAME', 'blog.example.com', 'x.example.org.'),
+        record('CNAME', 'ext.example.com', 'foo.cdn.net'),
+        record('CNAME', 'cold.example.com', 'a.cold.net'),
+        record('A', 'api.example.com', '192.0.2.1', ttl=300),
+        record('A', 'api.example.com', '192.0.2.1', ttl=300),
+        record('A', 'api.example.com', '192.0.2.2'),
+        record('CNAME', 'mail.example.com', 'mx.example.org'),
+        record('MX', 'mail.example.com', 'mx.example.org', priority=10),
+        record('TXT', 'txt.example.com', 'hello', proxied=True),
+        record('A', 'lb.example.com', '192.0.2.5', proxied=True),
+        record('A', 'lb.example.com', '192.0.2.6'),
+    ],
+    'z2': [
+        record('A', '*.example.org', '192.0.2.9'),
+        record('A', 'mx.example.org', '192.0.2.10'),
+    ],
+    # z3 در کش نیست و بررسی نمی‌شود
+}
+
+
+def test_audit_records_finds_each_category():
+    issues = bot.audit_records(ZONES, ZONE_RECORDS)
+
+    assert issues == {
+        'dangling': ['www.example.com → app.example.com'],
+        'duplicate': ['api.example.com A 192.0.2.1 (×2)'],
+        'conflict': ['lb.example.com A: وضعیت Proxy ناهمسان', 'mail.example.com: CNAME در کنار MX'],
+        'proxied': ['txt.example.com TXT'],
+        'ttl': ['api.example.com A: auto, 300'],
+    }
+
+
+def test_audit_records_clean_zone_has_no_issues():
+    issues = bot.audit_records([('example.com', 'z1')], {'z1': [
+        record('A', 'example.com', '192.0.2.1'),
+        record('A', 'example.com', '192.0.2.2'),
+        record('CNAME', 'www.example.com', 'example.com'),
+        record('MX', 'example.com', 'mail.example.com', priority=10),
+        record('MX', 'example.com', 'mail2.example.com', priority=20),
+    ]})
+
+    assert not any(issues.values())
+
+
+def test_audit_records_multiple_cnames_conflict():
+    issues = bot.audit_records([('example.com', 'z1')], {'z1': [
+        record('CNAME', 'www.example.com', 'a.example.net'),
+        record('CNAME', 'WWW.example.com.', 'b.example.net'),
+    ]})
+
+    assert issues['conflict'] == ['www.example.com: 2 رکورد CNAME']
+    assert issues['dangling'] == []
@@ -0,0 +1,206 @@
+import asyncio
+import shutil
+import socket
+import ssl
+import subprocess
+
+import pytest
+
+import bot
+
+
+async def start_http(statuses, requests):
+    """
+    سرور HTTP محلی روی 127.0.0.1 و 127.0.0.2 (یک پورت)؛ کد پاسخ هر آدرس از
+    statuses خوانده می‌شود (None یعنی بدون پاسخ) و درخواست‌ها در requests ثبت می‌شوند.
+    """
+    async def handle(reader, writer):
+        head = await reader.readuntil(b'\r\n\r\n')
+        address = writer.get_extra_info('sockname')[0]
+        requests.append((address, head.decode('ascii')))
+        status = statuses[address]
+        if status is None:
+            # پاسخی نمی‌دهد تا probe اتصال را ببندد
+            await reader.read()
+        else:
+            writer.write(f"HTTP/1.1 {status} Test\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode('ascii'))
+            await writer.drain()
+        writer.close()
+
+    primary = await asyncio.start_server(handle, '127.0.0.1', 0)
+    port = primary.sockets[0].getsockname()[1]
+    backup = await asyncio.start_server(handle, '127.0.0.2', port)
+    return (primary, backup), port
+
+
+def close_servers(servers):
+    for server in servers:
+        server.close()
+
+
+def unused_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class FakeManager:
+    def __init__(self):
+        self.updates = []
+
+    def update_dns_record(self, zone_id, record_id, data):
+        self.updates.append((zone_id, record_id, data))
+        return True, "ok"
+
+
+def test_probe_http_status_codes():
+    async def scenario():
+        statuses, requests = {'127.0.0.1': 200, '127.0.0.2': 404}, []
+        servers, port = await start_http(statuses, requests)
+        try:
+            ok = await bot.probe_http('127.0.0.1', port, '/health', hostname='www.example.com', timeout=2)
+            not_found = await bot.probe_http('127.0.0.2', port, timeout=2)
+            statuses['127.0.0.1'] = 503
+            unavailable = await bot.probe_http('127.0.0.1', port, timeout=2)
+        finally:
+            close_servers(servers)
+        return ok, not_found, unavailable, requests
+
+    ok, not_found, unavailable, requests = asyncio.run(scenario())
+    assert (ok, not_found, unavailable) == (True, True, False)
+    assert requests[0][1].startswith('GET /health HTTP/1.1\r\n')
+    assert 'Host: www.example.com\r\n' in requests[0][1]
+
+
+def test_probe_http_timeout_and_refused():
+    async def scenario():
+        servers, port = await start_http({'127.0.0.1': None, '127.0.0.2': None}, [])
+        try:
+            silent = await bot.probe_http('127.0.0.1', port, timeout=0.2)
+        finally:
+            close_servers(servers)
+        refused = await bot.probe_http('127.0.0.1', unused_port(), timeout=1)
+        return silent, refused
+
+    assert asyncio.run(scenario()) == (False, False)
+
+
+def test_probe_tcp():
+    async def scenario():
+        servers, port = await start_http({'127.0.0.1': 200, '127.0.0.2': 200}, [])
+        try:
+            open_port = await bot.probe_tcp('127.0.0.1', port, timeout=1)
+        finally:
+            close_servers(servers)
+        closed_port = await bot.probe_tcp('127.0.0.1', unused_port(), timeout=1)
+        return open_port, closed_port
+
+    assert asyncio.run(scenario()) == (True, False)
+
+
+def test_failover_switches_after_thresholds(tmp_path):
+    async def scenario():
+        statuses = {'127.0.0.1': 503, '127.0.0.2': 200}
+        servers, port = await start_http(statuses, [])
+        manager = FakeManager()
+        engine = bot.FailoverEngine(
+            manager, filename=str(tmp_path / 'failover.json'), interval=3600,
+            timeout=1, fall_threshold=2, rise_threshold=2
+        )
+        engine.start()
+        record = {'id': 'r1', 'name': 'www.example.com', 'content': '127.0.0.1'}
+        entry = engine.add('z1', 'example.com', record, '127.0.0.1', '127.0.0.2', check='http', port=port)
+        try:
+            await engine.check(entry)
+            after_first_failure = (entry['active'], list(manager.updates))
+            await engine.check(entry)
+            after_fall = (entry['active'], list(manager.updates))
+
+            statuses['127.0.0.1'] = 200
+            await engine.check(entry)
+            await engine.check(entry)
+            after_rise = (entry['active'], list(manager.updates))
+        finally:
+            engine.remove(entry['id'])
+            close_servers(servers)
+        return after_first_failure, after_fall, after_rise
+
+    after_first_failure, after_fall, after_rise = asyncio.run(scenario())
+    assert after_first_failure == ('primary', [])
+    assert after_fall == ('backup', [('z1', 'r1', {'content': '127.0.0.2'})])
+    assert after_rise[0] == 'primary'
+    assert after_rise[1][-1] == ('z1', 'r1', {'content': '127.0.0.1'})
+
+
+def test_failover_stays_on_primary_when_backup_is_down(tmp_path):
+    async def scenario():
+        servers, port = await start_http({'127.0.0.1': 503, '127.0.0.2': 502}, [])
+        manager = FakeManager()
+        engine = bot.FailoverEngine(
+            manager, filename=str(tmp_path / 'failover.json'), interval=3600, timeout=1, fall_threshold=1
+        )
+        engine.start()
+        record = {'id': 'r1', 'name': 'www.example.com', 'content': '127.0.0.1'}
+        entry = engine.add('z1', 'example.com', record, '127.0.0.1', '127.0.0.2', port=port)
+        try:
+            await engine.check(entry)
+            await engine.check(entry)
+        finally:
+            engine.remove(entry['id'])
+            close_servers(servers)
+        return entry['active'], manager.updates
+
+    assert asyncio.run(scenario()) == ('primary', [])
+
+
+def test_failover_rejects_duplicate_record(tmp_path):
+    filename = str(tmp_path / 'failover.json')
+    engine = bot.FailoverEngine(FakeManager(), filename=filename)
+    record = {'id': 'r1', 'name': 'www.example.com', 'content': '192.0.2.1'}
+
+    first = engine.add('z1', 'example.com', record, '192.0.2.1', '192.0.2.2')
+    assert first is not None
+    assert engine.add('z1', 'example.com', record, '192.0.2.3', '192.0.2.4') is None
+    assert engine.find('z1', 'r1') is first
+    assert list(bot.FailoverEngine(FakeManager(), filename=filename).entries) == [first['id']]
+
+
+@pytest.fixture
+def tls_context(tmp_path):
+    """گواهی self-signed برای سرور TLS محلی"""
+    if shutil.which('openssl') is None:
+        pytest.skip("openssl در دسترس نیست")
+    cert, key = tmp_path / 'cert.pem', tmp_path / 'key.pem'
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=localhost',
+         '-keyout', str(key), '-out', str(cert)],
+        check=True, capture_output=True
+    )
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(str(cert), str(key))
+    return context
+
+
+def test_probe_https_closes_connection_to_tls_origin(tls_context):
+    async def scenario():
+        closed = asyncio.Event()
+
+        async def handle(reader, writer):
+            await reader.readuntil(b'\r\n\r\n')
+            writer.write(b"HTTP/1.1 204 No Content\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+            # تا بستن اتصال از طرف probe صبر می‌کند
+            await reader.read()
+            closed.set()
+            writer.close()
+
+        server = await asyncio.start_server(handle, '127.0.0.1', 0, ssl=tls_context)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            healthy = await bot.probe_http('127.0.0.1', port, hostname='www.example.com', use_tls=True, timeout=2)
+            await asyncio.wait_for(closed.wait(), 1)
+        finally:
+            server.close()
+        return healthy
+
+    assert asyncio.run(scenario()) is True
@@ -0,0 +1,97 @@
+import ipaddress
+
+import pytest
+
+import bot
+
+net = ipaddress.ip_network
+
+
+def rule(rule_id, mode, target, value):
+    return {'id': rule_id, 'mode': mode, 'configuration': {'target': target, 'value': value}}
+
+
+def test_prefix_trie_covering():
+    trie = bot.PrefixTrie()
+    trie.insert(net('10.0.0.0/16'), 'wide')
+    trie.insert(net('10.0.5.0/24'), 'narrow')
+    trie.insert(net('2001:db8::/32'), 'v6')
+
+    assert trie.covering(net('10.0.5.7/32')) == 'wide'
+    assert trie.covering(net('10.0.0.0/16')) == 'wide'
+    assert trie.covering(net('10.0.0.0/8')) is None
+    assert trie.covering(net('10.1.0.0/24')) is None
+    assert trie.covering(net('2001:db8:1::/48')) == 'v6'
+    # ریشه‌های IPv4 و IPv6 جدا هستند
+    assert trie.covering(net('::/128')) is None
+
+
+def test_prefix_trie_default_route_covers_everything():
+    trie = bot.PrefixTrie()
+    trie.insert(net('0.0.0.0/0'))
+    assert trie.covering(net('198.51.100.1/32')) is True
+    assert trie.covering(net('2001:db8::1/128')) is None
+
+
+def test_ip_rule_networks_expands_to_supported_prefixes():
+    assert bot.ip_rule_networks('192.0.2.7') == [net('192.0.2.7/32')]
+    assert bot.ip_rule_networks('10.0.0.0/24') == [net('10.0.0.0/24')]
+    expanded = bot.ip_rule_networks('10.0.0.0/20')
+    assert len(expanded) == 16 and expanded[0] == net('10.0.0.0/24') and expanded[-1] == net('10.0.15.0/24')
+    assert bot.ip_rule_networks('2001:db8::1/40')[0] == net('2001:db8::/48')
+
+    with pytest.raises(ValueError):
+        bot.ip_rule_networks('10.0.0.0/7')
+    with pytest.raises(ValueError):
+        bot.ip_rule_networks('not-an-ip')
+
+
+def test_parse_ip_list_reports_bad_lines():
+    networks, errors = bot.parse_ip_list(
+        b'\xef\xbb\xbf192.0.2.1, 192.0.2.2 # office\nbad-value\n\n10.0.0.0/23;2001:db8::1\n'
+    )
+
+    assert networks == [
+        net('192.0.2.1/32'), net('192.0.2.2/32'),
+        net('10.0.0.0/24'), net('10.0.1.0/24'), net('2001:db8::1/128')
+    ]
+    assert len(errors) == 1 and errors[0].startswith('خط 2: bad-value')
+
+
+EXISTING = [
+    rule('r1', 'block', 'ip_range', '10.0.0.0/16'),
+    rule('r2', 'whitelist', 'ip', '192.0.2.1'),
+    rule('r3', 'block', 'ip', '198.51.100.7'),
+    rule('r4', 'block', 'country', 'XX'),
+]
+NETWORKS = [
+    net('10.0.5.0/24'),       # قانون block موجود آن را پوشش می‌دهد
+    net('192.0.2.1/32'),      # موجود با mode دیگر
+    net('203.0.113.9/32'),    # زیر CIDR خود لیست
+    net('203.0.113.0/24'),
+    net('203.0.113.0/24'),    # تکراری
+]
+
+
+def test_plan_ip_rules_add_mode():
+    creates, updates, deletes, redundant = bot.plan_ip_rules(EXISTING, NETWORKS, 'block')
+
+    assert creates == [net('203.0.113.0/24')]
+    assert updates == [EXISTING[1]]
+    assert deletes == []
+    assert redundant == 2
+
+
+def test_plan_ip_rules_replace_mode_deletes_only_same_mode_ip_rules():
+    creates, updates, deletes, redundant = bot.plan_ip_rules(EXISTING, NETWORKS, 'block', replace=True)
+
+    assert creates == [net('10.0.5.0/24'), net('203.0.113.0/24')]
+    assert updates == [EXISTING[1]]
+    assert deletes == [EXISTING[0], EXISTING[2]]
+    assert redundant == 2
+
+
+def test_plan_ip_rules_keeps_existing_identical_rule():
+    existing = [rule('r1', 'block', 'ip', '198.51.100.7')]
+    assert bot.plan_ip_rules(existing, [net('198.51.100.7/32')], 'block') == ([], [], [], 0)
+    assert bot.plan_ip_rules(existing, [net('198.51.100.7/32')], 'block', replace=True) == ([], [], [], 0)
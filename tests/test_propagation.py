@@ -0,0 +1,272 @@
+import asyncio
+import socket
+import struct
+
+import pytest
+
+import bot
+
+
+def dns_response(query, answers, truncated=False):
+    """پاسخ DNS برای query با رکوردهای A/AAAA (نام پاسخ‌ها با اشاره‌گر به سوال)"""
+    query_id, _, _, _, _, _ = struct.unpack('!HHHHHH', query[:12])
+    question = query[12:]
+    flags = 0x8180 | (0x0200 if truncated else 0)
+    body = b''
+    for answer in answers:
+        family = socket.AF_INET6 if ':' in answer else socket.AF_INET
+        rdata = socket.inet_pton(family, answer)
+        rtype = 28 if family == socket.AF_INET6 else 1
+        body += struct.pack('!HHHIH', 0xC00C, rtype, 1, 300, len(rdata)) + rdata
+    return struct.pack('!HHHHHH', query_id, flags, 1, len(answers), 0, 0) + question + body
+
+
+class StubResolver(asyncio.DatagramProtocol):
+    """
+    resolver محلی UDP؛ answers تابعی از شماره پرس‌وجو به لیست آدرس‌هاست
+    (None یعنی بدون پاسخ).
+    """
+    def __init__(self, answers, truncated=False):
+        self.answers = answers
+        self.truncated = truncated
+        self.queries = []
+        self.sources = set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.queries.append(data)
+        self.sources.add(addr)
+        answers = self.answers(len(self.queries))
+        if answers is not None:
+            self.transport.sendto(dns_response(data, [] if self.truncated else answers, self.truncated), addr)
+
+
+async def start_stub(answers, host='127.0.0.1', truncated=False):
+    loop = asyncio.get_running_loop()
+    transport, stub = await loop.create_datagram_endpoint(
+        lambda: StubResolver(answers, truncated), local_addr=(host, 0)
+    )
+    return transport, stub, transport.get_extra_info('sockname')[1]
+
+
+def test_query_returns_answers_and_keeps_socket_until_close():
+    async def scenario():
+        transport, stub, port = await start_stub(lambda n: ['192.0.2.1', '192.0.2.2'])
+        client = bot.DNSClient(timeout=2)
+        try:
+            answers = await client.query('127.0.0.1', port, 'www.example.com', 'A')
+            await client.query('127.0.0.1', port, 'www.example.com', 'A')
+            open_after_query = dict(client._transports)
+            client.close()
+        finally:
+            transport.close()
+        return answers, stub, open_after_query, client._transports
+
+    answers, stub, open_after_query, transports = asyncio.run(scenario())
+    assert answers == ['192.0.2.1', '192.0.2.2']
+    assert len(stub.queries) == 2
+    assert len(stub.sources) == 1
+    assert list(open_after_query) == [socket.AF_INET]
+    assert transports == {}
+
+
+def test_concurrent_queries_share_one_socket():
+    async def scenario():
+        transport, stub, port = await start_stub(lambda n: ['192.0.2.%d' % n])
+        client = bot.DNSClient(timeout=2)
+        try:
+            results = await asyncio.gather(*(
+                client.query('127.0.0.1', port, f'host{i}.example.com', 'A') for i in range(5)
+            ))
+        finally:
+            client.close()
+            transport.close()
+        return results, stub.sources, client._transports
+
+    results, sources, transports = asyncio.run(scenario())
+    assert sorted(answer for answers in results for answer in answers) == sorted(
+        '192.0.2.%d' % n for n in range(1, 6)
+    )
+    assert len(sources) == 1
+    assert transports == {}
+
+
+def test_query_matches_ipv6_resolver_written_uncompressed():
+    async def scenario():
+        try:
+            transport, _, port = await start_stub(lambda n: ['2001:db8::1'], host='::1')
+        except OSError:
+            pytest.skip("IPv6 loopback در دسترس نیست")
+        client = bot.DNSClient(timeout=2)
+        try:
+            return await client.query('0:0:0:0:0:0:0:1', port, 'www.example.com', 'AAAA')
+        finally:
+            client.close()
+            transport.close()
+
+    assert asyncio.run(scenario()) == ['2001:db8::1']
+
+
+def test_query_timeout_clears_pending():
+    async def scenario():
+        transport, stub, port = await start_stub(lambda n: None)
+        client = bot.DNSClient(timeout=0.2)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await client.query('127.0.0.1', port, 'www.example.com', 'A')
+        finally:
+            client.close()
+            transport.close()
+        return stub.queries, client._pending
+
+    queries, pending = asyncio.run(scenario())
+    assert len(queries) == 1
+    assert pending == {}
+
+
+def test_truncated_response_retries_over_tcp():
+    async def scenario():
+        transport, _, port = await start_stub(lambda n: [], truncated=True)
+
+        async def handle(reader, writer):
+            length = struct.unpack('!H', await reader.readexactly(2))[0]
+            query = await reader.readexactly(length)
+            response = dns_response(query, ['192.0.2.10'])
+            writer.write(struct.pack('!H', len(response)) + response)
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(handle, '127.0.0.1', port)
+        client = bot.DNSClient(timeout=2)
+        try:
+            return await client.query('127.0.0.1', port, 'www.example.com', 'A')
+        finally:
+            client.close()
+            server.close()
+            transport.close()
+
+    assert asyncio.run(scenario()) == ['192.0.2.10']
+
+
+def test_verifier_reports_time_to_new_value():
+    async def scenario():
+        # دو پاسخ اول مقدار قدیمی را برمی‌گردانند
+        transport, stub, port = await start_stub(lambda n: ['192.0.2.1'] if n <= 2 else ['192.0.2.99'])
+        updates = []
+
+        async def on_update(status):
+            updates.append({label: tuple(value) for label, value in status.items()})
+
+        client = bot.DNSClient(timeout=1)
+        verifier = bot.PropagationVerifier(
+            resolvers=[('stub', '127.0.0.1', port)], timeout=5, interval=0.05, client=client
+        )
+        try:
+            status = await verifier.verify('www.example.com', 'A', '192.0.2.99', on_update)
+        finally:
+            transport.close()
+        return status, stub, updates, client._transports
+
+    status, stub, updates, transports = asyncio.run(scenario())
+    elapsed, seen, done = status['stub']
+    assert elapsed is not None and done
+    assert seen == '192.0.2.99'
+    assert len(stub.queries) == 3
+    # همه دورهای پرس‌وجو از یک سوکت؛ بعد از پایان بررسی بسته شده است
+    assert len(stub.sources) == 1
+    assert transports == {}
+    assert updates[0]['stub'][1] == '192.0.2.1'
+
+
+def test_concurrent_verifier_runs_keep_sockets_until_last_finishes():
+    async def scenario():
+        transport, stub, port = await start_stub(lambda n: ['192.0.2.1'])
+        client = bot.DNSClient(timeout=1)
+        verifier = bot.PropagationVerifier(
+            resolvers=[('stub', '127.0.0.1', port)], timeout=0.3, interval=0.05, client=client
+        )
+
+        async def later_run():
+            await asyncio.sleep(0.15)
+            return await verifier.verify('api.example.com', 'A', '192.0.2.99')
+
+        try:
+            first = asyncio.ensure_future(verifier.verify('www.example.com', 'A', '192.0.2.99'))
+            second = asyncio.ensure_future(later_run())
+            await first
+            open_between = dict(client._transports)
+            await second
+        finally:
+            transport.close()
+        return open_between, stub.sources, client._transports
+
+    open_between, sources, transports = asyncio.run(scenario())
+    assert list(open_between) == [socket.AF_INET]
+    assert len(sources) == 1
+    assert transports == {}
+
+
+def test_verifier_gives_up_after_timeout():
+    async def scenario():
+        transport, _, port = await start_stub(lambda n: ['192.0.2.1'])
+        verifier = bot.PropagationVerifier(
+            resolvers=[('stub', '127.0.0.1', port)], timeout=0.3, interval=0.05, client=bot.DNSClient(timeout=1)
+        )
+        try:
+            return await verifier.verify('www.example.com', 'A', '192.0.2.99')
+        finally:
+            transport.close()
+
+    assert asyncio.run(scenario())['stub'] == [None, '192.0.2.1', True]
+
+
+def test_build_dns_query():
+    query = bot.build_dns_query(0x1234, 'www.example.com.', 'MX')
+
+    assert query[:12] == struct.pack('!HHHHHH', 0x1234, 0x0100, 1, 0, 0, 0)
+    assert query[12:] == b'\x03www\x07example\x03com\x00' + struct.pack('!HH', 15, 1)
+
+
+def wire_answers():
+    """پاسخ با همه نوع‌ها؛ نام‌های RDATA با اشاره‌گر به example.com در سوال (offset 16) فشرده شده‌اند"""
+    question = b'\x03www\x07example\x03com\x00' + struct.pack('!HH', 255, 1)
+    answers = [
+        (5, b'\x03cdn\xc0\x10'),
+        (15, b'\x00\x0a\x04mail\xc0\x10'),
+        (16, b'\x05hello\x06 world'),
+        (33, struct.pack('!HHH', 1, 2, 5060) + b'\x03sip\xc0\x10'),
+        (257, b'\x00\x05issue' + b'letsencrypt.org'),
+        (1, bytes([192, 0, 2, 1])),
+        (28, socket.inet_pton(socket.AF_INET6, '2001:db8::1')),
+    ]
+    body = b''.join(
+        struct.pack('!HHHIH', 0xC00C, rtype, 1, 300, len(rdata)) + rdata for rtype, rdata in answers
+    )
+    return struct.pack('!HHHHHH', 0xBEEF, 0x8180, 1, len(answers), 0, 0) + question + body
+
+
+@pytest.mark.parametrize('record_type, expected', [
+    ('CNAME', ['cdn.example.com']),
+    ('MX', ['10 mail.example.com']),
+    ('TXT', ['hello world']),
+    ('SRV', ['1 2 5060 sip.example.com']),
+    ('CAA', ['0 issue "letsencrypt.org"']),
+    ('A', ['192.0.2.1']),
+    ('AAAA', ['2001:db8::1']),
+    ('NS', []),
+])
+def test_parse_dns_response_formats_each_type(record_type, expected):
+    assert bot.parse_dns_response(wire_answers(), record_type) == (0xBEEF, False, 0, expected)
+
+
+def test_parse_dns_response_flags():
+    response = struct.pack('!HHHHHH', 7, 0x8383, 0, 0, 0, 0)
+    assert bot.parse_dns_response(response, 'A') == (7, True, 3, [])
+
+
+def test_normalize_dns_value():
+    assert bot.normalize_dns_value('TXT', '"v=spf1 " "-all"') == 'v=spf1 -all'
+    assert bot.normalize_dns_value('AAAA', '2001:0db8::0001') == '2001:db8::1'
+    assert bot.normalize_dns_value('CNAME', 'Target.Example.com.') == 'target.example.com'
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+import bot
+
+
+def pending(everything=False, files=(), prefixes=(), tags=(), hosts=()):
+    """دسته ادغام شده با همان ساختار PurgeQueue.purge"""
+    return {
+        'everything': everything,
+        'files': {bot.purge_key(url): url for url in files},
+        'prefixes': {bot.purge_key(prefix): bot.purge_key(prefix) for prefix in prefixes},
+        'tags': set(tags),
+        'hosts': set(hosts),
+        'waiters': []
+    }
+
+
+def test_purge_key_normalizes_scheme_and_host_only():
+    assert bot.purge_key(' HTTPS://Example.COM/Static/App.js ') == 'example.com/Static/App.js'
+    assert bot.purge_key('http://example.com/dir/') == 'example.com/dir'
+    assert bot.purge_key('example.com') == 'example.com'
+
+
+def test_everything_replaces_all_other_requests():
+    assert bot.plan_purge(pending(everything=True, files=['https://example.com/a'], tags=['t'])) == [
+        {'purge_everything': True}
+    ]
+
+
+def test_urls_and_prefixes_under_hosts_or_prefixes_are_dropped():
+    payloads = bot.plan_purge(pending(
+        files=[
+            'https://cdn.example.com/logo.png',        # زیر host
+            'https://example.com/static/app.js',       # زیر پیشوند
+            'https://example.com/static',              # برابر پیشوند
+            'https://example.com/Static/app.js',       # مسیر حساس به حروف است
+            'https://example.com/index.html',
+        ],
+        prefixes=['example.com/static', 'example.com/static/img', 'www.example.com/blog'],
+        tags=['b', 'a'],
+        hosts=['CDN.example.com'],
+    ))
+
+    assert payloads == [
+        {'files': ['https://example.com/Static/app.js', 'https://example.com/index.html']},
+        {'prefixes': ['example.com/static', 'www.example.com/blog']},
+        {'tags': ['a', 'b']},
+        {'hosts': ['cdn.example.com']},
+    ]
+
+
+def test_large_requests_are_batched_per_kind():
+    urls = [f'https://example.com/file{i:03}' for i in range(bot.PURGE_BATCH_SIZE * 2 + 5)]
+
+    payloads = bot.plan_purge(pending(files=reversed(urls)))
+
+    assert [len(payload['files']) for payload in payloads] == [bot.PURGE_BATCH_SIZE, bot.PURGE_BATCH_SIZE, 5]
+    assert [url for payload in payloads for url in payload['files']] == urls
+
+
+def test_empty_batch_makes_no_requests():
+    assert bot.plan_purge(pending()) == []
+
+
+class SlowManager:
+    def __init__(self):
+        self.payloads = []
+
+    def purge_cache(self, zone_id, payload):
+        time.sleep(0.1)
+        self.payloads.append(payload)
+        return True, "ok"
+
+
+def test_finished_flush_keeps_next_flush_registered():
+    manager = SlowManager()
+    queue = bot.PurgeQueue(manager, window=0.01, rate=100)
+
+    async def scenario():
+        first = queue.purge('z1', 'everything')
+        # دسته اول در حال ارسال است که درخواست بعدی می‌رسد
+        await asyncio.sleep(0.05)
+        second = queue.purge('z1', 'tags', ['a'])
+        next_flush = queue._flush_tasks['z1']
+        await first
+        registered = queue._flush_tasks.get('z1')
+        return registered is next_flush, await second, queue._flush_tasks
+
+    registered, result, tasks = asyncio.run(scenario())
+    assert registered
+    assert result == (1, 1, [])
+    assert manager.payloads == [{'purge_everything': True}, {'tags': ['a']}]
+    assert tasks == {}
@@ -0,0 +1,38 @@
+from datetime import datetime
+
+import pytest
+
+import bot
+
+NOW = datetime(2025, 1, 1, 12, 0)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('03:00', [datetime(2025, 1, 2, 3, 0)]),
+    ('13:30', [datetime(2025, 1, 1, 13, 30)]),
+    ('12:00', [datetime(2025, 1, 2, 12, 0)]),
+    ('+30m', [datetime(2025, 1, 1, 12, 30)]),
+    ('+30m +2h', [datetime(2025, 1, 1, 12, 30), datetime(2025, 1, 1, 14, 0)]),
+    ('22:00 01:00', [datetime(2025, 1, 1, 22, 0), datetime(2025, 1, 2, 1, 0)]),
+    ('2025-01-05  03:00', [datetime(2025, 1, 5, 3, 0)]),
+    ('2025-01-05 03:00 2025-01-05 04:15', [datetime(2025, 1, 5, 3, 0), datetime(2025, 1, 5, 4, 15)]),
+])
+def test_parse_schedule_times(text, expected):
+    assert bot.parse_schedule_times(text, NOW) == expected
+
+
+@pytest.mark.parametrize('text', [
+    '',
+    'tomorrow',
+    '24:00',
+    '12:60',
+    '2024-12-31 03:00',               # گذشته
+    '2025-01-05 03:00 2025-01-05 02:00',  # بازگشت قبل از اجرا
+    '+1h +2h +3h',
+    '2025-02-30 03:00',               # تاریخ ناموجود
+    '2025-13-01 03:00',
+    '+99999999999h',                  # خارج از محدوده datetime
+    '+0m',
+])
+def test_parse_schedule_times_rejects_invalid_input(text):
+    assert bot.parse_schedule_times(text, NOW) is None
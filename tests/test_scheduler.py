@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+
+import bot
+
+RECORD = {'id': 'r1', 'name': 'www.example.com'}
+
+
+def scheduler(tmp_path):
+    return bot.JobScheduler(None, filename=str(tmp_path / 'jobs.json'))
+
+
+def add(jobs, run_at, fields, description='change', **options):
+    return jobs.add_job(run_at, 'z1', 'example.com', RECORD, fields, 1, 'admin', description, **options)
+
+
+def test_jobs_for_one_record_within_window_are_coalesced(tmp_path):
+    jobs = scheduler(tmp_path)
+    run_at = datetime.now() + timedelta(minutes=30)
+
+    first = add(jobs, run_at, {'content': '192.0.2.1', 'ttl': 300})
+    second = add(jobs, run_at + timedelta(seconds=5), {'content': '192.0.2.2'})
+
+    assert second is first
+    assert list(jobs.jobs) == [first['id']]
+    assert first['fields'] == {'content': '192.0.2.2', 'ttl': 300}
+    assert first['run_at'] == run_at.timestamp()
+    # ادغام در فایل هم ذخیره شده است
+    assert scheduler(tmp_path).jobs[first['id']]['fields'] == first['fields']
+
+
+def test_jobs_outside_window_or_for_other_records_stay_separate(tmp_path):
+    jobs = scheduler(tmp_path)
+    run_at = datetime.now() + timedelta(minutes=30)
+
+    first = add(jobs, run_at, {'content': '192.0.2.1'})
+    later = add(jobs, run_at + timedelta(seconds=bot.SCHEDULER_COALESCE_WINDOW + 1), {'content': '192.0.2.2'})
+    other = jobs.add_job(run_at, 'z1', 'example.com', {'id': 'r2', 'name': 'api.example.com'},
+                         {'content': '192.0.2.3'}, 1, 'admin', 'other')
+    revert = add(jobs, run_at + timedelta(seconds=10), {'content': '192.0.2.0'}, 'revert', coalesce_window=0)
+
+    assert len({first['id'], later['id'], other['id'], revert['id']}) == 4
+    assert first['fields'] == {'content': '192.0.2.1'}
+
+
+def test_due_jobs_are_not_merged_into(tmp_path):
+    jobs = scheduler(tmp_path)
+    due = add(jobs, datetime.now() - timedelta(seconds=1), {'content': '192.0.2.1'})
+
+    new = add(jobs, datetime.now() + timedelta(seconds=5), {'content': '192.0.2.2'})
+
+    assert new is not due
+    assert due['fields'] == {'content': '192.0.2.1'}
@@ -0,0 +1,56 @@
+import ipaddress
+
+import pytest
+
+import bot
+
+
+def ip(value):
+    return int(ipaddress.ip_address(value))
+
+
+def test_parse_ip_query():
+    assert bot.parse_ip_query('192.0.2.7') == (4, ip('192.0.2.7'), ip('192.0.2.7'))
+    assert bot.parse_ip_query(' 192.0.2.9/30 ') == (4, ip('192.0.2.8'), ip('192.0.2.11'))
+    assert bot.parse_ip_query('192.0.2.9 - 192.0.2.1') == (4, ip('192.0.2.1'), ip('192.0.2.9'))
+    assert bot.parse_ip_query('2001:db8::/126') == (6, ip('2001:db8::'), ip('2001:db8::3'))
+
+    for text in ('192.0.2.1-2001:db8::1', 'example.com', '192.0.2.0/33'):
+        with pytest.raises(ValueError):
+            bot.parse_ip_query(text)
+
+
+def build_index():
+    records = [
+        {'id': 'r1', 'name': 'b.example.com', 'type': 'A', 'content': '192.0.2.10'},
+        {'id': 'r2', 'name': 'a.example.com', 'type': 'A', 'content': '192.0.2.2', 'proxied': True},
+        {'id': 'r3', 'name': 'c.example.com', 'type': 'A', 'content': '198.51.100.1'},
+        {'id': 'r4', 'name': 'v6.example.com', 'type': 'AAAA', 'content': '2001:db8::5'},
+        {'id': 'r5', 'name': 'alias.example.com', 'type': 'CNAME', 'content': '192.0.2.3'},
+        {'id': 'r6', 'name': 'txt.example.com', 'type': 'TXT', 'content': '192.0.2.4'},
+    ]
+    index = bot.RecordIndex(None)
+    index.build([(('example.com', 'z1'), records)])
+    return index
+
+
+def test_search_ip_returns_a_and_aaaa_records_in_address_order():
+    index = build_index()
+
+    assert [entry.record_id for entry in index.search_ip('192.0.2.0/24')] == ['r2', 'r1']
+    assert [entry.record_id for entry in index.search_ip('192.0.2.10')] == ['r1']
+    assert [entry.record_id for entry in index.search_ip('192.0.2.0 - 198.51.100.1')] == ['r2', 'r1', 'r3']
+    assert [entry.record_id for entry in index.search_ip('2001:db8::/64')] == ['r4']
+    assert index.search_ip('203.0.113.0/24') == []
+
+    entry = index.search_ip('192.0.2.2')[0]
+    assert (entry.zone_name, entry.zone_id, entry.name, entry.proxied) == ('example.com', 'z1', 'a.example.com', True)
+
+
+def test_text_search_matches_name_or_content():
+    index = build_index()
+
+    assert {entry.record_id for entry in index.search('EXAMPLE.com')} == {'r1', 'r2', 'r3', 'r4', 'r5', 'r6'}
+    assert [entry.record_id for entry in index.search('v6')] == ['r4']
+    # نتایج پیشوند قبلی برای عبارت طولانی‌تر استفاده می‌شود
+    assert [entry.record_id for entry in index.search('192.0.2.1')] == ['r1']
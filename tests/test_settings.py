@@ -0,0 +1,49 @@
+import asyncio
+import threading
+
+import bot
+
+
+class RecordingDict(dict):
+    """تنظیمات کش شده؛ thread هر تغییر ثبت می‌شود"""
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.writers = []
+
+    def __setitem__(self, key, value):
+        self.writers.append(threading.current_thread())
+        super().__setitem__(key, value)
+
+
+class FakeManager:
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.updates = []
+
+    def fetch_zone_settings(self, zone_id):
+        return RecordingDict({'ssl': 'flexible'})
+
+    def update_zone_settings(self, zone_id, values):
+        self.updates.append((zone_id, values))
+        if zone_id in self.failing:
+            return False, "forbidden"
+        return True, "ok"
+
+
+def test_apply_updates_cache_of_successful_zones_on_loop_thread():
+    manager = FakeManager(failing=['z2'])
+    store = bot.ZoneSettingsStore(manager)
+    zones = [('a.example', 'z1'), ('b.example', 'z2'), ('c.example', 'z3')]
+
+    async def scenario():
+        await store.get_zones(['z1', 'z2'])
+        result = await store.apply(zones, 'ssl', 'strict', batch_size=2, delay=0)
+        return result, await store.get_zones(['z1', 'z2'])
+
+    (applied, errors), settings = asyncio.run(scenario())
+    assert applied == 2
+    assert errors == ['b.example: forbidden']
+    assert sorted(zone_id for zone_id, _ in manager.updates) == ['z1', 'z2', 'z3']
+    assert settings['z1']['ssl'] == 'strict'
+    assert settings['z2']['ssl'] == 'flexible'
+    assert settings['z1'].writers == [threading.main_thread()]
@@ -0,0 +1,82 @@
+import asyncio
+
+import bot
+
+
+def record(record_id, content):
+    return bot.DNSRecord(record_id, 'z1', f'{record_id}.example.com', 'A', content)
+
+
+class FakeManager:
+    def __init__(self, records):
+        self.records = records
+        self.calls = 0
+
+    def fetch_dns_records(self, zone_id):
+        self.calls += 1
+        return self.records
+
+
+def test_pre_change_snapshot_reuses_fresh_store_records(tmp_path, monkeypatch):
+    manager = FakeManager([record('r1', '192.0.2.1'), record('r2', '192.0.2.2')])
+    store = bot.SnapshotStore(str(tmp_path))
+    monkeypatch.setattr(bot, 'zone_store', bot.ZoneStore(manager))
+    monkeypatch.setattr(bot, 'snapshot_store', store)
+
+    async def scenario():
+        await bot.zone_store.get_records('z1')
+        await bot.snapshot_before_change('z1', 'example.com')
+        # نوشتن در پس‌زمینه؛ فراخواننده منتظر آن نیست
+        return await bot.snapshot_before_change('z1', 'example.com')
+
+    asyncio.run(scenario())
+    snapshots = store.list_snapshots()
+    assert manager.calls == 1
+    assert [snapshot['reason'] for snapshot in snapshots] == ['pre-change', 'pre-change']
+    state_hash = snapshots[0]['zones']['z1'][1]
+    assert sorted(store.load_state(state_hash)) == ['r1', 'r2']
+
+
+def test_pre_change_snapshot_skips_zone_on_fetch_error(tmp_path, monkeypatch):
+    class FailingManager:
+        def fetch_dns_records(self, zone_id):
+            raise RuntimeError("API error")
+
+    store = bot.SnapshotStore(str(tmp_path))
+    monkeypatch.setattr(bot, 'zone_store', bot.ZoneStore(FailingManager()))
+    monkeypatch.setattr(bot, 'snapshot_store', store)
+
+    assert asyncio.run(bot.snapshot_before_change('z1', 'example.com')) is None
+    assert store.list_snapshots() == []
+
+
+def test_objects_carry_base_hash_in_fixed_header(tmp_path):
+    store = bot.SnapshotStore(str(tmp_path))
+    first = store.snapshot({'z1': ('example.com', [record('r1', '192.0.2.1')])}, 'test')
+    second = store.snapshot({'z1': ('example.com', [record('r1', '192.0.2.9'), record('r2', '192.0.2.2')])}, 'test')
+    first_hash, second_hash = first['zones']['z1'][1], second['zones']['z1'][1]
+
+    full, delta = store._read_raw(first_hash), store._read_raw(second_hash)
+    assert full.startswith(bot.SNAPSHOT_OBJECT_MAGIC) and delta.startswith(bot.SNAPSHOT_OBJECT_MAGIC)
+    assert bot.snapshot_blob_base(full) is None
+    assert bot.snapshot_blob_base(delta) == first_hash
+    assert bot.decode_snapshot_blob(delta)['del'] == []
+
+    creates, updates, deletes = store.diff(first['id'], second['id'])['example.com']
+    assert [r['id'] for r in creates] == ['r2']
+    assert [(old['content'], new['content']) for old, new in updates] == [('192.0.2.1', '192.0.2.9')]
+    assert deletes == []
+
+
+def test_header_does_not_depend_on_json_key_order():
+    blob = {'depth': 1, 'set': {}, 'del': ['r1'], 'base': 'ab' * 32}
+    raw = bot.encode_snapshot_blob(blob)
+    assert bot.snapshot_blob_base(raw) == 'ab' * 32
+    assert bot.decode_snapshot_blob(raw) == blob
+
+
+def test_objects_without_header_are_still_readable():
+    blob = {'base': 'cd' * 32, 'depth': 1, 'set': {}, 'del': []}
+    legacy = bot.zlib.compress(bot.json.dumps(blob).encode('utf-8'))
+    assert bot.snapshot_blob_base(legacy) == 'cd' * 32
+    assert bot.decode_snapshot_blob(legacy) == blob
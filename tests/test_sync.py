@@ -0,0 +1,64 @@
+import bot
+
+
+def record(record_id, record_type, name, content, **fields):
+    return dict({'id': record_id, 'type': record_type, 'name': name, 'content': content, 'ttl': 1, 'proxied': False}, **fields)
+
+
+def test_plan_record_changes_minimal_changes():
+    current = [
+        record('a1', 'A', 'www.example.com', '192.0.2.1'),
+        record('a2', 'A', 'www.example.com', '192.0.2.2'),
+        record('a3', 'A', 'api.example.com', '192.0.2.3'),
+        record('t1', 'TXT', 'example.com', 'v=spf1 -all'),
+    ]
+    desired = [
+        record(None, 'A', 'WWW.example.com', '192.0.2.1'),
+        record(None, 'A', 'www.example.com', '192.0.2.4'),
+        record(None, 'A', 'new.example.com', '192.0.2.5'),
+        record(None, 'TXT', 'example.com', 'v=spf1 -all'),
+    ]
+
+    creates, updates, deletes = bot.plan_record_changes(current, desired)
+
+    assert creates == [desired[2]]
+    assert updates == [(current[1], desired[1])]
+    assert deletes == [current[2]]
+
+
+def test_plan_record_changes_deletes_only_surplus_duplicates():
+    current = [record('a1', 'A', 'www.example.com', '192.0.2.1'), record('a2', 'A', 'www.example.com', '192.0.2.1')]
+    desired = [record(None, 'A', 'www.example.com', '192.0.2.1')]
+
+    creates, updates, deletes = bot.plan_record_changes(current, desired)
+
+    assert (creates, updates) == ([], [])
+    assert len(deletes) == 1 and deletes[0] in current
+
+
+def test_plan_record_changes_same_state_is_empty():
+    current = [record('a1', 'A', 'www.example.com', '192.0.2.1', ttl=300)]
+    assert bot.plan_record_changes(current, [dict(current[0], id=None)]) == ([], [], [])
+    assert bot.plan_record_changes(current, [dict(current[0], ttl=600)])[1] == [(current[0], dict(current[0], ttl=600))]
+
+
+def test_sync_fingerprint_ignores_formatting_and_api_only_fields():
+    api_cname = record('c1', 'CNAME', 'www.example.com', 'Target.Example.com.', proxied=True, ttl=1)
+    desired_cname = record(None, 'CNAME', 'www.example.com', 'target.example.com', proxied=True, ttl=300)
+    assert bot.sync_fingerprint(api_cname) == bot.sync_fingerprint(desired_cname)
+
+    api_srv = record('s1', 'SRV', '_sip._tcp.example.com', '60 5060 sip.example.com', data={
+        'priority': 10, 'weight': 60, 'port': 5060, 'target': 'SIP.example.com.', 'name': 'ignored'
+    })
+    desired_srv = record(None, 'SRV', '_sip._tcp.example.com', '10 60 5060 sip.example.com', data={
+        'priority': 10, 'weight': 60, 'port': 5060, 'target': 'sip.example.com'
+    })
+    assert bot.sync_fingerprint(api_srv) == bot.sync_fingerprint(desired_srv)
+
+    mx = record('m1', 'MX', 'example.com', 'mail.example.com', priority=10)
+    assert bot.sync_fingerprint(mx) != bot.sync_fingerprint(dict(mx, priority=20))
+
+    creates, updates, deletes = bot.plan_record_changes(
+        [api_cname, api_srv], [desired_cname, desired_srv], bot.sync_fingerprint
+    )
+    assert (creates, updates, deletes) == ([], [], [])
@@ -0,0 +1,71 @@
+import pytest
+
+import bot
+
+
+@pytest.mark.parametrize('record_type, text, fields', [
+    ('A', ' 192.0.2.1 ', {'content': '192.0.2.1'}),
+    ('AAAA', '2001:0db8:0000::0001', {'content': '2001:db8::1'}),
+    ('CNAME', 'Target.Example.com.', {'content': 'target.example.com'}),
+    ('NS', 'NS1.example.net', {'content': 'ns1.example.net'}),
+    ('MX', '10 Mail.Example.com', {'content': 'mail.example.com', 'priority': 10}),
+    ('TXT', '"v=spf1" "-all"', {'content': '"v=spf1" "-all"'}),
+    ('TXT', r'"say \"hi\""', {'content': r'"say \"hi\""'}),
+    ('TXT', r'a \" b', {'content': r'a \" b'}),
+    ('MX', '0 .', {'content': '.', 'priority': 0}),
+    ('CAA', '0 ISSUE "letsencrypt.org"', {
+        'content': '0 issue "letsencrypt.org"',
+        'data': {'flags': 0, 'tag': 'issue', 'value': 'letsencrypt.org'}
+    }),
+    ('CAA', '128 iodef "mailto:security@example.com"', {
+        'content': '128 iodef "mailto:security@example.com"',
+        'data': {'flags': 128, 'tag': 'iodef', 'value': 'mailto:security@example.com'}
+    }),
+    ('CAA', '0 issuewild ";"', {
+        'content': '0 issuewild ";"',
+        'data': {'flags': 0, 'tag': 'issuewild', 'value': ';'}
+    }),
+    ('SRV', '10 60 5060 SIP.example.com', {
+        'content': '10 60 5060 sip.example.com',
+        'data': {'priority': 10, 'weight': 60, 'port': 5060, 'target': 'sip.example.com'}
+    }),
+    ('SRV', '0 0 0 .', {
+        'content': '0 0 0 .',
+        'data': {'priority': 0, 'weight': 0, 'port': 0, 'target': '.'}
+    }),
+])
+def test_valid_content_is_normalized(record_type, text, fields):
+    assert bot.validate_record_content(record_type, text) == (True, fields)
+
+
+@pytest.mark.parametrize('record_type, text', [
+    ('A', '256.1.1.1'),
+    ('A', '2001:db8::1'),
+    ('AAAA', '192.0.2.1'),
+    ('CNAME', '-bad.example.com'),
+    ('CNAME', 'a..example.com'),
+    ('CNAME', 'x' * 64 + '.example.com'),
+    ('MX', 'mail.example.com'),
+    ('MX', '70000 mail.example.com'),
+    ('TXT', 'unbalanced " quote'),
+    ('TXT', r'"ends with escape\"'),
+    ('MX', '10 .'),
+    ('TXT', 'x' * 2049),
+    ('CAA', '0 bogus "x"'),
+    ('CAA', '256 issue "letsencrypt.org"'),
+    ('CAA', '0 iodef "ftp://example.com"'),
+    ('CAA', '0 issue "bad_issuer-.com"'),
+    ('SRV', '10 60 70000 sip.example.com'),
+    ('SRV', '10 60 sip.example.com'),
+    ('A', '   '),
+    ('PTR', 'host.example.com'),
+])
+def test_invalid_content_is_rejected(record_type, text):
+    valid, error = bot.validate_record_content(record_type, text)
+    assert valid is False
+    assert isinstance(error, str) and error
+
+
+def test_record_content_text_includes_mx_priority():
+    _, fields = bot.validate_record_content('MX', '5 mx.example.com')
+    assert bot.record_content_text(fields) == '5 mx.example.com'
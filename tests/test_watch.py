@@ -0,0 +1,31 @@
+import asyncio
+
+import bot
+
+
+def event(name, content):
+    return ('UPDATE', 'example.com', ('A', name, content, 1, False), ('A', name, '192.0.2.1', 1, False))
+
+
+def test_events_during_digest_send_get_their_own_digest(tmp_path):
+    watch = bot.WatchList(None, filename=str(tmp_path / 'watch.json'), debounce=0.05, max_delay=1)
+    watch.add(1, 'zone', 'example.com')
+    sent = []
+
+    async def notify(chat_id, text):
+        sent.append(text)
+        if len(sent) == 1:
+            # رویداد جدید در حین ارسال خلاصه اول
+            watch.dispatch([event('api.example.com', '192.0.2.3')])
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        watch._notify = notify
+        watch.dispatch([event('www.example.com', '192.0.2.2')])
+        await asyncio.sleep(0.3)
+
+    asyncio.run(scenario())
+    assert len(sent) == 2
+    assert 'www.example.com' in sent[0] and 'api.example.com' not in sent[0]
+    assert 'api.example.com' in sent[1]
+    assert watch._pending == {} and watch._flush_tasks == {}
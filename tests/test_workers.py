@@ -0,0 +1,38 @@
+import asyncio
+import os
+
+import bot
+
+INSTANCES = ('cf_manager', 'zone_store', 'snapshot_store', 'job_scheduler', 'failover_engine',
+             'watch_list', 'zone_settings', 'worker_pool')
+
+
+def instances_in_worker(progress):
+    """کار آزمایشی: instance هایی که در process کاری ساخته شده‌اند"""
+    return [name for name in INSTANCES if hasattr(bot, name)], os.listdir('.')
+
+
+def test_worker_process_does_not_build_instances(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    async def scenario():
+        pool = bot.WorkerPool(processes=1)
+        return await pool.submit(instances_in_worker).future
+
+    instances, files = asyncio.run(scenario())
+    assert instances == []
+    # نه فایل لاگ و نه فایل‌های وضعیت
+    assert files == []
+    assert all(hasattr(bot, name) for name in INSTANCES)
+
+
+def test_worker_runs_job_from_bot_module():
+    async def scenario():
+        pool = bot.WorkerPool(processes=1)
+        job = pool.submit(bot.job_plan_ip_rules, b'192.0.2.0/24\n192.0.2.1\nbogus', [], 'block', False)
+        return await job.future, job.state
+
+    (count, errors, creates, updates, deletes, covered), state = asyncio.run(scenario())
+    assert state == 'done'
+    assert count == 2 and len(errors) == 1
+    assert len(creates) == 1 and covered == 1
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+import bot
+
+
+class FakeManager:
+    """رکوردهای هر دامنه از records؛ دامنه‌های errors خطا می‌دهند"""
+    def __init__(self, records):
+        self.records = records
+        self.errors = set()
+        self.calls = []
+
+    def fetch_dns_records(self, zone_id):
+        self.calls.append(zone_id)
+        if zone_id in self.errors:
+            raise RuntimeError("API error")
+        return self.records[zone_id]
+
+
+def test_empty_zone_is_cached():
+    manager = FakeManager({'z1': []})
+    store = bot.ZoneStore(manager)
+
+    async def scenario():
+        return [await store.get_records('z1') for _ in range(3)]
+
+    assert asyncio.run(scenario()) == [[], [], []]
+    assert manager.calls == ['z1']
+
+
+def test_concurrent_reads_share_one_fetch():
+    records = [bot.DNSRecord('r1', 'z1', 'www.example.com', 'A', '192.0.2.1')]
+    manager = FakeManager({'z1': records})
+    store = bot.ZoneStore(manager)
+
+    async def scenario():
+        return await asyncio.gather(*(store.get_records('z1') for _ in range(5)))
+
+    assert all(result is records for result in asyncio.run(scenario()))
+    assert manager.calls == ['z1']
+
+
+def test_errors_are_not_cached():
+    records = [bot.DNSRecord('r1', 'z1', 'www.example.com', 'A', '192.0.2.1')]
+    manager = FakeManager({'z1': records})
+    manager.errors.add('z1')
+    store = bot.ZoneStore(manager)
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await store.fetch_records('z1')
+        shown = await store.get_records('z1')
+        manager.errors.clear()
+        return shown, await store.fetch_records('z1')
+
+    shown, fetched = asyncio.run(scenario())
+    assert shown == []
+    assert fetched is records
+    assert manager.calls == ['z1', 'z1', 'z1']
+
+
+def test_get_records_falls_back_to_last_copy_on_error():
+    records = [bot.DNSRecord('r1', 'z1', 'www.example.com', 'A', '192.0.2.1')]
+    manager = FakeManager({'z1': records})
+    store = bot.ZoneStore(manager)
+
+    async def scenario():
+        await store.get_records('z1')
+        manager.errors.add('z1')
+        return await store.get_records('z1', max_age=0)
+
+    assert asyncio.run(scenario()) is records